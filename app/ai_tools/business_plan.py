@@ -1,11 +1,22 @@
-from openai import AsyncOpenAI
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+import time
+from dataclasses import dataclass
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
 from pydantic import BaseModel
-from typing import Optional
-import os
+from typing import Dict, List, Optional, Tuple
+
+from app.core.cache import CachedStream, cache_bypass, cached_chat, get_cache
+from app.core.identity import get_user_id
+from app.core.jobs import register_job
+from app.core.llm import LLMGateway, get_llm
+from app.core.prompts import PromptTooLarge, RenderedPrompt, count_tokens, register_prompt
+from app.core.resilience import UpstreamError
+from app.core.routing import ModelRouter, get_model_router
+from app.core.streaming import sse_items_response, sse_response
+from app.core.structured import JSON_RESPONSE_FORMAT, StructuredStream, parse_structured, schema_instructions
+from app.database import save_generated_content
 
 router = APIRouter()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 class BusinessPlanRequest(BaseModel):
     business_name: str
@@ -15,19 +26,19 @@ class BusinessPlanRequest(BaseModel):
     revenue_model: str
     funding_needed: Optional[str] = None
 
-@router.post("/generate-business-plan")
-async def generate_business_plan(request: BusinessPlanRequest):
-    """Generate comprehensive business plan using GPT-4"""
-    try:
-        prompt = f"""
+BUSINESS_PLAN_PROMPT = register_prompt(
+    "business_plan",
+    model="gpt-4-turbo-preview",
+    system="You are an expert business consultant who creates professional, investor-ready business plans.",
+    user="""
         Create a comprehensive business plan for:
         
-        Business Name: {request.business_name}
-        Industry: {request.industry}
-        Description: {request.description}
-        Target Market: {request.target_market}
-        Revenue Model: {request.revenue_model}
-        Funding Needed: {request.funding_needed or 'Not specified'}
+        Business Name: {business_name}
+        Industry: {industry}
+        Description: {description}
+        Target Market: {target_market}
+        Revenue Model: {revenue_model}
+        Funding Needed: {funding_needed}
         
         Generate a detailed business plan with the following sections:
         
@@ -60,26 +71,422 @@ async def generate_business_plan(request: BusinessPlanRequest):
         
         Make it professional, data-driven, and investor-ready. Use real market insights.
         Format with clear headings and bullet points where appropriate.
-        """
-        
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are an expert business consultant who creates professional, investor-ready business plans."},
-                {"role": "user", "content": prompt}
-            ],
+        """,
+    max_tokens=4000,
+    max_input_tokens=6000
+)
+
+class PlanSubsection(BaseModel):
+    title: str
+    content: str
+    bullets: List[str] = []
+
+class PlanSection(BaseModel):
+    number: int
+    title: str
+    content: str
+    bullets: List[str] = []
+    subsections: List[PlanSubsection] = []
+
+class BusinessPlanContent(BaseModel):
+    sections: List[PlanSection]
+
+class SectionRegenerationRequest(BaseModel):
+    plan: BusinessPlanRequest
+    sections: List[PlanSection]  # the plan as the client currently has it
+    number: int
+    instructions: Optional[str] = None
+
+# Same brief as BUSINESS_PLAN_PROMPT, answered as one JSON object per section
+BUSINESS_PLAN_STRUCTURED_PROMPT = register_prompt(
+    "business_plan_structured",
+    model="gpt-4-turbo-preview",
+    system=BUSINESS_PLAN_PROMPT.system,
+    user=BUSINESS_PLAN_PROMPT.user + "\n" + schema_instructions(BusinessPlanContent, "a JSON object holding one \"sections\" entry per numbered section, in order"),
+    max_tokens=4000,
+    max_input_tokens=6500
+)
+
+BUSINESS_PLAN_SECTION_PROMPT = register_prompt(
+    "business_plan_section",
+    model="gpt-4-turbo-preview",
+    system=BUSINESS_PLAN_PROMPT.system,
+    user="""
+        Rewrite one section of the business plan for:
+        
+        Business Name: {business_name}
+        Industry: {industry}
+        Description: {description}
+        Target Market: {target_market}
+        Revenue Model: {revenue_model}
+        Funding Needed: {funding_needed}
+        
+        The plan currently has these sections:
+        {outline}
+        
+        Rewrite section {number} ({title}) so it is more specific, data-driven and investor-ready while staying consistent with the other sections.
+        {instructions}
+        """ + "\n" + schema_instructions(PlanSection),
+    max_tokens=1200,
+    max_input_tokens=6000
+)
+
+def _prompt_fields(request: BusinessPlanRequest) -> dict:
+    return {
+        **request.model_dump(),
+        "funding_needed": request.funding_needed or "Not specified"
+    }
+
+def build_business_plan_prompt(request: BusinessPlanRequest, structured: bool = False) -> RenderedPrompt:
+    template = BUSINESS_PLAN_STRUCTURED_PROMPT if structured else BUSINESS_PLAN_PROMPT
+    return template.render(**_prompt_fields(request))
+
+
+@dataclass(frozen=True)
+class PlanSectionSpec:
+    """One independently generated section of a business plan.
+
+    `fields` are the request fields its prompt reads and `depends_on` the
+    sections whose text it is given, so its cache entry only changes when
+    one of those does.
+    """
+    number: int
+    title: str
+    brief: str
+    fields: Tuple[str, ...]
+    depends_on: Tuple[int, ...] = ()
+    max_tokens: int = 500
+
+_BASICS = ("business_name", "industry", "description")
+
+# Dependencies must come earlier in the list
+PLAN_SECTIONS: List[PlanSectionSpec] = [
+    PlanSectionSpec(1, "Executive Summary", "2-3 paragraphs on what the business does, for whom, how it makes money and why it will win",
+                    _BASICS + ("target_market", "revenue_model")),
+    PlanSectionSpec(2, "Company Description", "A detailed overview: mission, offering, stage and legal structure",
+                    _BASICS, max_tokens=450),
+    PlanSectionSpec(3, "Market Analysis", "Target market size, customer demographics, market trends, competitive landscape",
+                    _BASICS + ("target_market",), max_tokens=700),
+    PlanSectionSpec(4, "Organization & Management", "Organizational structure, key team members needed",
+                    _BASICS, max_tokens=400),
+    PlanSectionSpec(5, "Products/Services", "Detailed description, unique value proposition, competitive advantages",
+                    _BASICS + ("target_market",), depends_on=(3,), max_tokens=550),
+    PlanSectionSpec(6, "Marketing & Sales Strategy", "Marketing channels, customer acquisition strategy, sales funnel",
+                    ("business_name", "description", "target_market", "revenue_model"), depends_on=(3, 5), max_tokens=550),
+    PlanSectionSpec(7, "Financial Projections (5 years)", "Revenue projections, cost structure, break-even analysis, funding requirements and use of funds",
+                    ("business_name", "industry", "revenue_model", "funding_needed"), depends_on=(3, 6), max_tokens=700),
+    PlanSectionSpec(8, "Risk Analysis", "Key risks, mitigation strategies",
+                    _BASICS, depends_on=(3,), max_tokens=450),
+]
+
+_FIELD_LABELS = {
+    "business_name": "Business Name",
+    "industry": "Industry",
+    "description": "Description",
+    "target_market": "Target Market",
+    "revenue_model": "Revenue Model",
+    "funding_needed": "Funding Needed",
+}
+
+def _register_section_prompt(spec: PlanSectionSpec):
+    facts = "\n".join(f"        {_FIELD_LABELS[field]}: {{{field}}}" for field in spec.fields)
+    return register_prompt(
+        f"business_plan_part_{spec.number}",
+        model="gpt-4-turbo-preview",
+        system=BUSINESS_PLAN_PROMPT.system,
+        user=f"""
+        Write the "{spec.title}" section of a business plan for:
+        
+{facts}
+        
+        {{context}}
+        
+        Cover: {spec.brief}.
+        
+        Write only this section, in markdown, starting with the heading "## {spec.number}. {spec.title}".
+        Make it professional, data-driven and investor-ready. Use real market insights.
+        """,
+        max_tokens=spec.max_tokens,
+        max_input_tokens=6000
+    )
+
+PLAN_SECTION_PROMPTS = {spec.number: _register_section_prompt(spec) for spec in PLAN_SECTIONS}
+
+
+async def generate_plan_sections(request: BusinessPlanRequest, llm: LLMGateway, model_router: ModelRouter,
+                                 cache, bypass_cache: bool = False, user_id: Optional[int] = None) -> dict:
+    """Generate every PLAN_SECTIONS entry as its own cached call.
+
+    Sections start as soon as the sections they depend on are done, so
+    independent ones run concurrently. Each goes through the response
+    cache, whose key covers exactly the fields and dependency text in its
+    prompt: editing one request field only re-runs the sections that read
+    it and the ones downstream of them.
+    """
+    fields = _prompt_fields(request)
+    started = time.perf_counter()
+    results: Dict[int, dict] = {}
+    tasks: Dict[int, asyncio.Task] = {}
+
+    async def run(spec: PlanSectionSpec):
+        if spec.depends_on:
+            await asyncio.gather(*(tasks[number] for number in spec.depends_on))
+        context = "\n\n".join(results[number]["content"] for number in spec.depends_on)
+        prompt = PLAN_SECTION_PROMPTS[spec.number].render(
+            **fields,
+            context=f"Sections already written, which this one must stay consistent with:\n\n{context}" if context else ""
+        )
+        route = await model_router.route_prompt("business_plan", user_id, prompt)
+        section_started = time.perf_counter()
+        content, cache_hit = await cached_chat(
+            llm, cache, "business_plan",
+            model=route.model,
+            messages=prompt.messages,
             temperature=0.7,
-            max_tokens=4000
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout,
+            bypass=bypass_cache,
+            user_id=user_id
         )
+        results[spec.number] = {
+            "number": spec.number,
+            "title": spec.title,
+            "content": content,
+            "depends_on": list(spec.depends_on),
+            "cache": "hit" if cache_hit else "miss",
+            "started_ms": round((section_started - started) * 1000, 1),
+            "latency_ms": round((time.perf_counter() - section_started) * 1000, 1),
+            "prompt_tokens": prompt.prompt_tokens,
+            "completion_tokens": count_tokens(content, route.model),
+        }
+
+    for spec in PLAN_SECTIONS:
+        tasks[spec.number] = asyncio.ensure_future(run(spec))
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        # One failed section fails the plan; sections already done stay cached for the retry
+        for task in tasks.values():
+            task.cancel()
+
+    sections = [results[spec.number] for spec in PLAN_SECTIONS]
+    spent = sum(s["prompt_tokens"] + s["completion_tokens"] for s in sections if s["cache"] == "miss")
+    # What the single-call plan would have cost for the same output
+    full = BUSINESS_PLAN_PROMPT.render(**fields).prompt_tokens + sum(s["completion_tokens"] for s in sections)
+    return {
+        "business_plan": "\n\n".join(s["content"] for s in sections),
+        "sections": sections,
+        "regenerated": [s["number"] for s in sections if s["cache"] == "miss"],
+        "tokens": {"spent": spent, "full_regeneration": full, "saved": full - spent},
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+@register_job("business_plan", BusinessPlanRequest)
+async def run_business_plan(request: BusinessPlanRequest, llm: LLMGateway, model_router: ModelRouter, user_id: Optional[int] = None) -> dict:
+    """Generate a business plan outside a request, for the background job queue"""
+    prompt = build_business_plan_prompt(request)
+    route = await model_router.route_prompt("business_plan", user_id, prompt)
+    response = await llm.chat(
+        tool="business_plan",
+        user_id=user_id,
+        model=route.model,
+        messages=prompt.messages,
+        temperature=0.7,
+        max_tokens=route.max_tokens,
+        fallbacks=route.fallbacks,
+        timeout=route.timeout
+    )
+    business_plan = response.choices[0].message.content
+    await save_generated_content("business_plan", request.business_name, business_plan, user_id)
+    return {
+        "success": True,
+        "business_plan": business_plan,
+        "word_count": len(business_plan.split()),
+        "tool": "business_plan_generator"
+    }
+
+@router.post("/generate-business-plan")
+async def generate_business_plan(
+    request: BusinessPlanRequest,
+    background_tasks: BackgroundTasks,
+    stream: bool = False,
+    structured: bool = False,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    cache=Depends(get_cache),
+    bypass_cache: bool = Depends(cache_bypass),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Generate comprehensive business plan using GPT-4
+
+    With `structured=true` the plan comes back as a list of typed sections
+    (validated against the PlanSection schema) instead of one markdown text.
+    With `stream=true` the plan is sent as Server-Sent Events while it is
+    being generated: markdown as "token" events, structured plans as one
+    "section" event per completed section. The final "done" event carries
+    the response metadata. Identical requests are served from the response
+    cache unless the `X-Cache-Bypass` header is set. The plan is persisted
+    after the response has been sent.
+    """
+    try:
+        prompt = build_business_plan_prompt(request, structured)
+        route = await model_router.route_prompt("business_plan", user_id, prompt)
+        response_format = JSON_RESPONSE_FORMAT if structured else None
+        # Structured answers are only cached once they parse, so one bad answer is not replayed
+        validate = (lambda text: parse_structured(text, BusinessPlanContent)) if structured else None
+        
+        if stream:
+            chunks = CachedStream(llm, cache, "business_plan", route.model, prompt.messages, 0.7, route.max_tokens, bypass_cache, user_id, route.timeout, response_format, validate)
+            if structured:
+                def finalize_structured(text: str) -> dict:
+                    plan = parse_structured(text, BusinessPlanContent)
+                    background_tasks.add_task(save_generated_content, "business_plan", request.business_name, plan.model_dump_json(), user_id)
+                    return {
+                        "success": True,
+                        "section_count": len(plan.sections),
+                        "cache": "hit" if chunks.hit else "miss",
+                        "tool": "business_plan_generator"
+                    }
+                
+                return sse_items_response(chunks, StructuredStream(PlanSection).feed, finalize_structured, event="section")
+            
+            def finalize(business_plan: str) -> dict:
+                background_tasks.add_task(save_generated_content, "business_plan", request.business_name, business_plan, user_id)
+                return {
+                    "success": True,
+                    "word_count": len(business_plan.split()),
+                    "cache": "hit" if chunks.hit else "miss",
+                    "tool": "business_plan_generator"
+                }
+            
+            return sse_response(chunks, finalize)
         
-        business_plan = response.choices[0].message.content
+        business_plan, cache_hit = await cached_chat(
+            llm, cache, "business_plan",
+            model=route.model,
+            messages=prompt.messages,
+            temperature=0.7,
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout,
+            bypass=bypass_cache,
+            user_id=user_id,
+            response_format=response_format,
+            validate=validate
+        )
+        
+        if structured:
+            plan = parse_structured(business_plan, BusinessPlanContent)
+            background_tasks.add_task(save_generated_content, "business_plan", request.business_name, plan.model_dump_json(), user_id)
+            return {
+                "success": True,
+                "sections": [section.model_dump() for section in plan.sections],
+                "section_count": len(plan.sections),
+                "cache": "hit" if cache_hit else "miss",
+                "tool": "business_plan_generator"
+            }
+        
+        background_tasks.add_task(save_generated_content, "business_plan", request.business_name, business_plan, user_id)
         
         return {
             "success": True,
             "business_plan": business_plan,
             "word_count": len(business_plan.split()),
+            "cache": "hit" if cache_hit else "miss",
+            "tool": "business_plan_generator"
+        }
+        
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating business plan: {str(e)}")
+
+@router.post("/regenerate-business-plan-section")
+async def regenerate_business_plan_section(
+    request: SectionRegenerationRequest,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Rewrite one section of a structured business plan, with the others as context
+
+    Costs one short completion instead of regenerating the whole plan.
+    """
+    current = next((section for section in request.sections if section.number == request.number), None)
+    if current is None:
+        raise HTTPException(status_code=400, detail=f"The plan has no section {request.number}")
+    try:
+        outline = "\n".join(
+            f"{section.number}. {section.title}: {section.content[:300]}"
+            for section in request.sections
+        )
+        prompt = BUSINESS_PLAN_SECTION_PROMPT.render(
+            **_prompt_fields(request.plan),
+            outline=outline,
+            number=current.number,
+            title=current.title,
+            instructions=request.instructions or ""
+        )
+        route = await model_router.route_prompt("business_plan", user_id, prompt)
+        response = await llm.chat(
+            tool="business_plan",
+            user_id=user_id,
+            model=route.model,
+            messages=prompt.messages,
+            temperature=0.7,
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout,
+            response_format=JSON_RESPONSE_FORMAT
+        )
+        section = parse_structured(response.choices[0].message.content, PlanSection)
+        return {
+            "success": True,
+            "section": section.model_copy(update={"number": current.number}).model_dump(),
+            "tool": "business_plan_generator"
+        }
+        
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error regenerating business plan section: {str(e)}")
+
+@router.post("/generate-business-plan-sections")
+async def generate_business_plan_sections(
+    request: BusinessPlanRequest,
+    background_tasks: BackgroundTasks,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    cache=Depends(get_cache),
+    bypass_cache: bool = Depends(cache_bypass),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Generate a business plan section by section
+
+    Sections run concurrently along their dependency graph and are cached
+    individually, so after an edit only the affected sections are
+    regenerated. The response reports per-section latency and cache
+    status, and the tokens spent versus regenerating the whole plan.
+    """
+    try:
+        result = await generate_plan_sections(request, llm, model_router, cache, bypass_cache, user_id)
+        background_tasks.add_task(save_generated_content, "business_plan", request.business_name, result["business_plan"], user_id)
+        return {
+            "success": True,
+            **result,
+            "word_count": len(result["business_plan"].split()),
             "tool": "business_plan_generator"
         }
         
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating business plan: {str(e)}")
@@ -1,12 +1,27 @@
-from openai import AsyncOpenAI
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+import asyncio
 import json
 import os
 
+from app.core.bot_registry import BotRegistry, CompiledBot, get_bot_registry, normalize_question
+from app.core.conversations import ConversationStore, get_conversations
+from app.core.identity import get_user_id
+from app.core.llm import LLMGateway, get_llm
+from app.core.prompts import register_prompt
+from app.core.resilience import UpstreamError
+from app.core.routing import ModelRouter, get_model_router
+from app.core.semantic_cache import SemanticCache, get_semantic_cache
+from app.database import SessionLocal
+from app.models import ChatbotConfigRecord
+
 router = APIRouter()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Sample responses are generated for at most this many common questions
+MAX_SAMPLE_QUESTIONS = int(os.getenv("CHATBOT_MAX_SAMPLE_QUESTIONS", "5"))
+SAMPLE_CONCURRENCY = int(os.getenv("CHATBOT_SAMPLE_CONCURRENCY", "5"))
+SAMPLE_TIMEOUT = float(os.getenv("CHATBOT_SAMPLE_TIMEOUT", "20"))
 
 class ChatbotConfig(BaseModel):
     bot_name: str
@@ -16,96 +31,282 @@ class ChatbotConfig(BaseModel):
     tone: str  # friendly, professional, casual
     language: str  # english, hindi, mixed
 
+# The bot's own system prompt with one of its common questions
+SAMPLE_RESPONSE_PROMPT = register_prompt(
+    "chatbot_sample_response",
+    model="gpt-3.5-turbo",
+    system="{system_prompt}",
+    user="As {bot_name} for {business_name}, answer this question in a {tone} tone: {question}",
+    max_tokens=200,
+    max_input_tokens=8000,
+    min_completion_tokens=100
+)
+
 class ChatMessage(BaseModel):
     message: str
     bot_config_id: int
+    session_id: Optional[str] = None  # omit to start a new conversation
 
-@router.post("/create-chatbot-config")
-async def create_chatbot_config(request: ChatbotConfig):
-    """Create chatbot configuration"""
-    try:
-        # Generate system prompt for the chatbot
-        system_prompt = f"""
-        You are {request.bot_name}, an AI assistant for {request.business_name}.
+
+def build_system_prompt(config: ChatbotConfig) -> str:
+    return f"""
+        You are {config.bot_name}, an AI assistant for {config.business_name}.
         
-        Business Description: {request.business_description}
+        Business Description: {config.business_description}
         
         Your role:
-        - Answer customer questions about {request.business_name}
-        - Be {request.tone} in your responses
-        - Communicate in {request.language}
+        - Answer customer questions about {config.business_name}
+        - Be {config.tone} in your responses
+        - Communicate in {config.language}
         - Provide helpful, accurate information
         - If you don't know something, say so and offer to connect them with a human
         
         Common Questions You Should Know:
-        {json.dumps(request.common_questions, indent=2)}
+        {json.dumps(config.common_questions, indent=2)}
         
-        Always be polite, helpful, and represent {request.business_name} professionally.
+        Always be polite, helpful, and represent {config.business_name} professionally.
         """
-        
-        # Generate sample responses for common questions
-        sample_responses = {}
-        for question in request.common_questions[:5]:  # Limit to 5
-            response_prompt = f"As {request.bot_name} for {request.business_name}, answer this question in a {request.tone} tone: {question}"
-            
-            response = await client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": response_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=200
+
+
+async def generate_sample_responses(
+    config: ChatbotConfig,
+    system_prompt: str,
+    llm: LLMGateway,
+    user_id: Optional[int] = None
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Answer the common questions concurrently; returns (responses, failures)"""
+    questions = config.common_questions[:MAX_SAMPLE_QUESTIONS]
+    semaphore = asyncio.Semaphore(SAMPLE_CONCURRENCY)
+    
+    async def sample_response(question: str) -> str:
+        prompt = SAMPLE_RESPONSE_PROMPT.render(**config.model_dump(), system_prompt=system_prompt, question=question)
+        async with semaphore:
+            response = await asyncio.wait_for(
+                llm.chat(
+                    tool="chatbot_builder",
+                    user_id=user_id,
+                    model=prompt.model,
+                    messages=prompt.messages,
+                    temperature=0.7,
+                    max_tokens=prompt.max_tokens
+                ),
+                timeout=SAMPLE_TIMEOUT
             )
-            
-            sample_responses[question] = response.choices[0].message.content
-        
-        return {
-            "success": True,
-            "bot_config": {
-                "bot_name": request.bot_name,
-                "system_prompt": system_prompt,
-                "sample_responses": sample_responses
-            },
-            "embedding_code": f"""
+        return response.choices[0].message.content
+    
+    results = await asyncio.gather(
+        *(sample_response(question) for question in questions),
+        return_exceptions=True
+    )
+    
+    # Keep whatever succeeded; failed questions are reported, not fatal
+    sample_responses = {}
+    failed_questions = {}
+    for question, result in zip(questions, results):
+        if isinstance(result, asyncio.TimeoutError):
+            failed_questions[question] = "timed out"
+        elif isinstance(result, Exception):
+            failed_questions[question] = str(result)
+        else:
+            sample_responses[question] = result
+    return sample_responses, failed_questions
+
+
+def _apply_config(record: ChatbotConfigRecord, config: ChatbotConfig, system_prompt: str,
+                  sample_responses: Dict[str, str]):
+    record.bot_name = config.bot_name
+    record.business_name = config.business_name
+    record.business_description = config.business_description
+    record.common_questions = json.dumps(config.common_questions)
+    record.tone = config.tone
+    record.language = config.language
+    record.system_prompt = system_prompt
+    record.sample_responses = json.dumps(sample_responses)
+
+
+def _config_response(record: ChatbotConfigRecord, failed_questions: Optional[Dict[str, str]] = None) -> dict:
+    return {
+        "success": True,
+        "config_id": record.id,
+        "bot_config": {
+            "bot_name": record.bot_name,
+            "system_prompt": record.system_prompt,
+            "sample_responses": json.loads(record.sample_responses or "{}"),
+            "failed_questions": failed_questions or {}
+        },
+        "embedding_code": f"""
             <!-- Add this to your website -->
             <script>
               window.sphereAIChatbot = {{
-                botName: "{request.bot_name}",
-                businessName: "{request.business_name}",
-                configId: "your-config-id-here"
+                botName: "{record.bot_name}",
+                businessName: "{record.business_name}",
+                configId: "{record.id}"
               }};
             </script>
             <script src="https://cdn.sphere-ai.com/chatbot.js"></script>
             """,
-            "tool": "chatbot_builder"
-        }
+        "tool": "chatbot_builder"
+    }
+
+
+@router.post("/create-chatbot-config")
+async def create_chatbot_config(
+    request: ChatbotConfig,
+    llm: LLMGateway = Depends(get_llm),
+    bots: BotRegistry = Depends(get_bot_registry),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Create and store a chatbot configuration"""
+    try:
+        system_prompt = build_system_prompt(request)
+        sample_responses, failed_questions = await generate_sample_responses(
+            request, system_prompt, llm, user_id
+        )
+        
+        record = ChatbotConfigRecord(user_id=user_id, use_count=0)
+        _apply_config(record, request, system_prompt, sample_responses)
+        async with SessionLocal() as session:
+            session.add(record)
+            await session.commit()
+        bots.add(record)
+        
+        return _config_response(record, failed_questions)
         
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/chatbot-respond")
-async def chatbot_respond(request: ChatMessage):
-    """Get chatbot response to user message"""
+@router.get("/chatbot-config/{config_id}")
+async def get_chatbot_config(config_id: int):
+    """Fetch a stored chatbot configuration"""
+    async with SessionLocal() as session:
+        record = await session.get(ChatbotConfigRecord, config_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Chatbot config not found")
+    return _config_response(record)
+
+
+@router.put("/chatbot-config/{config_id}")
+async def update_chatbot_config(
+    config_id: int,
+    request: ChatbotConfig,
+    llm: LLMGateway = Depends(get_llm),
+    bots: BotRegistry = Depends(get_bot_registry),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Update a chatbot configuration, regenerating its prompt and sample responses
+
+    Only the verified user who created a bot may edit it; bots created
+    without a verified identity have no owner and are read-only.
+    """
     try:
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful business assistant. Be friendly and professional."},
-                {"role": "user", "content": request.message}
-            ],
-            temperature=0.7,
-            max_tokens=300
+        async with SessionLocal() as session:
+            record = await session.get(ChatbotConfigRecord, config_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Chatbot config not found")
+        if user_id is None or record.user_id != user_id:
+            raise HTTPException(status_code=403, detail="Not allowed to edit this chatbot")
+        
+        # Generate outside the session so no connection is held during LLM calls
+        system_prompt = build_system_prompt(request)
+        sample_responses, failed_questions = await generate_sample_responses(
+            request, system_prompt, llm, user_id
         )
+        _apply_config(record, request, system_prompt, sample_responses)
+        async with SessionLocal() as session:
+            record = await session.merge(record)
+            await session.commit()
+        
+        # The new updated_at is a new version: other workers pick it up on
+        # their next revalidation, and replies cached under the old prompt
+        # live in the old version's namespace, so they are never served
+        bots.invalidate(config_id)
+        bots.add(record)
+        
+        return _config_response(record, failed_questions)
+        
+    except HTTPException:
+        raise
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/chatbot-respond")
+async def chatbot_respond(
+    request: ChatMessage,
+    background_tasks: BackgroundTasks,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    bots: BotRegistry = Depends(get_bot_registry),
+    semantic_cache: SemanticCache = Depends(get_semantic_cache),
+    conversations: ConversationStore = Depends(get_conversations),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Get chatbot response to user message
+
+    Uses the bot's stored configuration and the conversation identified by
+    `session_id`, trimmed to the conversation token budget. Messages that
+    exactly match one of its common questions, or that open a conversation
+    and closely match an earlier message for the same bot, are answered
+    without calling the LLM.
+    """
+    try:
+        bot: Optional[CompiledBot] = await bots.get(request.bot_config_id)
+        if bot is None:
+            raise HTTPException(status_code=404, detail="Chatbot config not found")
         
-        bot_response = response.choices[0].message.content
+        session_id = request.session_id or conversations.new_session_id()
+        async with conversations.lock(session_id):
+            conversation = await conversations.get(session_id, request.bot_config_id)
+            session_id = conversation.session_id
+            namespace = bot.cache_namespace
+            probe = None
+            
+            bot_response = bot.sample_answers.get(normalize_question(request.message))
+            if bot_response is None and not conversation.turns and not conversation.summary:
+                # Only context-free openers are safe to answer from the semantic cache
+                bot_response, probe = semantic_cache.lookup(namespace, request.message)
+            cached = bot_response is not None
+            
+            if not cached:
+                messages = conversations.build_messages(bot.system_message, conversation, request.message)
+                route = await model_router.route_messages("chatbot_builder", user_id, messages, "gpt-3.5-turbo", 300)
+                response = await llm.chat(
+                    tool="chatbot_builder",
+                    user_id=user_id,
+                    model=route.model,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=route.max_tokens,
+                    fallbacks=route.fallbacks,
+                    timeout=route.timeout
+                )
+                bot_response = response.choices[0].message.content
+                if probe is not None:
+                    semantic_cache.store(namespace, probe, bot_response)
+            
+            conversation = await conversations.append(
+                conversation,
+                {"role": "user", "content": request.message},
+                {"role": "assistant", "content": bot_response}
+            )
+        background_tasks.add_task(conversations.compact, llm, conversation, user_id)
         
         return {
             "success": True,
             "response": bot_response,
+            "session_id": session_id,
+            "cached": cached,
             "timestamp": "2025-10-17T11:16:00Z"
         }
         
+    except HTTPException:
+        raise
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
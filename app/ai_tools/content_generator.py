@@ -1,11 +1,16 @@
-from openai import AsyncOpenAI
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional
-import os
+
+from app.core.cache import cache_bypass, cached_chat, get_cache
+from app.core.identity import get_user_id
+from app.core.llm import LLMGateway, get_llm
+from app.core.prompts import PromptTooLarge, register_prompt
+from app.core.resilience import UpstreamError
+from app.core.routing import ModelRouter, get_model_router
+from app.database import save_generated_content
 
 router = APIRouter()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 class ContentRequest(BaseModel):
     content_type: str  # blog, social, email, product_description, website
@@ -15,28 +20,34 @@ class ContentRequest(BaseModel):
     keywords: Optional[str] = None
     target_audience: Optional[str] = None
 
-@router.post("/generate-content")
-async def generate_content(request: ContentRequest):
-    """AI content generation for various formats"""
-    try:
-        # Determine word count based on length
-        word_counts = {
-            "short": "200-300 words",
-            "medium": "500-700 words",
-            "long": "1000-1500 words"
-        }
-        
-        prompt = f"""
-        Generate {request.content_type} content with these specifications:
+WORD_COUNTS = {
+    "short": "200-300 words",
+    "medium": "500-700 words",
+    "long": "1000-1500 words"
+}
+
+CONTENT_TYPE_REQUIREMENTS = {
+    "blog": "\n- Include catchy headline\n- Add meta description\n- Use H2/H3 headings\n- Include introduction and conclusion",
+    "social": "\n- Keep it concise and engaging\n- Include relevant hashtags\n- Add emoji where appropriate\n- End with strong CTA",
+    "email": "\n- Subject line\n- Personalized greeting\n- Clear value proposition\n- Strong CTA\n- Professional signature",
+    "product_description": "\n- Highlight key features and benefits\n- Address pain points\n- Include specifications\n- Add compelling CTA",
+}
+
+CONTENT_PROMPT = register_prompt(
+    "content_generator",
+    model="gpt-4-turbo-preview",
+    system="You are a professional content writer skilled in creating {content_type} content that engages and converts.",
+    user="""
+        Generate {content_type} content with these specifications:
         
-        Topic: {request.topic}
-        Tone: {request.tone}
-        Length: {word_counts.get(request.length, '500-700 words')}
-        Keywords: {request.keywords or 'Not specified'}
-        Target Audience: {request.target_audience or 'General audience'}
+        Topic: {topic}
+        Tone: {tone}
+        Length: {word_count}
+        Keywords: {keywords_text}
+        Target Audience: {audience}
         
         Requirements:
-        - Write in {request.tone} tone
+        - Write in {tone} tone
         - Make it engaging and valuable
         - Include relevant keywords naturally
         - Optimize for SEO (if blog/website content)
@@ -44,36 +55,67 @@ async def generate_content(request: ContentRequest):
         - Use proper formatting (headings, bullets where appropriate)
         
         Content Type Specific:
-        """
-        
-        if request.content_type == "blog":
-            prompt += "\n- Include catchy headline\n- Add meta description\n- Use H2/H3 headings\n- Include introduction and conclusion"
-        elif request.content_type == "social":
-            prompt += "\n- Keep it concise and engaging\n- Include relevant hashtags\n- Add emoji where appropriate\n- End with strong CTA"
-        elif request.content_type == "email":
-            prompt += "\n- Subject line\n- Personalized greeting\n- Clear value proposition\n- Strong CTA\n- Professional signature"
-        elif request.content_type == "product_description":
-            prompt += "\n- Highlight key features and benefits\n- Address pain points\n- Include specifications\n- Add compelling CTA"
+        {type_requirements}""",
+    max_tokens=2000,
+    max_input_tokens=4000
+)
+
+@router.post("/generate-content")
+async def generate_content(
+    request: ContentRequest,
+    background_tasks: BackgroundTasks,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    cache=Depends(get_cache),
+    bypass_cache: bool = Depends(cache_bypass),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """AI content generation for various formats
+
+    Identical requests are served from the response cache unless the
+    `X-Cache-Bypass` header is set. The content is persisted after the
+    response has been sent.
+    """
+    try:
+        prompt = CONTENT_PROMPT.render(
+            **request.model_dump(),
+            word_count=WORD_COUNTS.get(request.length, "500-700 words"),
+            keywords_text=request.keywords or "Not specified",
+            audience=request.target_audience or "General audience",
+            type_requirements=CONTENT_TYPE_REQUIREMENTS.get(request.content_type, "")
+        )
+        route = await model_router.route_prompt(
+            "content_generator", user_id, prompt,
+            content_type=request.content_type, length=request.length
+        )
         
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": f"You are a professional content writer skilled in creating {request.content_type} content that engages and converts."},
-                {"role": "user", "content": prompt}
-            ],
+        generated_content, cache_hit = await cached_chat(
+            llm, cache, "content_generator",
+            model=route.model,
+            messages=prompt.messages,
             temperature=0.8,
-            max_tokens=2000
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout,
+            bypass=bypass_cache,
+            user_id=user_id
         )
         
-        generated_content = response.choices[0].message.content
+        background_tasks.add_task(save_generated_content, "content_generator", request.topic, generated_content, user_id)
         
         return {
             "success": True,
             "content": generated_content,
             "word_count": len(generated_content.split()),
             "content_type": request.content_type,
+            "model": route.model,
+            "cache": "hit" if cache_hit else "miss",
             "tool": "content_generator"
         }
         
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,11 +1,23 @@
-from openai import AsyncOpenAI
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import List, Literal, Optional
+import asyncio
+import json
 import os
+import time
+
+from app.core.identity import current_client, get_tier, get_user_id
+from app.core.llm import LLMGateway, estimate_cost, get_llm
+from app.core.prompts import PromptTooLarge, RenderedPrompt, register_prompt
+from app.core.rate_limit import BULK_TICKET_COST, TIER_CREDIT_QUOTAS, throttle
+from app.core.resilience import UpstreamError
+from app.core.routing import ModelRouter, get_model_router
+from app.core.semantic_cache import SemanticCache, get_semantic_cache
+from app.database import save_generated_content
+from app.engines.ticket_classifier import classify_ticket
 
 router = APIRouter()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 class SupportTicket(BaseModel):
     customer_name: str
@@ -14,19 +26,30 @@ class SupportTicket(BaseModel):
     message: str
     priority: Optional[str] = "medium"  # low, medium, high, urgent
 
-@router.post("/analyze-support-ticket")
-async def analyze_support_ticket(request: SupportTicket):
-    """Analyze support ticket and suggest response"""
-    try:
-        prompt = f"""
+# Bulk triage packs several tickets into one completion
+BULK_MODEL = os.getenv("SUPPORT_BULK_MODEL", "gpt-3.5-turbo")
+BULK_BATCH_SIZE = int(os.getenv("SUPPORT_BULK_BATCH_SIZE", "10"))
+BULK_CONCURRENCY = int(os.getenv("SUPPORT_BULK_CONCURRENCY", "4"))
+BULK_MAX_TICKETS = int(os.getenv("SUPPORT_BULK_MAX_TICKETS", "5000"))
+BULK_TICKET_CHARS = 2000  # longer messages are truncated in the batch prompt
+
+# fast: local classifier only; hybrid: LLM only for low-confidence tickets; llm: always LLM
+TriageMode = Literal["fast", "hybrid", "llm"]
+CLASSIFIER_THRESHOLD = float(os.getenv("SUPPORT_CLASSIFIER_THRESHOLD", "0.6"))
+
+TICKET_ANALYSIS_PROMPT = register_prompt(
+    "support_ticket_analysis",
+    model="gpt-4-turbo-preview",
+    system="You are a customer support expert who analyzes tickets and provides actionable insights.",
+    user="""
         Analyze this customer support ticket:
         
-        From: {request.customer_name} ({request.customer_email})
-        Subject: {request.subject}
-        Priority: {request.priority}
+        From: {customer_name} ({customer_email})
+        Subject: {subject}
+        Priority: {priority}
         
         Message:
-        {request.message}
+        {message}
         
         Provide:
         1. Sentiment Analysis (positive, neutral, negative, angry)
@@ -37,78 +60,336 @@ async def analyze_support_ticket(request: SupportTicket):
         6. Escalation Needed? (yes/no and why)
         
         Format your analysis clearly with sections.
-        """
-        
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are a customer support expert who analyzes tickets and provides actionable insights."},
-                {"role": "user", "content": prompt}
-            ],
+        """,
+    max_tokens=1000,
+    max_input_tokens=6000
+)
+
+SUPPORT_RESPONSE_PROMPT = register_prompt(
+    "support_response",
+    model="gpt-4-turbo-preview",
+    system="You are an expert customer support representative known for excellent service.",
+    user="""
+        Generate a professional, empathetic customer support response for this issue:
+        
+        Customer Issue:
+        {message}
+        
+        Requirements:
+        - Be empathetic and understanding
+        - Provide clear solution steps
+        - Use professional but friendly tone
+        - Include next steps or timeline
+        - Offer additional help
+        - End with positive note
+        
+        Format as email response.
+        """,
+    max_tokens=500,
+    max_input_tokens=4000
+)
+
+# Keys taken from each triage result; anything else the model returns is dropped
+TRIAGE_FIELDS = ("sentiment", "category", "urgency", "escalate", "summary", "suggested_response")
+
+# One batch of tickets; messages are already cut to BULK_TICKET_CHARS
+TRIAGE_PROMPT = register_prompt(
+    "support_triage",
+    model=BULK_MODEL,
+    system="You are a customer support expert who triages tickets accurately and concisely.",
+    user="""
+        Triage each of these {count} customer support tickets.
+        
+        {listing}
+        
+        Respond with JSON only, in this shape:
+        {{"results": [{{"ticket": <ticket number>,
+                        "sentiment": "positive|neutral|negative|angry",
+                        "category": "technical|billing|feature_request|complaint|question",
+                        "urgency": "low|medium|high|urgent",
+                        "escalate": true|false,
+                        "summary": "<one sentence>",
+                        "suggested_response": "<two or three sentences>"}}]}}
+        Include exactly one result per ticket.
+        """,
+    max_tokens=150 * BULK_BATCH_SIZE + 100,
+    min_completion_tokens=250
+)
+
+@router.post("/analyze-support-ticket")
+async def analyze_support_ticket(
+    request: SupportTicket,
+    background_tasks: BackgroundTasks,
+    mode: TriageMode = "llm",
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Analyze support ticket and suggest response
+
+    Sentiment, category and urgency always come from the local classifier.
+    `mode=fast` returns just those labels; `mode=hybrid` also skips the LLM
+    analysis when the classifier is confident.
+    """
+    try:
+        classification = classify_ticket(request.subject, request.message, request.priority)
+        if mode == "fast" or (mode == "hybrid" and classification.confidence >= CLASSIFIER_THRESHOLD):
+            return {
+                "success": True,
+                "analysis": None,
+                **classification.to_dict(),
+                "mode_used": "fast",
+                "tool": "customer_support_ai"
+            }
+        
+        prompt = TICKET_ANALYSIS_PROMPT.render(**request.model_dump())
+        route = await model_router.route_prompt("customer_support", user_id, prompt)
+        response = await llm.chat(
+            tool="customer_support",
+            user_id=user_id,
+            model=route.model,
+            messages=prompt.messages,
             temperature=0.6,
-            max_tokens=1000
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout
         )
         
         analysis = response.choices[0].message.content
         
-        # Extract sentiment (simple parsing)
-        sentiment = "neutral"
-        if "negative" in analysis.lower() or "angry" in analysis.lower():
-            sentiment = "negative"
-        elif "positive" in analysis.lower():
-            sentiment = "positive"
+        background_tasks.add_task(save_generated_content, "customer_support", request.subject, analysis, user_id)
         
         return {
             "success": True,
             "analysis": analysis,
-            "sentiment": sentiment,
+            **classification.to_dict(),
+            "mode_used": "llm",
             "tool": "customer_support_ai"
         }
         
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/generate-support-response")
-async def generate_support_response(request: dict):
-    """Generate professional support response"""
+async def generate_support_response(
+    request: dict,
+    background_tasks: BackgroundTasks,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    semantic_cache: SemanticCache = Depends(get_semantic_cache),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Generate professional support response
+
+    Issues that closely match an earlier one from the same signed-in user
+    (and the optional `business_id` within their account) are answered
+    from the semantic cache. Replies can quote order or account details,
+    so anonymous calls never read or fill the cache, and a hit must name
+    the same order numbers, emails and days as the new message.
+    """
     try:
         message = request.get("message", "")
+        namespace = f"support:{user_id}:{request.get('business_id', 'default')}" if user_id is not None else None
+        cached_response, probe = semantic_cache.lookup(namespace, message) if namespace else (None, None)
+        if cached_response is not None:
+            return {
+                "success": True,
+                "response": cached_response,
+                "cached": True,
+                "tool": "customer_support_ai"
+            }
         
-        prompt = f"""
-        Generate a professional, empathetic customer support response for this issue:
-        
-        Customer Issue:
-        {message}
-        
-        Requirements:
-        - Be empathetic and understanding
-        - Provide clear solution steps
-        - Use professional but friendly tone
-        - Include next steps or timeline
-        - Offer additional help
-        - End with positive note
-        
-        Format as email response.
-        """
-        
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are an expert customer support representative known for excellent service."},
-                {"role": "user", "content": prompt}
-            ],
+        prompt = SUPPORT_RESPONSE_PROMPT.render(message=message)
+        route = await model_router.route_prompt("customer_support", user_id, prompt)
+        response = await llm.chat(
+            tool="customer_support",
+            user_id=user_id,
+            model=route.model,
+            messages=prompt.messages,
             temperature=0.7,
-            max_tokens=500
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout
         )
         
         support_response = response.choices[0].message.content
+        if namespace is not None:
+            semantic_cache.store(namespace, probe, support_response)
+        
+        background_tasks.add_task(save_generated_content, "customer_support", "Support response", support_response, user_id)
         
         return {
             "success": True,
             "response": support_response,
+            "cached": False,
             "tool": "customer_support_ai"
         }
         
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+def parse_bulk_tickets(body: bytes, content_type: str) -> List[SupportTicket]:
+    """Read tickets from an NDJSON body or a JSON list (optionally under "tickets")"""
+    if "ndjson" in content_type or "jsonl" in content_type:
+        items = [json.loads(line) for line in body.decode("utf-8").splitlines() if line.strip()]
+    else:
+        items = json.loads(body or b"[]")
+        if isinstance(items, dict):
+            items = items.get("tickets", [])
+    if not isinstance(items, list):
+        raise ValueError("Expected a list of tickets")
+    return [SupportTicket(**item) for item in items]
+
+
+def build_triage_prompt(tickets: List[SupportTicket]) -> RenderedPrompt:
+    listing = "\n\n".join(
+        f"Ticket {number}\nSubject: {ticket.subject}\nStated priority: {ticket.priority}\n"
+        f"Message: {ticket.message[:BULK_TICKET_CHARS]}"
+        for number, ticket in enumerate(tickets, start=1)
+    )
+    return TRIAGE_PROMPT.render(count=len(tickets), listing=listing)
+
+
+async def triage_batch(llm: LLMGateway, tickets: List[SupportTicket], user_id: Optional[int] = None):
+    """Classify a batch in one completion; returns (TRIAGE_FIELDS by ticket number, usage)"""
+    prompt = build_triage_prompt(tickets)
+    response = await llm.chat(
+        tool="customer_support",
+        user_id=user_id,
+        model=prompt.model,
+        messages=prompt.messages,
+        temperature=0.2,
+        max_tokens=min(prompt.max_tokens, 150 * len(tickets) + 100),
+        response_format={"type": "json_object"}
+    )
+    parsed = json.loads(response.choices[0].message.content)
+    results = {}
+    for item in parsed.get("results", []):
+        if isinstance(item, dict) and isinstance(item.get("ticket"), int):
+            results[item["ticket"]] = {key: item[key] for key in TRIAGE_FIELDS if key in item}
+    return results, response.usage
+
+
+@router.post("/analyze-support-tickets/bulk")
+async def analyze_support_tickets_bulk(
+    http_request: Request,
+    mode: TriageMode = "llm",
+    llm: LLMGateway = Depends(get_llm),
+    user_id: Optional[int] = Depends(get_user_id),
+    tier: str = Depends(get_tier)
+):
+    """Triage a backlog of tickets, streaming one NDJSON line per ticket
+
+    Accepts NDJSON (Content-Type: application/x-ndjson) or a JSON list of
+    tickets. Tickets are packed BULK_BATCH_SIZE per completion and batches
+    run BULK_CONCURRENCY at a time; each ticket's line is sent as soon as its
+    batch finishes, so lines arrive out of order and carry the ticket's
+    input `index`. With `mode=fast` or `mode=hybrid`, tickets the local
+    classifier labels (all of them, or the confident ones) are sent first
+    without an LLM call. The last line is a summary with throughput and cost.
+
+    Each batch spends BULK_TICKET_COST per ticket from the caller's rate
+    limit and waits for it to refill when empty, so large imports are paced
+    rather than rejected. Imports needing more completions than the plan's
+    remaining credit quota are refused up front.
+    """
+    try:
+        tickets = parse_bulk_tickets(await http_request.body(), http_request.headers.get("content-type", ""))
+    except (ValueError, TypeError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not tickets:
+        raise HTTPException(status_code=422, detail="No tickets supplied")
+    if len(tickets) > BULK_MAX_TICKETS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_TICKETS} tickets per request")
+    
+    local = {}
+    if mode != "llm":
+        for index, ticket in enumerate(tickets):
+            classification = classify_ticket(ticket.subject, ticket.message, ticket.priority)
+            if mode == "fast" or classification.confidence >= CLASSIFIER_THRESHOLD:
+                local[index] = classification
+    pending = [index for index in range(len(tickets)) if index not in local]
+    batches = [pending[start:start + BULK_BATCH_SIZE] for start in range(0, len(pending), BULK_BATCH_SIZE)]
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+    state = http_request.app.state
+    client = current_client.get()  # set by RateLimitMiddleware
+    quota = TIER_CREDIT_QUOTAS.get(tier)
+    if client is not None and quota is not None:
+        used, retry_after = await state.meter.usage(client)
+        if used + len(batches) > quota:
+            # Waiting only helps if the import fits in the quota at all
+            headers = {"Retry-After": str(max(1, int(retry_after)))} if len(batches) <= quota else None
+            raise HTTPException(
+                status_code=429,
+                detail=f"This import needs {len(batches)} credits; {max(0, quota - used)} left on the {tier} plan",
+                headers=headers
+            )
+    
+    async def run_batch(indexes: List[int]):
+        async with semaphore:
+            try:
+                if client is not None:
+                    await throttle(state, client, tier, http_request.url.path, BULK_TICKET_COST * len(indexes))
+                return indexes, await triage_batch(llm, [tickets[i] for i in indexes], user_id), None
+            except Exception as e:
+                return indexes, None, e
+    
+    async def results():
+        started = time.perf_counter()
+        succeeded = prompt_tokens = completion_tokens = 0
+        tasks = [asyncio.create_task(run_batch(indexes)) for indexes in batches]
+        for index, classification in local.items():
+            yield json.dumps({"index": index, "subject": tickets[index].subject, **classification.to_dict(),
+                              "mode_used": "fast"}) + "\n"
+        succeeded = len(local)
+        try:
+            for finished in asyncio.as_completed(tasks):
+                indexes, outcome, error = await finished
+                if outcome is not None:
+                    by_number, usage = outcome
+                    if usage:
+                        prompt_tokens += usage.prompt_tokens
+                        completion_tokens += usage.completion_tokens
+                for number, index in enumerate(indexes, start=1):
+                    line = {"index": index, "subject": tickets[index].subject}
+                    result = by_number.get(number) if outcome is not None else None
+                    if result is None:
+                        line["error"] = str(error) if error else "No result returned for this ticket"
+                        if isinstance(error, UpstreamError):
+                            line["code"] = error.code
+                    else:
+                        line.update(result, mode_used="llm")
+                        succeeded += 1
+                    yield json.dumps(line) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+        
+        elapsed = time.perf_counter() - started
+        cost = estimate_cost(BULK_MODEL, prompt_tokens, completion_tokens)
+        yield json.dumps({"summary": {
+            "tickets": len(tickets),
+            "succeeded": succeeded,
+            "failed": len(tickets) - succeeded,
+            "classified_locally": len(local),
+            "batches": len(batches),
+            "seconds": round(elapsed, 3),
+            "tickets_per_second": round(len(tickets) / elapsed, 2) if elapsed else None,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "estimated_cost_usd": round(cost, 6),
+            "cost_per_ticket_usd": round(cost / len(tickets), 6),
+            "model": BULK_MODEL
+        }}) + "\n"
+    
+    return StreamingResponse(results(), media_type="application/x-ndjson")
@@ -1,12 +1,18 @@
-from openai import AsyncOpenAI
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
+from pydantic import BaseModel, Field
 from typing import List, Optional
 import json
-import os
+import numpy as np
+
+from app.core.identity import get_user_id
+from app.core.llm import LLMGateway, get_llm
+from app.core.prompts import PromptTooLarge, register_prompt
+from app.core.resilience import UpstreamError
+from app.core.routing import ModelRouter, get_model_router
+from app.database import save_generated_content
+from app.engines.projections import break_even_months, monte_carlo, project, series_to_rows
 
 router = APIRouter()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 class FinancialForecastRequest(BaseModel):
     business_name: str
@@ -15,45 +21,28 @@ class FinancialForecastRequest(BaseModel):
     monthly_revenue_month1: float
     monthly_costs: float
     growth_rate: float  # percentage
-    forecast_months: int
+    forecast_months: int = Field(..., ge=1, le=600)
+    cost_inflation: float = 2.0  # percentage per month
+    churn_rate: float = 0.0  # percentage of revenue lost per month
+    include_analysis: bool = True  # False returns the numeric forecast only
 
-@router.post("/financial-forecast")
-async def generate_financial_forecast(request: FinancialForecastRequest):
-    """Generate financial projections with AI analysis"""
-    try:
-        # Calculate projections
-        projections = []
-        cumulative_revenue = 0
-        cumulative_costs = 0
+FORECAST_ANALYSIS_PROMPT = register_prompt(
+    "financial_forecast",
+    model="gpt-4-turbo-preview",
+    system="You are a financial analyst specializing in startup finance and forecasting.",
+    user="""
+        Analyze this financial forecast for {business_name} in {industry}:
         
-        for month in range(1, request.forecast_months + 1):
-            revenue = request.monthly_revenue_month1 * (1 + request.growth_rate/100) ** (month - 1)
-            costs = request.monthly_costs * (1.02 ** (month - 1))  # 2% cost inflation
-            profit = revenue - costs
-            cumulative_revenue += revenue
-            cumulative_costs += costs
-            
-            projections.append({
-                "month": month,
-                "revenue": round(revenue, 2),
-                "costs": round(costs, 2),
-                "profit": round(profit, 2),
-                "cumulative_revenue": round(cumulative_revenue, 2),
-                "cumulative_profit": round(cumulative_revenue - cumulative_costs, 2)
-            })
-        
-        # Get AI analysis
-        prompt = f"""
-        Analyze this financial forecast for {request.business_name} in {request.industry}:
-        
-        Initial Investment: ₹{request.initial_investment:,.2f}
-        Starting Monthly Revenue: ₹{request.monthly_revenue_month1:,.2f}
-        Monthly Costs: ₹{request.monthly_costs:,.2f}
-        Growth Rate: {request.growth_rate}% per month
-        Forecast Period: {request.forecast_months} months
+        Initial Investment: ₹{initial_investment:,.2f}
+        Starting Monthly Revenue: ₹{monthly_revenue_month1:,.2f}
+        Monthly Costs: ₹{monthly_costs:,.2f}
+        Growth Rate: {growth_rate}% per month
+        Cost Inflation: {cost_inflation}% per month
+        Churn: {churn_rate}% of revenue per month
+        Forecast Period: {forecast_months} months
         
         Financial Projections (First 12 months):
-        {json.dumps(projections[:12], indent=2)}
+        {projections_json}
         
         Provide:
         1. Break-even Analysis (when will they break even?)
@@ -64,29 +53,187 @@ async def generate_financial_forecast(request: FinancialForecastRequest):
         6. Scenario Analysis (Best, Realistic, Worst case)
         
         Be specific with numbers and actionable insights.
-        """
+        """,
+    max_tokens=2000,
+    max_input_tokens=6000
+)
+
+class ScenarioSweepRequest(BaseModel):
+    initial_investment: float
+    monthly_revenue_month1: float
+    monthly_costs: float
+    forecast_months: int = Field(..., ge=1, le=600)
+    growth_rates: List[float] = Field(..., min_length=1, max_length=200)
+    cost_inflations: List[float] = Field([2.0], min_length=1, max_length=200)
+    churn_rates: List[float] = Field([0.0], min_length=1, max_length=200)
+
+class MonteCarloRequest(BaseModel):
+    initial_investment: float
+    monthly_revenue_month1: float
+    monthly_costs: float
+    forecast_months: int = Field(..., ge=1, le=600)
+    growth_rate: float  # mean percentage per month
+    growth_volatility: float = Field(..., ge=0)  # std dev of monthly growth, percentage points
+    cost_inflation: float = 2.0
+    churn_rate: float = 0.0
+    paths: int = Field(5000, ge=1, le=100000)
+    seed: Optional[int] = None
+
+# Upper bound on scenarios x months evaluated by one sweep request
+MAX_SWEEP_CELLS = 5_000_000
+
+@router.post("/financial-forecast")
+async def generate_financial_forecast(
+    request: FinancialForecastRequest,
+    background_tasks: BackgroundTasks,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Generate financial projections with AI analysis
+
+    Set `include_analysis` to false to skip the LLM and get the numeric
+    forecast back in milliseconds.
+    """
+    try:
+        series = project(
+            request.monthly_revenue_month1,
+            request.monthly_costs,
+            request.growth_rate,
+            request.forecast_months,
+            cost_inflation=request.cost_inflation,
+            churn_rate=request.churn_rate
+        )
+        projections = series_to_rows(series)
+        summary = {
+            "break_even_month": int(break_even_months(series["cumulative_profit"], request.initial_investment)) or None,
+            "total_revenue_forecast": round(float(series["cumulative_revenue"][-1]), 2),
+            "total_profit_forecast": round(float(series["cumulative_profit"][-1]), 2)
+        }
         
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are a financial analyst specializing in startup finance and forecasting."},
-                {"role": "user", "content": prompt}
-            ],
+        if not request.include_analysis:
+            background_tasks.add_task(save_generated_content, "financial_forecast", request.business_name, json.dumps({"projections": projections, "analysis": None}), user_id)
+            return {
+                "success": True,
+                "projections": projections,
+                "analysis": None,
+                "summary": summary,
+                "tool": "financial_forecast"
+            }
+        
+        # Get AI analysis
+        prompt = FORECAST_ANALYSIS_PROMPT.render(
+            **request.model_dump(),
+            projections_json=json.dumps(projections[:12], indent=2)
+        )
+        route = await model_router.route_prompt("financial_forecast", user_id, prompt)
+        response = await llm.chat(
+            tool="financial_forecast",
+            user_id=user_id,
+            model=route.model,
+            messages=prompt.messages,
             temperature=0.5,
-            max_tokens=2000
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout
         )
         
         analysis = response.choices[0].message.content
         
+        background_tasks.add_task(save_generated_content, "financial_forecast", request.business_name, json.dumps({"projections": projections, "analysis": analysis}), user_id)
+        
         return {
             "success": True,
             "projections": projections,
             "analysis": analysis,
-            "summary": {
-                "break_even_month": next((p["month"] for p in projections if p["cumulative_profit"] > request.initial_investment), None),
-                "total_revenue_forecast": round(cumulative_revenue, 2),
-                "total_profit_forecast": round(cumulative_revenue - cumulative_costs, 2)
-            },
+            "summary": summary,
+            "tool": "financial_forecast"
+        }
+        
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+
+@router.post("/financial-forecast/scenarios")
+def sweep_financial_scenarios(request: ScenarioSweepRequest):
+    """Project every combination of growth, cost inflation and churn at once
+
+    Declared sync so FastAPI runs the NumPy work on its threadpool rather
+    than on the event loop.
+    """
+    scenario_count = len(request.growth_rates) * len(request.cost_inflations) * len(request.churn_rates)
+    if scenario_count * request.forecast_months > MAX_SWEEP_CELLS:
+        raise HTTPException(status_code=400, detail="Scenario grid too large; reduce the rates or forecast_months")
+    try:
+        growth, inflation, churn = np.meshgrid(
+            request.growth_rates, request.cost_inflations, request.churn_rates, indexing="ij"
+        )
+        series = project(
+            request.monthly_revenue_month1,
+            request.monthly_costs,
+            growth.ravel(),
+            request.forecast_months,
+            cost_inflation=inflation.ravel(),
+            churn_rate=churn.ravel()
+        )
+        break_even = break_even_months(series["cumulative_profit"], request.initial_investment)
+        total_revenue = np.round(series["cumulative_revenue"][:, -1], 2)
+        total_profit = np.round(series["cumulative_profit"][:, -1], 2)
+        
+        scenarios = [
+            {
+                "growth_rate": g,
+                "cost_inflation": i,
+                "churn_rate": c,
+                "break_even_month": be or None,
+                "total_revenue_forecast": rev,
+                "total_profit_forecast": prof
+            }
+            for g, i, c, be, rev, prof in zip(
+                growth.ravel().tolist(), inflation.ravel().tolist(), churn.ravel().tolist(),
+                break_even.tolist(), total_revenue.tolist(), total_profit.tolist()
+            )
+        ]
+        
+        return {
+            "success": True,
+            "scenarios": scenarios,
+            "scenario_count": scenario_count,
+            "tool": "financial_forecast"
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/financial-forecast/monte-carlo")
+def simulate_financial_forecast(request: MonteCarloRequest):
+    """Monte Carlo forecast over randomly drawn monthly growth paths (sync, see above)"""
+    if request.paths * request.forecast_months > MAX_SWEEP_CELLS:
+        raise HTTPException(status_code=400, detail="Simulation too large; reduce paths or forecast_months")
+    try:
+        result = monte_carlo(
+            request.monthly_revenue_month1,
+            request.monthly_costs,
+            request.initial_investment,
+            request.growth_rate,
+            request.growth_volatility,
+            request.forecast_months,
+            request.paths,
+            cost_inflation=request.cost_inflation,
+            churn_rate=request.churn_rate,
+            seed=request.seed
+        )
+        
+        return {
+            "success": True,
+            "paths": request.paths,
+            **result,
             "tool": "financial_forecast"
         }
         
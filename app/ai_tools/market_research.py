@@ -1,10 +1,18 @@
-from openai import AsyncOpenAI
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
 from pydantic import BaseModel
-import os
+from typing import Optional
+
+from app.core.cache import CachedStream, cache_bypass, cached_chat, get_cache
+from app.core.identity import get_user_id
+from app.core.jobs import register_job
+from app.core.llm import LLMGateway, get_llm
+from app.core.prompts import PromptTooLarge, RenderedPrompt, register_prompt
+from app.core.resilience import UpstreamError
+from app.core.routing import ModelRouter, get_model_router
+from app.core.streaming import sse_response
+from app.database import save_generated_content
 
 router = APIRouter()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 class MarketResearchRequest(BaseModel):
     industry: str
@@ -12,17 +20,17 @@ class MarketResearchRequest(BaseModel):
     geography: str
     research_focus: str  # "competitor", "customer", "trends", "market_size"
 
-@router.post("/market-research")
-async def conduct_market_research(request: MarketResearchRequest):
-    """AI-powered market research and analysis"""
-    try:
-        prompt = f"""
+MARKET_RESEARCH_PROMPT = register_prompt(
+    "market_research",
+    model="gpt-4-turbo-preview",
+    system="You are a market research analyst with deep industry knowledge and access to market data.",
+    user="""
         Conduct comprehensive market research for:
         
-        Industry: {request.industry}
-        Target Market: {request.target_market}
-        Geography: {request.geography}
-        Focus: {request.research_focus}
+        Industry: {industry}
+        Target Market: {target_market}
+        Geography: {geography}
+        Focus: {research_focus}
         
         Provide detailed analysis on:
         1. Market Size & Growth (TAM, SAM, SOM)
@@ -38,25 +46,99 @@ async def conduct_market_research(request: MarketResearchRequest):
         
         Use latest 2025 data and provide specific numbers where possible.
         Format with clear sections and bullet points.
-        """
-        
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are a market research analyst with deep industry knowledge and access to market data."},
-                {"role": "user", "content": prompt}
-            ],
+        """,
+    max_tokens=3000,
+    max_input_tokens=6000
+)
+
+def build_market_research_prompt(request: MarketResearchRequest) -> RenderedPrompt:
+    return MARKET_RESEARCH_PROMPT.render(**request.model_dump())
+
+
+@register_job("market_research", MarketResearchRequest)
+async def run_market_research(request: MarketResearchRequest, llm: LLMGateway, model_router: ModelRouter, user_id: Optional[int] = None) -> dict:
+    """Run market research outside a request, for the background job queue"""
+    prompt = build_market_research_prompt(request)
+    route = await model_router.route_prompt("market_research", user_id, prompt)
+    response = await llm.chat(
+        tool="market_research",
+        user_id=user_id,
+        model=route.model,
+        messages=prompt.messages,
+        temperature=0.6,
+        max_tokens=route.max_tokens,
+        fallbacks=route.fallbacks,
+        timeout=route.timeout
+    )
+    research_report = response.choices[0].message.content
+    title = f"{request.industry} - {request.target_market} ({request.geography})"
+    await save_generated_content("market_research", title, research_report, user_id)
+    return {
+        "success": True,
+        "research_report": research_report,
+        "tool": "market_research"
+    }
+
+@router.post("/market-research")
+async def conduct_market_research(
+    request: MarketResearchRequest,
+    background_tasks: BackgroundTasks,
+    stream: bool = False,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    cache=Depends(get_cache),
+    bypass_cache: bool = Depends(cache_bypass),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """AI-powered market research and analysis
+
+    With `stream=true` the report is sent as Server-Sent Events while it is
+    being generated; the final "done" event carries the response metadata.
+    Identical requests are served from the response cache unless the
+    `X-Cache-Bypass` header is set. The report is persisted after the
+    response has been sent.
+    """
+    try:
+        prompt = build_market_research_prompt(request)
+        route = await model_router.route_prompt("market_research", user_id, prompt)
+        title = f"{request.industry} - {request.target_market} ({request.geography})"
+        
+        if stream:
+            chunks = CachedStream(llm, cache, "market_research", route.model, prompt.messages, 0.6, route.max_tokens, bypass_cache, user_id, route.timeout)
+            def finalize(research_report: str) -> dict:
+                background_tasks.add_task(save_generated_content, "market_research", title, research_report, user_id)
+                return {
+                    "success": True,
+                    "cache": "hit" if chunks.hit else "miss",
+                    "tool": "market_research"
+                }
+            
+            return sse_response(chunks, finalize)
+        
+        research_report, cache_hit = await cached_chat(
+            llm, cache, "market_research",
+            model=route.model,
+            messages=prompt.messages,
             temperature=0.6,
-            max_tokens=3000
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout,
+            bypass=bypass_cache,
+            user_id=user_id
         )
         
-        research_report = response.choices[0].message.content
+        background_tasks.add_task(save_generated_content, "market_research", title, research_report, user_id)
         
         return {
             "success": True,
             "research_report": research_report,
+            "cache": "hit" if cache_hit else "miss",
             "tool": "market_research"
         }
         
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,10 +1,19 @@
-from openai import AsyncOpenAI
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
 from pydantic import BaseModel
-import os
+from typing import List, Optional
+
+from app.core.identity import get_user_id
+from app.core.jobs import register_job
+from app.core.llm import LLMGateway, get_llm
+from app.core.prompts import PromptTooLarge, RenderedPrompt, register_prompt
+from app.core.resilience import UpstreamError
+from app.core.routing import ModelRouter, get_model_router
+from app.core.streaming import sse_items_response, sse_response
+from app.core.structured import JSON_RESPONSE_FORMAT, StructuredStream, parse_structured, schema_instructions
+from app.database import save_generated_content
+from app.engines.documents import parse_document
 
 router = APIRouter()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 class PitchDeckRequest(BaseModel):
     business_name: str
@@ -18,23 +27,23 @@ class PitchDeckRequest(BaseModel):
     team: str
     funding_ask: str
 
-@router.post("/generate-pitch-deck")
-async def generate_pitch_deck(request: PitchDeckRequest):
-    """Generate investor pitch deck content"""
-    try:
-        prompt = f"""
+PITCH_DECK_PROMPT = register_prompt(
+    "pitch_deck",
+    model="gpt-4-turbo-preview",
+    system="You are a pitch deck expert who has helped raise millions for startups. Create compelling, investor-ready content.",
+    user="""
         Create a compelling 10-slide investor pitch deck for:
         
-        Business: {request.business_name}
-        Tagline: {request.tagline}
-        Problem: {request.problem}
-        Solution: {request.solution}
-        Target Market: {request.target_market}
-        Business Model: {request.business_model}
-        Competition: {request.competition}
-        Traction: {request.traction}
-        Team: {request.team}
-        Funding Ask: {request.funding_ask}
+        Business: {business_name}
+        Tagline: {tagline}
+        Problem: {problem}
+        Solution: {solution}
+        Target Market: {target_market}
+        Business Model: {business_model}
+        Competition: {competition}
+        Traction: {traction}
+        Team: {team}
+        Funding Ask: {funding_ask}
         
         Generate content for these 10 slides with compelling copy:
         
@@ -93,26 +102,234 @@ async def generate_pitch_deck(request: PitchDeckRequest):
         - Call-to-action or key takeaway
         
         Make it investor-ready, data-driven, and persuasive.
-        """
-        
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are a pitch deck expert who has helped raise millions for startups. Create compelling, investor-ready content."},
-                {"role": "user", "content": prompt}
-            ],
+        """,
+    max_tokens=3500,
+    max_input_tokens=6000
+)
+
+class Slide(BaseModel):
+    number: int
+    title: str
+    headline: str
+    bullets: List[str]
+    data_points: List[str] = []
+    takeaway: str = ""
+
+class PitchDeckContent(BaseModel):
+    slides: List[Slide]
+
+class SlideRegenerationRequest(BaseModel):
+    deck: PitchDeckRequest
+    slides: List[Slide]  # the deck as the client currently has it
+    number: int
+    instructions: Optional[str] = None
+
+# Same brief as PITCH_DECK_PROMPT, answered as one JSON object per slide
+PITCH_DECK_STRUCTURED_PROMPT = register_prompt(
+    "pitch_deck_structured",
+    model="gpt-4-turbo-preview",
+    system=PITCH_DECK_PROMPT.system,
+    user=PITCH_DECK_PROMPT.user + "\n" + schema_instructions(PitchDeckContent, "a JSON object holding one \"slides\" entry per slide, in order"),
+    max_tokens=3500,
+    max_input_tokens=6500
+)
+
+PITCH_DECK_SLIDE_PROMPT = register_prompt(
+    "pitch_deck_slide",
+    model="gpt-4-turbo-preview",
+    system=PITCH_DECK_PROMPT.system,
+    user="""
+        Rewrite one slide of the investor pitch deck for:
+        
+        Business: {business_name}
+        Tagline: {tagline}
+        Problem: {problem}
+        Solution: {solution}
+        Target Market: {target_market}
+        Business Model: {business_model}
+        Competition: {competition}
+        Traction: {traction}
+        Team: {team}
+        Funding Ask: {funding_ask}
+        
+        The deck currently reads:
+        {outline}
+        
+        Rewrite slide {number} ({title}) so it is sharper and more persuasive while staying consistent with the other slides.
+        {instructions}
+        """ + "\n" + schema_instructions(Slide),
+    max_tokens=800,
+    max_input_tokens=6000
+)
+
+def build_pitch_deck_prompt(request: PitchDeckRequest, structured: bool = False) -> RenderedPrompt:
+    template = PITCH_DECK_STRUCTURED_PROMPT if structured else PITCH_DECK_PROMPT
+    return template.render(**request.model_dump())
+
+def count_slides(pitch_deck_content: str) -> int:
+    return sum(1 for section in parse_document("pitch_deck", "", pitch_deck_content).sections if section.title)
+
+
+@register_job("pitch_deck", PitchDeckRequest)
+async def run_pitch_deck(request: PitchDeckRequest, llm: LLMGateway, model_router: ModelRouter, user_id: Optional[int] = None) -> dict:
+    """Generate a pitch deck outside a request, for the background job queue"""
+    prompt = build_pitch_deck_prompt(request)
+    route = await model_router.route_prompt("pitch_deck", user_id, prompt)
+    response = await llm.chat(
+        tool="pitch_deck",
+        user_id=user_id,
+        model=route.model,
+        messages=prompt.messages,
+        temperature=0.7,
+        max_tokens=route.max_tokens,
+        fallbacks=route.fallbacks,
+        timeout=route.timeout
+    )
+    pitch_deck_content = response.choices[0].message.content
+    await save_generated_content("pitch_deck", request.business_name, pitch_deck_content, user_id)
+    return {
+        "success": True,
+        "pitch_deck": pitch_deck_content,
+        "slide_count": count_slides(pitch_deck_content),
+        "tool": "pitch_deck_creator"
+    }
+
+@router.post("/generate-pitch-deck")
+async def generate_pitch_deck(
+    request: PitchDeckRequest,
+    background_tasks: BackgroundTasks,
+    stream: bool = False,
+    structured: bool = False,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Generate investor pitch deck content
+
+    With `structured=true` the deck comes back as a list of typed slides
+    (validated against the Slide schema) instead of one markdown text.
+    With `stream=true` it is sent as Server-Sent Events while it is being
+    generated: markdown as "token" events, structured decks as one "slide"
+    event per completed slide. The final "done" event carries the response
+    metadata. The deck is persisted after the response has been sent.
+    """
+    try:
+        prompt = build_pitch_deck_prompt(request, structured)
+        route = await model_router.route_prompt("pitch_deck", user_id, prompt)
+        params = {"response_format": JSON_RESPONSE_FORMAT} if structured else {}
+        
+        if stream:
+            chunks = llm.stream_chat(tool="pitch_deck", user_id=user_id, model=route.model, messages=prompt.messages, temperature=0.7, max_tokens=route.max_tokens, timeout=route.timeout, **params)
+            if structured:
+                def finalize_structured(text: str) -> dict:
+                    deck = parse_structured(text, PitchDeckContent)
+                    background_tasks.add_task(save_generated_content, "pitch_deck", request.business_name, deck.model_dump_json(), user_id)
+                    return {
+                        "success": True,
+                        "slide_count": len(deck.slides),
+                        "tool": "pitch_deck_creator"
+                    }
+                
+                return sse_items_response(chunks, StructuredStream(Slide).feed, finalize_structured, event="slide")
+            
+            def finalize(pitch_deck_content: str) -> dict:
+                background_tasks.add_task(save_generated_content, "pitch_deck", request.business_name, pitch_deck_content, user_id)
+                return {
+                    "success": True,
+                    "slide_count": count_slides(pitch_deck_content),
+                    "tool": "pitch_deck_creator"
+                }
+            
+            return sse_response(chunks, finalize)
+        
+        response = await llm.chat(
+            tool="pitch_deck",
+            user_id=user_id,
+            model=route.model,
+            messages=prompt.messages,
             temperature=0.7,
-            max_tokens=3500
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout,
+            **params
         )
         
         pitch_deck_content = response.choices[0].message.content
         
+        if structured:
+            deck = parse_structured(pitch_deck_content, PitchDeckContent)
+            background_tasks.add_task(save_generated_content, "pitch_deck", request.business_name, deck.model_dump_json(), user_id)
+            return {
+                "success": True,
+                "slides": [slide.model_dump() for slide in deck.slides],
+                "slide_count": len(deck.slides),
+                "tool": "pitch_deck_creator"
+            }
+        
+        background_tasks.add_task(save_generated_content, "pitch_deck", request.business_name, pitch_deck_content, user_id)
+        
         return {
             "success": True,
             "pitch_deck": pitch_deck_content,
-            "slide_count": 10,
+            "slide_count": count_slides(pitch_deck_content),
+            "tool": "pitch_deck_creator"
+        }
+        
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/regenerate-pitch-deck-slide")
+async def regenerate_pitch_deck_slide(
+    request: SlideRegenerationRequest,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Rewrite one slide of a structured deck, with the others as context
+
+    Costs one short completion instead of regenerating the whole deck.
+    """
+    current = next((slide for slide in request.slides if slide.number == request.number), None)
+    if current is None:
+        raise HTTPException(status_code=400, detail=f"The deck has no slide {request.number}")
+    try:
+        outline = "\n".join(
+            f"Slide {slide.number}: {slide.title} - {slide.headline} ({'; '.join(slide.bullets)})"
+            for slide in request.slides
+        )
+        prompt = PITCH_DECK_SLIDE_PROMPT.render(
+            **request.deck.model_dump(),
+            outline=outline,
+            number=current.number,
+            title=current.title,
+            instructions=request.instructions or ""
+        )
+        route = await model_router.route_prompt("pitch_deck", user_id, prompt)
+        response = await llm.chat(
+            tool="pitch_deck",
+            user_id=user_id,
+            model=route.model,
+            messages=prompt.messages,
+            temperature=0.7,
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout,
+            response_format=JSON_RESPONSE_FORMAT
+        )
+        slide = parse_structured(response.choices[0].message.content, Slide)
+        return {
+            "success": True,
+            "slide": slide.model_copy(update={"number": current.number}).model_dump(),
             "tool": "pitch_deck_creator"
         }
         
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,11 +1,34 @@
-from openai import AsyncOpenAI
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-import os
+import json
+from datetime import date
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query
+from pydantic import BaseModel, Field
+from typing import List, Optional, Sequence
+
+from app.core.identity import get_user_id
+from app.core.llm import LLMGateway, get_llm
+from app.core.prompts import PromptTooLarge, register_prompt
+from app.core.resilience import UpstreamError
+from app.core.routing import ModelRouter, get_model_router
+from app.database import save_generated_content
+from app.engines.scheduler import QUADRANTS, RankedTask, WorkWeek, parse_deadline, rank_tasks, schedule_tasks
 
 router = APIRouter()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Most tasks the LLM is asked to explain; everything else is pure arithmetic
+MAX_NARRATED = 20
+
+NARRATION_PROMPT = register_prompt(
+    "task_narration",
+    model="gpt-4-turbo-preview",
+    system="You are a productivity expert and time management coach.",
+    user="""A scheduling engine produced this {what} for {total} tasks. The top {count} are:
+
+{lines}
+
+Briefly explain, task by task, why each is placed where it is, and give one or two practical tips for getting through them. Do not reorder the tasks.""",
+    max_tokens=800,
+    max_input_tokens=6000
+)
 
 class Task(BaseModel):
     title: str
@@ -17,105 +40,132 @@ class Task(BaseModel):
 class TaskList(BaseModel):
     tasks: List[Task]
 
+class ScheduleRequest(TaskList):
+    start_date: Optional[str] = None  # ISO date; today when omitted
+    days: int = Field(default=5, ge=1, le=366)  # working days to plan
+    day_start: str = Field(default="09:00", pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
+    day_end: str = Field(default="18:00", pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
+
+
+async def narrate(
+    llm: LLMGateway,
+    model_router: ModelRouter,
+    user_id: Optional[int],
+    tasks: Sequence[Task],
+    ranked: Sequence[RankedTask],
+    count: int,
+    what: str
+) -> str:
+    """Ask the LLM to explain the engine's ordering of the top `count` tasks"""
+    lines = []
+    for item in ranked[:count]:
+        task = tasks[item.index]
+        detail = f" - {task.description}" if task.description else ""
+        lines.append(
+            f"{item.rank}. {item.title}{detail} (quadrant: {item.quadrant}, priority: {item.priority}, "
+            f"deadline: {item.deadline or 'none'}, est. hours: {item.hours}, WSJF score: {item.score})"
+        )
+    prompt = NARRATION_PROMPT.render(what=what, total=len(ranked), count=len(lines), lines="\n".join(lines))
+    route = await model_router.route_prompt("task_manager", user_id, prompt)
+    response = await llm.chat(
+        tool="task_manager",
+        user_id=user_id,
+        model=route.model,
+        messages=prompt.messages,
+        temperature=0.6,
+        max_tokens=route.max_tokens,
+        fallbacks=route.fallbacks,
+        timeout=route.timeout
+    )
+    return response.choices[0].message.content
+
+
 @router.post("/prioritize-tasks")
-async def prioritize_tasks(request: TaskList):
-    """AI-powered task prioritization"""
+async def prioritize_tasks(
+    request: TaskList,
+    background_tasks: BackgroundTasks,
+    narrate_top: int = Query(0, alias="narrate", ge=0, le=MAX_NARRATED),
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Rank tasks by Eisenhower quadrant and weighted shortest job first
+
+    Ranking is computed locally; pass `narrate=N` to have the LLM explain
+    the ordering of the top N tasks.
+    """
     try:
-        tasks_text = "\n".join([
-            f"- {task.title} (Deadline: {task.deadline or 'None'}, Priority: {task.priority}, Est. Hours: {task.estimated_hours or 'Unknown'})"
-            for task in request.tasks
-        ])
-        
-        prompt = f"""
-        Analyze and prioritize these tasks using the Eisenhower Matrix and other productivity frameworks:
-        
-        {tasks_text}
-        
-        Provide:
-        1. Prioritized Task List (with reasoning)
-        2. Task Categories:
-           - URGENT & IMPORTANT (Do First)
-           - IMPORTANT but NOT URGENT (Schedule)
-           - URGENT but NOT IMPORTANT (Delegate if possible)
-           - NEITHER (Eliminate or Do Later)
-        3. Suggested Schedule (when to do each task)
-        4. Time Management Tips
-        5. Tasks that can be batched together
-        6. Recommended focus order for maximum productivity
-        
-        Consider deadlines, estimated time, and stated priorities.
-        """
-        
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are a productivity expert and time management coach."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.6,
-            max_tokens=1500
-        )
-        
-        prioritization = response.choices[0].message.content
-        
-        return {
+        ranked = rank_tasks(request.tasks)
+        quadrants = {quadrant: [] for quadrant in QUADRANTS}
+        for item in ranked:
+            quadrants[item.quadrant].append(item.index)
+
+        result = {
             "success": True,
-            "prioritization": prioritization,
+            "tasks": [item.to_dict() for item in ranked],
+            "quadrants": quadrants,
             "task_count": len(request.tasks),
             "tool": "task_manager_ai"
         }
-        
+        if narrate_top and ranked:
+            result["rationale"] = await narrate(llm, model_router, user_id, request.tasks, ranked, narrate_top, "priority ranking")
+
+        background_tasks.add_task(save_generated_content, "task_manager", "Task prioritization", json.dumps(result), user_id)
+
+        return result
+
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/generate-schedule")
-async def generate_schedule(request: TaskList):
-    """Generate optimized daily/weekly schedule"""
+async def generate_schedule(
+    request: ScheduleRequest,
+    background_tasks: BackgroundTasks,
+    narrate_top: int = Query(0, alias="narrate", ge=0, le=MAX_NARRATED),
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Pack ranked tasks into 90-minute focus blocks across the working days
+
+    Blocks are placed locally, highest ranked first; pass `narrate=N` to
+    have the LLM explain the placement of the top N tasks.
+    """
+    start = date.today()
+    if request.start_date:
+        start = parse_deadline(request.start_date)
+        if start is None:
+            raise HTTPException(status_code=400, detail="start_date must be an ISO date")
+    if request.day_end <= request.day_start:
+        raise HTTPException(status_code=400, detail="day_end must be after day_start")
     try:
-        tasks_text = "\n".join([
-            f"- {task.title} ({task.estimated_hours or 2}h)"
-            for task in request.tasks
-        ])
-        
-        prompt = f"""
-        Create an optimized schedule for these tasks:
-        
-        {tasks_text}
-        
-        Assumptions:
-        - Work day: 9 AM to 6 PM (with 1h lunch)
-        - Focus blocks: 90-minute deep work sessions
-        - Include breaks every 2 hours
-        - Most important tasks in morning (peak productivity)
-        
-        Provide:
-        1. Day-by-day schedule
-        2. Time blocking suggestions
-        3. Energy level considerations
-        4. Buffer time for unexpected items
-        5. Review/reflection time
-        
-        Format as a clear weekly calendar.
-        """
-        
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are a scheduling expert who creates realistic, productive schedules."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.6,
-            max_tokens=1200
-        )
-        
-        schedule = response.choices[0].message.content
-        
-        return {
+        ranked = rank_tasks(request.tasks, today=start)
+        week = WorkWeek.from_clock(request.day_start, request.day_end)
+        schedule = schedule_tasks(ranked, start, request.days, week)
+
+        result = {
             "success": True,
-            "schedule": schedule,
+            "schedule": schedule.to_dict(),
+            "start_date": start.isoformat(),
+            "days": request.days,
+            "task_count": len(request.tasks),
             "tool": "task_manager_ai"
         }
-        
+        if narrate_top and ranked:
+            result["rationale"] = await narrate(llm, model_router, user_id, request.tasks, ranked, narrate_top, "weekly schedule")
+
+        background_tasks.add_task(save_generated_content, "task_manager", "Schedule", json.dumps(result), user_id)
+
+        return result
+
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
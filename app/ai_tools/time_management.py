@@ -1,11 +1,22 @@
-from openai import AsyncOpenAI
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List
-import os
+import json
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
+
+from app.core.identity import get_user_id
+from app.core.llm import LLMGateway, get_llm
+from app.core.prompts import PromptTooLarge, register_prompt
+from app.core.resilience import UpstreamError
+from app.core.routing import ModelRouter, get_model_router
+from app.database import save_generated_content
+from app.engines.calendar import analyse_calendar
+from app.engines.scheduler import WorkWeek
 
 router = APIRouter()
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Longest range a single calendar request may cover
+MAX_CALENDAR_DAYS = 92
 
 class WorkPattern(BaseModel):
     typical_work_hours: str
@@ -13,17 +24,39 @@ class WorkPattern(BaseModel):
     common_distractions: List[str]
     goals: str
 
-@router.post("/analyze-time-usage")
-async def analyze_time_usage(request: WorkPattern):
-    """Analyze work patterns and suggest improvements"""
-    try:
-        prompt = f"""
+class Meeting(BaseModel):
+    title: str = "Meeting"
+    start: datetime
+    end: datetime
+
+    @model_validator(mode="after")
+    def check_order(self):
+        if self.end <= self.start:
+            raise ValueError("end must be after start")
+        return self
+
+class CalendarRequest(BaseModel):
+    meetings: List[Meeting] = Field(default_factory=list, max_length=20000)
+    work_style: Literal["maker", "manager", "mixed"] = "mixed"
+    start_date: Optional[date] = None  # first day planned; defaults to the first meeting's day, or today
+    end_date: Optional[date] = None  # last day planned; defaults to the last meeting's day, or a week on
+    day_start: str = Field(default="09:00", pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
+    day_end: str = Field(default="18:00", pattern=r"^([01]\d|2[0-3]):[0-5]\d$")
+    buffer_minutes: int = Field(default=10, ge=0, le=60)  # kept free either side of a meeting
+    include_weekends: bool = False
+
+TIME_USAGE_PROMPT = register_prompt(
+    "time_usage",
+    model="gpt-4-turbo-preview",
+    system="You are a time management coach specializing in productivity optimization for founders and executives.",
+    user="""
         Analyze this work pattern and provide time management recommendations:
         
-        Work Hours: {request.typical_work_hours}
-        Main Responsibilities: {', '.join(request.main_responsibilities)}
-        Common Distractions: {', '.join(request.common_distractions)}
-        Goals: {request.goals}
+        Work Hours: {typical_work_hours}
+        Work Hours: {typical_work_hours}
+        Main Responsibilities: {responsibilities}
+        Common Distractions: {distractions}
+        Goals: {goals}
         
         Provide:
         1. Time Audit Analysis
@@ -38,73 +71,146 @@ async def analyze_time_usage(request: WorkPattern):
         10. Key Metrics to Track
         
         Be specific and actionable.
-        """
-        
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are a time management coach specializing in productivity optimization for founders and executives."},
-                {"role": "user", "content": prompt}
-            ],
+        """,
+    max_tokens=2000,
+    max_input_tokens=4000
+)
+
+CALENDAR_COMMENTARY_PROMPT = register_prompt(
+    "calendar_commentary",
+    model="gpt-4-turbo-preview",
+    system="You are a calendar optimization expert.",
+    user="""
+            A calendar analysis for a {work_style} work style from {start} to {end} found:
+
+            Meetings: {meeting_count} ({meeting_hours}h within working hours)
+            Double bookings: {conflict_count}
+            Free time: {free_hours}h
+            Proposed maker (deep work) time: {maker_hours}h, longest block {longest_maker_minutes} minutes
+            Proposed manager (meeting-ready) time: {manager_hours}h
+
+            Give brief, specific advice: how to resolve the double bookings, how to protect the
+            maker blocks, meeting guidelines, and calendar rules to follow. Do not propose a new calendar.
+            """,
+    max_tokens=800
+)
+
+@router.post("/analyze-time-usage")
+async def analyze_time_usage(
+    request: WorkPattern,
+    background_tasks: BackgroundTasks,
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Analyze work patterns and suggest improvements"""
+    try:
+        prompt = TIME_USAGE_PROMPT.render(
+            typical_work_hours=request.typical_work_hours,
+            responsibilities=', '.join(request.main_responsibilities),
+            distractions=', '.join(request.common_distractions),
+            goals=request.goals
+        )
+        route = await model_router.route_prompt("time_management", user_id, prompt)
+        response = await llm.chat(
+            tool="time_management",
+            user_id=user_id,
+            model=route.model,
+            messages=prompt.messages,
             temperature=0.6,
-            max_tokens=2000
+            max_tokens=route.max_tokens,
+            fallbacks=route.fallbacks,
+            timeout=route.timeout
         )
         
         analysis = response.choices[0].message.content
         
+        background_tasks.add_task(save_generated_content, "time_management", "Time usage analysis", analysis, user_id)
+        
         return {
             "success": True,
             "analysis": analysis,
             "tool": "time_management_ai"
         }
         
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/calendar-optimization")
-async def optimize_calendar(request: dict):
-    """Optimize calendar and suggest time blocks"""
+async def optimize_calendar(
+    request: CalendarRequest,
+    background_tasks: BackgroundTasks,
+    commentary: bool = Query(False),
+    llm: LLMGateway = Depends(get_llm),
+    model_router: ModelRouter = Depends(get_model_router),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Find calendar conflicts and free time, and propose maker/manager blocks
+
+    The analysis is computed locally; pass `commentary=true` to have the
+    LLM add advice based on its summary.
+    """
+    # Times are read as wall-clock in the first timezone given; naive times are taken as-is
+    tz = next((m.start.tzinfo for m in request.meetings if m.start.tzinfo), None)
+
+    def local(value: datetime) -> datetime:
+        return value.astimezone(tz).replace(tzinfo=None) if value.tzinfo else value
+
+    events = [(local(m.start), local(m.end)) for m in request.meetings]
+    start = request.start_date or (min(s for s, _ in events).date() if events else date.today())
+    end = request.end_date or (max(e for _, e in events).date() if events else start + timedelta(days=6))
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    if (end - start).days >= MAX_CALENDAR_DAYS:
+        raise HTTPException(status_code=400, detail=f"A calendar request may cover at most {MAX_CALENDAR_DAYS} days")
+    if request.day_end <= request.day_start:
+        raise HTTPException(status_code=400, detail="day_end must be after day_start")
     try:
-        meetings = request.get("meetings", [])
-        work_style = request.get("work_style", "mixed")  # maker, manager, mixed
-        
-        prompt = f"""
-        Optimize this calendar for maximum productivity:
-        
-        Current Meetings: {len(meetings)} per week
-        Work Style: {work_style}
-        
-        Provide:
-        1. Ideal Weekly Calendar Template
-        2. Focus Time Blocks (when to schedule deep work)
-        3. Meeting Guidelines (when to schedule, how long)
-        4. Buffer Time Recommendations
-        5. Day Themes (e.g., Monday = Strategy, Tuesday = Execution)
-        6. Break Schedule
-        7. No-Meeting Zones
-        8. Calendar Rules to Follow
-        
-        Optimize for energy levels and productivity patterns.
-        """
-        
-        response = await client.chat.completions.create(
-            model="gpt-4-turbo-preview",
-            messages=[
-                {"role": "system", "content": "You are a calendar optimization expert."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.6,
-            max_tokens=1500
-        )
-        
-        optimization = response.choices[0].message.content
-        
-        return {
+        week = WorkWeek.from_clock(request.day_start, request.day_end, weekends=request.include_weekends)
+        plan = analyse_calendar(events, start, end, request.work_style, week, request.buffer_minutes)
+
+        result = {
             "success": True,
-            "optimization": optimization,
+            **plan.to_dict(),
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "work_style": request.work_style,
+            "meeting_count": len(events),
             "tool": "time_management_ai"
         }
-        
+
+        if commentary:
+            prompt = CALENDAR_COMMENTARY_PROMPT.render(
+                **plan.summary,
+                work_style=request.work_style,
+                start=start,
+                end=end,
+                meeting_count=len(events),
+                conflict_count=plan.conflict_count
+            )
+            route = await model_router.route_prompt("time_management", user_id, prompt)
+            response = await llm.chat(
+                tool="time_management",
+                user_id=user_id,
+                model=route.model,
+                messages=prompt.messages,
+                temperature=0.6,
+                max_tokens=route.max_tokens,
+                fallbacks=route.fallbacks,
+                timeout=route.timeout
+            )
+            result["commentary"] = response.choices[0].message.content
+
+        background_tasks.add_task(save_generated_content, "time_management", "Calendar optimization", json.dumps(result), user_id)
+
+        return result
+
+    except UpstreamError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from fastapi import Request
+from sqlalchemy import select, update
+
+from app.models import ChatbotConfigRecord
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(text: str) -> str:
+    return " ".join(text.lower().strip(" ?!.").split())
+
+
+def config_version(updated_at: Optional[datetime]) -> int:
+    """Changes whenever a config is saved: its updated_at in microseconds"""
+    return int(updated_at.timestamp() * 1_000_000) if updated_at else 0
+
+
+@dataclass(frozen=True)
+class CompiledBot:
+    """Everything chatbot_respond needs, prepared once per config"""
+    config_id: int
+    bot_name: str
+    tone: str
+    language: str
+    system_message: dict  # ready-to-send {"role": "system", ...}
+    sample_answers: Dict[str, str]  # normalised question -> answer
+    version: int = 0
+
+    @property
+    def cache_namespace(self) -> str:
+        """Semantic cache namespace; a new version starts empty, so stale replies are never served"""
+        return f"bot:{self.config_id}:{self.version}"
+
+    @classmethod
+    def from_record(cls, record: ChatbotConfigRecord) -> "CompiledBot":
+        samples = json.loads(record.sample_responses or "{}")
+        return cls(
+            config_id=record.id,
+            bot_name=record.bot_name,
+            tone=record.tone,
+            language=record.language,
+            system_message={"role": "system", "content": record.system_prompt},
+            sample_answers={normalize_question(q): a for q, a in samples.items()},
+            version=config_version(record.updated_at),
+        )
+
+
+class BotRegistry:
+    """In-process LRU of compiled chatbot configs keyed by bot_config_id.
+
+    A respond call is usually a dictionary lookup. Cached bots are
+    revalidated against their stored version (updated_at) at most every
+    `revalidate_after` seconds, so an update made through any worker
+    reaches every worker within that time; only a changed or missing bot
+    reads the whole chatbot_configs row. Listeners are told about each
+    replaced bot, e.g. to drop its semantic cache namespace. Use counts are
+    accumulated in memory and flushed on shutdown so the hottest bots can be
+    preloaded by warm_up() on the next start.
+    """
+
+    def __init__(self, session_factory, capacity: int = 1000, revalidate_after: float = 5.0):
+        self.session_factory = session_factory
+        self.capacity = capacity
+        self.revalidate_after = revalidate_after
+        self._bots: "OrderedDict[int, CompiledBot]" = OrderedDict()
+        self._checked: Dict[int, float] = {}  # config_id -> monotonic time of the last version check
+        self._uses: Dict[int, int] = defaultdict(int)
+        self._listeners: List[Callable[[CompiledBot], None]] = []
+
+    @classmethod
+    def from_env(cls, session_factory) -> "BotRegistry":
+        return cls(
+            session_factory,
+            capacity=int(os.getenv("CHATBOT_CACHE_SIZE", "1000")),
+            revalidate_after=float(os.getenv("CHATBOT_REVALIDATE_SECONDS", "5")),
+        )
+
+    def add_listener(self, listener: Callable[[CompiledBot], None]):
+        """Register a callback invoked with each cached bot that turns out to be stale"""
+        self._listeners.append(listener)
+
+    def _put(self, bot: CompiledBot):
+        previous = self._bots.get(bot.config_id)
+        self._bots[bot.config_id] = bot
+        self._bots.move_to_end(bot.config_id)
+        self._checked[bot.config_id] = time.monotonic()
+        while len(self._bots) > self.capacity:
+            evicted, _ = self._bots.popitem(last=False)
+            self._checked.pop(evicted, None)
+        if previous is not None and previous.version != bot.version:
+            self._replaced(previous)
+
+    def _replaced(self, bot: CompiledBot):
+        for listener in self._listeners:
+            try:
+                listener(bot)
+            except Exception:
+                logger.exception("Chatbot registry listener failed")
+
+    async def get(self, config_id: int) -> Optional[CompiledBot]:
+        self._uses[config_id] += 1
+        bot = self._bots.get(config_id)
+        if bot is not None:
+            self._bots.move_to_end(config_id)
+            if time.monotonic() - self._checked.get(config_id, 0.0) < self.revalidate_after:
+                return bot
+        async with self.session_factory() as session:
+            if bot is not None:
+                updated_at = await session.scalar(
+                    select(ChatbotConfigRecord.updated_at).where(ChatbotConfigRecord.id == config_id)
+                )
+                if updated_at is not None and config_version(updated_at) == bot.version:
+                    self._checked[config_id] = time.monotonic()
+                    return bot
+            record = await session.get(ChatbotConfigRecord, config_id)
+        if record is None:
+            self._uses.pop(config_id, None)
+            self.invalidate(config_id)
+            return None
+        bot = CompiledBot.from_record(record)
+        self._put(bot)
+        return bot
+
+    def add(self, record: ChatbotConfigRecord) -> CompiledBot:
+        """Compile a freshly written config straight into the cache"""
+        bot = CompiledBot.from_record(record)
+        self._put(bot)
+        return bot
+
+    def invalidate(self, config_id: int):
+        bot = self._bots.pop(config_id, None)
+        self._checked.pop(config_id, None)
+        if bot is not None:
+            self._replaced(bot)
+
+    async def warm_up(self, limit: int):
+        """Preload the most used configs"""
+        if limit <= 0:
+            return
+        async with self.session_factory() as session:
+            records = await session.scalars(
+                select(ChatbotConfigRecord).order_by(ChatbotConfigRecord.use_count.desc()).limit(limit)
+            )
+            for record in records:
+                self._put(CompiledBot.from_record(record))
+
+    async def flush_use_counts(self):
+        uses, self._uses = self._uses, defaultdict(int)
+        if not uses:
+            return
+        try:
+            async with self.session_factory() as session:
+                for config_id, count in uses.items():
+                    await session.execute(
+                        update(ChatbotConfigRecord)
+                        .where(ChatbotConfigRecord.id == config_id)
+                        # Keep updated_at: it is the config version, and counting uses is not a change
+                        .values(use_count=ChatbotConfigRecord.use_count + count,
+                                updated_at=ChatbotConfigRecord.updated_at)
+                    )
+                await session.commit()
+        except Exception:
+            logger.exception("Failed to persist chatbot use counts")
+
+
+def get_bot_registry(request: Request) -> BotRegistry:
+    """FastAPI dependency returning the chatbot registry created in the app lifespan"""
+    return request.app.state.bots
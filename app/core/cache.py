@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Sequence, Tuple
+
+from fastapi import Header, Request
+
+from app.core.metrics import CACHE_LOOKUPS
+
+
+def cache_key(tool: str, model: str, messages: list, temperature: float, max_tokens: int,
+              response_format: Optional[dict] = None) -> str:
+    """Content address of a completion request.
+
+    The payload is serialised canonically (sorted keys, no whitespace) so the
+    same logical request always hashes to the same key.
+    """
+    request = {
+        "tool": tool,
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if response_format:
+        # Only when set, so keys of free-text requests stay as they were
+        request["response_format"] = response_format
+    payload = json.dumps(
+        request,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """In-process LRU cache with TTL, bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._bytes = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: str):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._bytes += len(value)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    async def aclose(self):
+        self._entries.clear()
+        self._bytes = 0
+
+
+class SQLiteCache:
+    """Cache stored in a SQLite file so every gunicorn worker shares it.
+
+    Entries carry an expiry and a last-access timestamp; once the table grows
+    past `max_entries` the least recently used rows are deleted.
+    """
+
+    def __init__(self, path: str = "response_cache.db", max_entries: int = 10000, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_response_cache_accessed_at ON response_cache (accessed_at)"
+        )
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def _set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl, now),
+            )
+            self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: str):
+        await asyncio.to_thread(self._set, key, value)
+
+    async def aclose(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_cache_from_env():
+    """Pick the cache backend from RESPONSE_CACHE_BACKEND (memory or sqlite)"""
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+    max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+    if os.getenv("RESPONSE_CACHE_BACKEND", "memory") == "sqlite":
+        return SQLiteCache(
+            path=os.getenv("RESPONSE_CACHE_PATH", "response_cache.db"),
+            max_entries=max_entries,
+            ttl=ttl,
+        )
+    return MemoryCache(
+        max_entries=max_entries,
+        max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=ttl,
+    )
+
+
+def get_cache(request: Request):
+    """FastAPI dependency returning the response cache created in the app lifespan"""
+    return request.app.state.cache
+
+
+def cache_bypass(x_cache_bypass: Optional[str] = Header(None)) -> bool:
+    """True when the client sent `X-Cache-Bypass: 1` to force regeneration"""
+    return (x_cache_bypass or "").lower() in ("1", "true", "yes")
+
+
+async def cached_chat(llm, cache, tool: str, model: str, messages: list, temperature: float,
+                      max_tokens: int, bypass: bool = False, user_id: Optional[int] = None,
+                      fallbacks: Sequence[str] = (), timeout: Optional[float] = None,
+                      response_format: Optional[dict] = None,
+                      validate: Optional[Callable[[str], Any]] = None) -> Tuple[str, bool]:
+    """Return (content, cache_hit) for a chat completion, filling the cache on a miss.
+
+    Only complete answers are cached: not ones cut off by max_tokens (a
+    finish_reason other than "stop"), not ones from a fallback model (so the
+    next identical request gets another chance at `model`), and not ones
+    `validate` rejects. `validate` runs on every miss and its exception
+    propagates, so e.g. truncated JSON fails this request only.
+    """
+    key = cache_key(tool, model, messages, temperature, max_tokens, response_format)
+    if not bypass:
+        cached = await cache.get(key)
+        CACHE_LOOKUPS.inc("response", tool, "miss" if cached is None else "hit")
+        if cached is not None:
+            return cached, True
+    params = {"response_format": response_format} if response_format else {}
+    response, served_by = await llm.chat_with_fallbacks(
+        [model, *fallbacks], messages, tool=tool, user_id=user_id, timeout=timeout,
+        temperature=temperature, max_tokens=max_tokens, **params
+    )
+    content = response.choices[0].message.content
+    if validate is not None:
+        validate(content)
+    if served_by == model and response.choices[0].finish_reason == "stop":
+        await cache.set(key, content)
+    return content, False
+
+
+class CachedStream:
+    """Async iterator over completion deltas backed by the response cache.
+
+    A hit replays the cached text as a single delta; a miss streams from the
+    gateway and stores the full text once the stream has finished with
+    finish_reason "stop" and passed `validate` (a stream that is closed
+    early, truncated or invalid is never stored). `hit` is known after the
+    first delta has been produced.
+    """
+
+    def __init__(self, llm, cache, tool: str, model: str, messages: list, temperature: float,
+                 max_tokens: int, bypass: bool = False, user_id: Optional[int] = None,
+                 timeout: Optional[float] = None, response_format: Optional[dict] = None,
+                 validate: Optional[Callable[[str], Any]] = None):
+        self.llm = llm
+        self.cache = cache
+        self.tool = tool
+        self.user_id = user_id
+        self.model = model
+        self.messages = messages
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.bypass = bypass
+        self.timeout = timeout
+        self.response_format = response_format
+        self.validate = validate
+        self.key = cache_key(tool, model, messages, temperature, max_tokens, response_format)
+        self.hit = False
+        self.finish_reason: Optional[str] = None
+
+    async def __aiter__(self):
+        if not self.bypass:
+            cached = await self.cache.get(self.key)
+            CACHE_LOOKUPS.inc("response", self.tool, "miss" if cached is None else "hit")
+            if cached is not None:
+                self.hit = True
+                yield cached
+                return
+        parts = []
+        params = {"response_format": self.response_format} if self.response_format else {}
+        async for delta in self.llm.stream_chat(
+            model=self.model, messages=self.messages, tool=self.tool, user_id=self.user_id,
+            temperature=self.temperature, max_tokens=self.max_tokens, timeout=self.timeout,
+            on_finish=self._finished, **params
+        ):
+            parts.append(delta)
+            yield delta
+        if self.finish_reason != "stop":
+            return
+        content = "".join(parts)
+        if self.validate is not None:
+            try:
+                self.validate(content)
+            except Exception:
+                # The consumer parses the same text and reports the error itself
+                return
+        await self.cache.set(self.key, content)
+
+    def _finished(self, finish_reason: Optional[str]):
+        self.finish_reason = finish_reason
@@ -0,0 +1,304 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Callable, List, Optional, TypeVar
+
+from fastapi import APIRouter, Request
+
+from app.core.prompts import MESSAGE_OVERHEAD, count_tokens
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+T = TypeVar("T")
+
+
+def message_tokens(message: dict) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+@dataclass
+class Conversation:
+    session_id: str
+    bot_config_id: Optional[int] = None
+    summary: str = ""
+    turns: List[dict] = field(default_factory=list)  # {"role", "content"} oldest first
+    updated_at: float = field(default_factory=time.time)
+    version: int = 0  # bumped by every write; 0 means not stored yet
+
+
+class ConversationStore:
+    """Chat history per session with a hot in-memory tier and a SQLite cold tier.
+
+    Recently active conversations live in an LRU bounded by `hot_capacity`;
+    every change is written through to SQLite, so eviction is just a drop and
+    a conversation survives restarts and moves between workers. Each row
+    carries a version: a hot copy is only used while its version matches
+    the stored one, and writes are read-modify-write transactions that
+    append to the stored turns, so several workers serving one session
+    never overwrite each other's turns. A write builds the new state as a
+    copy and only replaces the hot copy once the transaction has committed.
+    Histories are kept small by compact(), which folds turns that no longer
+    fit the token budget into a running summary, and sessions idle for
+    longer than `retention_seconds` are deleted.
+    """
+
+    def __init__(self, path: str = "conversations.db", hot_capacity: int = 2000,
+                 token_budget: int = 2000, summary_model: str = "gpt-3.5-turbo",
+                 retention_seconds: float = 30 * 86400, prune_interval: float = 3600):
+        self.hot_capacity = hot_capacity
+        self.token_budget = token_budget
+        self.summary_model = summary_model
+        self.retention_seconds = retention_seconds
+        self.prune_interval = prune_interval
+        self._hot: "OrderedDict[str, Conversation]" = OrderedDict()
+        # Independent of the hot tier: a lock lives exactly as long as someone holds or awaits it
+        self._session_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations ("
+            "session_id TEXT PRIMARY KEY, bot_config_id INTEGER, summary TEXT NOT NULL, "
+            "turns TEXT NOT NULL, updated_at REAL NOT NULL, version INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(conversations)")}
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE conversations ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at)")
+        self.turns_served = 0
+        self.prompt_tokens_served = 0
+        self.compactions = 0
+
+    @classmethod
+    def from_env(cls) -> "ConversationStore":
+        return cls(
+            path=os.getenv("CONVERSATION_DB_PATH", "conversations.db"),
+            hot_capacity=int(os.getenv("CONVERSATION_HOT_SESSIONS", "2000")),
+            token_budget=int(os.getenv("CONVERSATION_TOKEN_BUDGET", "2000")),
+            summary_model=os.getenv("CONVERSATION_SUMMARY_MODEL", "gpt-3.5-turbo"),
+            retention_seconds=float(os.getenv("CONVERSATION_RETENTION_DAYS", "30")) * 86400,
+        )
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    def _remember(self, conversation: Conversation):
+        self._hot[conversation.session_id] = conversation
+        self._hot.move_to_end(conversation.session_id)
+        while len(self._hot) > self.hot_capacity:
+            self._hot.popitem(last=False)
+
+    def _transaction(self, work: Callable[[], T]) -> T:
+        """Run `work` in a write transaction, so workers sharing the file take turns"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def _select(self, session_id: str) -> Optional[Conversation]:
+        row = self._conn.execute(
+            "SELECT bot_config_id, summary, turns, updated_at, version FROM conversations WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return Conversation(session_id, row[0], row[1], json.loads(row[2]), row[3], row[4])
+
+    def _store(self, conversation: Conversation, **changes) -> Conversation:
+        """Write `conversation` with `changes` as its next version; returns that new copy"""
+        stored = replace(conversation, **changes, updated_at=time.time(), version=conversation.version + 1)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO conversations (session_id, bot_config_id, summary, turns, updated_at, version) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (stored.session_id, stored.bot_config_id, stored.summary,
+             json.dumps(stored.turns), stored.updated_at, stored.version),
+        )
+        return stored
+
+    def _load(self, session_id: str, hot: Optional[Conversation]) -> Optional[Conversation]:
+        """The stored conversation, reusing `hot` when it is still current"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM conversations WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if hot is not None and hot.version == row[0]:
+                return hot
+            return self._select(session_id)
+
+    def _append(self, conversation: Conversation, turns: List[dict]) -> Conversation:
+        def work():
+            stored = self._select(conversation.session_id)
+            # Another worker wrote since this copy was read: append to its history instead
+            current = stored if stored is not None and stored.version != conversation.version else conversation
+            return self._store(current, turns=current.turns + turns)
+        return self._transaction(work)
+
+    def _apply_summary(self, session_id: str, summary: str, folded: List[dict], new_summary: str) -> Optional[Conversation]:
+        def work():
+            stored = self._select(session_id)
+            # Applies only if the summarised turns are still the oldest ones and no one re-summarised
+            if stored is None or stored.summary != summary or stored.turns[:len(folded)] != folded:
+                return None
+            return self._store(stored, summary=new_summary, turns=stored.turns[len(folded):])
+        return self._transaction(work)
+
+    def _prune(self, cutoff: float) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM conversations WHERE updated_at < ?", (cutoff,)).rowcount
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """Serialises turns of one session so history is appended in order"""
+        lock = self._session_locks.get(session_id)
+        if lock is None:
+            lock = self._session_locks[session_id] = asyncio.Lock()
+        return lock
+
+    async def get(self, session_id: str, bot_config_id: Optional[int] = None) -> Conversation:
+        """Load a conversation, hot tier first; unknown ids start empty.
+
+        A session id that belongs to another bot is not reused: the caller
+        gets a new, empty conversation under a fresh session id.
+        """
+        conversation = await asyncio.to_thread(self._load, session_id, self._hot.get(session_id))
+        if conversation is None:
+            conversation = Conversation(session_id, bot_config_id)
+        elif conversation.bot_config_id != bot_config_id:
+            conversation = Conversation(self.new_session_id(), bot_config_id)
+        self._remember(conversation)
+        return conversation
+
+    async def append(self, conversation: Conversation, *turns: dict) -> Conversation:
+        """Store new turns; returns the conversation as stored, a new copy"""
+        stored = await asyncio.to_thread(self._append, conversation, list(turns))
+        self._remember(stored)
+        if stored.updated_at - self._pruned_at > self.prune_interval:
+            self._pruned_at = stored.updated_at
+            pruned = await asyncio.to_thread(self._prune, stored.updated_at - self.retention_seconds)
+            if pruned:
+                logger.info("Deleted %d conversations idle for over %gs", pruned, self.retention_seconds)
+        return stored
+
+    def build_messages(self, system_message: dict, conversation: Conversation, message: str) -> List[dict]:
+        """Prompt for the next turn, kept under the token budget.
+
+        Always includes the system message, the running summary and the new
+        message, then as many of the most recent turns as still fit. Turns
+        that do not fit are left for compact() to summarise.
+        """
+        user_message = {"role": "user", "content": message}
+        head = [system_message]
+        if conversation.summary:
+            head.append({"role": "system", "content": f"Summary of the earlier conversation: {conversation.summary}"})
+        used = sum(message_tokens(m) for m in head) + message_tokens(user_message)
+        window: List[dict] = []
+        for turn in reversed(conversation.turns):
+            cost = message_tokens(turn)
+            if used + cost > self.token_budget:
+                break
+            window.append(turn)
+            used += cost
+        window.reverse()
+        self.turns_served += 1
+        self.prompt_tokens_served += used
+        return head + window + [user_message]
+
+    def _overflow(self, conversation: Conversation) -> int:
+        """Number of oldest turns to fold into the summary.
+
+        Compaction keeps the recent turns within half the budget so it runs
+        every few turns rather than on every one.
+        """
+        total = count_tokens(conversation.summary) + sum(message_tokens(t) for t in conversation.turns)
+        if total <= self.token_budget:
+            return 0
+        kept = 0
+        for index in range(len(conversation.turns) - 1, -1, -1):
+            kept += message_tokens(conversation.turns[index])
+            if kept > self.token_budget // 2:
+                return index + 1
+        return 0
+
+    async def compact(self, llm, conversation: Conversation, user_id: Optional[int] = None):
+        """Summarise the turns that overflow the budget; meant to run after the reply.
+
+        The session lock is only held to take a snapshot and to apply the
+        result, never across the LLM call, so new turns are not held up.
+        """
+        session_id = conversation.session_id
+        async with self.lock(session_id):
+            count = self._overflow(conversation)
+            if not count:
+                return
+            summary = conversation.summary
+            folded = conversation.turns[:count]
+        transcript = "\n".join(f"{t['role']}: {t['content']}" for t in folded)
+        try:
+            response = await llm.chat(
+                tool="conversation_summary",
+                user_id=user_id,
+                model=self.summary_model,
+                messages=[
+                    {"role": "system", "content": "Summarize this customer chat in under 120 words. Keep names, order numbers, decisions and open questions."},
+                    {"role": "user", "content": f"Earlier summary: {summary or 'none'}\n\nNew messages:\n{transcript}"}
+                ],
+                temperature=0.3,
+                max_tokens=200
+            )
+        except Exception:
+            # The sliding window still bounds the prompt; try again next turn
+            logger.exception("Conversation summary failed for %s", session_id)
+            return
+        async with self.lock(session_id):
+            stored = await asyncio.to_thread(
+                self._apply_summary, session_id, summary, folded, response.choices[0].message.content
+            )
+            if stored is None:
+                # Compacted concurrently; the next turn's compaction picks up whatever is left
+                return
+            self._remember(stored)
+            self.compactions += 1
+
+    def stats(self) -> dict:
+        return {
+            "hot_sessions": len(self._hot),
+            "token_budget": self.token_budget,
+            "turns_served": self.turns_served,
+            "avg_prompt_tokens": round(self.prompt_tokens_served / self.turns_served, 1) if self.turns_served else 0.0,
+            "compactions": self.compactions,
+        }
+
+    async def aclose(self):
+        self._hot.clear()
+        with self._lock:
+            self._conn.close()
+
+
+def get_conversations(request: Request) -> ConversationStore:
+    """FastAPI dependency returning the conversation store created in the app lifespan"""
+    return request.app.state.conversations
+
+
+@router.get("/conversations/stats")
+async def conversation_stats(request: Request):
+    """Hot tier size, average prompt tokens per turn and compaction count"""
+    return get_conversations(request).stats()
@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Literal, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+
+from app.core.identity import get_user_id
+from app.core.metering import UsageMeter, get_meter
+from app.engines.rendering import RENDERER_VERSION, render_export
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+}
+
+# Files used this recently are never pruned: a request may have just found
+# or rendered one and not yet opened it to send
+PRUNE_GRACE_SECONDS = 60
+
+
+class ExportService:
+    """Renders business plans and pitch decks to PDF/PPTX files.
+
+    Rendering runs in a process pool so it never holds the event loop or
+    the GIL. Files are cached in `directory` under a hash of their content
+    and format, so a repeat download is a plain file read; concurrent
+    requests for the same export share one render. The least recently
+    used files are deleted once the cache outgrows `max_bytes`, except
+    those used within PRUNE_GRACE_SECONDS, which may be about to be served.
+    """
+
+    def __init__(self, directory: str = "exports_cache", workers: int = 2, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # spawn, not fork: forking a process that runs an event loop and thread pools is unsafe
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @classmethod
+    def from_env(cls) -> "ExportService":
+        return cls(
+            directory=os.getenv("EXPORT_CACHE_DIR", "exports_cache"),
+            workers=int(os.getenv("EXPORT_WORKERS", "2")),
+            max_bytes=int(os.getenv("EXPORT_CACHE_MAX_MB", "512")) * 1024 * 1024,
+        )
+
+    @staticmethod
+    def key(kind: str, title: str, content: str, fmt: str) -> str:
+        payload = json.dumps([RENDERER_VERSION, kind, title, fmt, content], separators=(",", ":"))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def path_for(self, key: str, fmt: str) -> str:
+        return os.path.join(self.directory, f"{key}.{fmt}")
+
+    async def export(self, kind: str, title: str, content: str, fmt: str) -> Tuple[str, str, bool]:
+        """Return (path, content hash, cache_hit) of the rendered file"""
+        key = self.key(kind, title, content, fmt)
+        path = self.path_for(key, fmt)
+        if await asyncio.to_thread(_touch, path):
+            return path, key, True
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = self._inflight[key] = asyncio.ensure_future(self._render(kind, title, content, fmt, path))
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so one client disconnecting does not cancel a render others wait on
+        await asyncio.shield(pending)
+        return path, key, False
+
+    async def _render(self, kind: str, title: str, content: str, fmt: str, path: str):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, render_export, kind, title, content, fmt, path)
+        try:
+            await asyncio.to_thread(self._prune, path)
+        except OSError:
+            logger.exception("Failed to prune the export cache")
+
+    def _prune(self, keep: str):
+        recent = time.time() - PRUNE_GRACE_SECONDS
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for mtime, size, file in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if file != keep and mtime < recent:
+                try:
+                    os.remove(file)
+                except FileNotFoundError:
+                    pass  # pruned by another worker
+                total -= size
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _touch(path: str) -> bool:
+    """Mark a cached export as recently used; False if it does not exist"""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def get_exports(request: Request) -> ExportService:
+    """FastAPI dependency returning the export service created in the app lifespan"""
+    return request.app.state.exports
+
+
+class ExportRequest(BaseModel):
+    kind: Literal["business_plan", "pitch_deck"]
+    title: str = Field(min_length=1, max_length=200)
+    content: str = Field(min_length=1, max_length=200_000)  # markdown returned by the generator
+    format: Literal["pdf", "pptx"] = "pdf"
+
+
+def _filename(title: str, fmt: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", title).strip("-").lower() or "document"
+    return f"{slug[:80]}.{fmt}"
+
+
+@router.post("/export-document")
+async def export_document(
+    request: ExportRequest,
+    exports: ExportService = Depends(get_exports),
+    meter: UsageMeter = Depends(get_meter),
+    user_id: Optional[int] = Depends(get_user_id)
+):
+    """Download a generated business plan (PDF) or pitch deck (PDF or PPTX)
+
+    The markdown is parsed into sections and slides and rendered server
+    side; repeat exports of the same content are served from disk.
+    """
+    if request.format == "pptx" and request.kind != "pitch_deck":
+        raise HTTPException(status_code=400, detail="PPTX export is only available for pitch decks")
+    try:
+        path, key, cache_hit = await exports.export(request.kind, request.title, request.content, request.format)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    meter.record(user_id, request.kind, action="export", credits_used=0)
+    return FileResponse(
+        path,
+        media_type=MEDIA_TYPES[request.format],
+        filename=_filename(request.title, request.format),
+        headers={"ETag": f'"{key}"', "X-Export-Cache": "hit" if cache_hit else "miss"},
+    )
@@ -0,0 +1,112 @@
+import hashlib
+import hmac
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+from fastapi import Depends, Header, Request
+from sqlalchemy import select
+
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIER = "free"
+
+# Rate-limit and quota key of the request being served ("user:7" or "ip:1.2.3.4"),
+# set by RateLimitMiddleware so usage can be charged to anonymous callers too
+current_client: ContextVar[Optional[str]] = ContextVar("current_client", default=None)
+
+
+def _secret() -> bytes:
+    return os.getenv("IDENTITY_SECRET", "").encode()
+
+
+def sign_user_token(user_id: int, ttl: float = 3600, secret: Optional[bytes] = None) -> str:
+    """Token proving `user_id` for `ttl` seconds: "<user_id>.<expires>.<hmac-sha256>".
+
+    Minted by the frontend's server side, which shares IDENTITY_SECRET,
+    and sent on every call in the X-User-Token header.
+    """
+    secret = secret if secret is not None else _secret()
+    if not secret:
+        raise RuntimeError("IDENTITY_SECRET is not set")
+    payload = f"{int(user_id)}.{int(time.time() + ttl)}"
+    signature = hmac.new(secret, payload.encode(), hashlib.sha256).hexdigest()
+    return f"{payload}.{signature}"
+
+
+def verify_user_token(token: Optional[str], secret: Optional[bytes] = None) -> Optional[int]:
+    """User id carried by a valid, unexpired token; None for anything else"""
+    secret = secret if secret is not None else _secret()
+    if not token or not secret:
+        return None
+    try:
+        user_id, expires, signature = token.strip().split(".")
+        expected = hmac.new(secret, f"{user_id}.{expires}".encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(signature, expected) or int(expires) < time.time():
+            return None
+        return int(user_id)
+    except ValueError:
+        return None
+
+
+def get_user_id(x_user_token: Optional[str] = Header(None)) -> Optional[int]:
+    """Id of the calling user, verified from the signed X-User-Token header.
+
+    Callers without a valid token are anonymous (None): free tier, rate
+    limited and metered by client IP.
+    """
+    return verify_user_token(x_user_token)
+
+
+class TierResolver:
+    """Resolves a user's subscription_tier with a short-lived, bounded LRU cache.
+
+    Admission control and model routing look the tier up on every request,
+    so only cache misses reach the users table.
+    """
+
+    def __init__(self, session_factory, ttl: float = 300, max_entries: int = 10000):
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[int, Tuple[float, str]]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls, session_factory) -> "TierResolver":
+        if not _secret():
+            logger.warning("IDENTITY_SECRET is not set: every caller is treated as anonymous")
+        return cls(
+            session_factory,
+            ttl=float(os.getenv("TIER_CACHE_TTL", "300")),
+            max_entries=int(os.getenv("TIER_CACHE_SIZE", "10000")),
+        )
+
+    async def tier_for(self, user_id: Optional[int]) -> str:
+        if user_id is None:
+            return DEFAULT_TIER
+        entry = self._cache.get(user_id)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            self._cache.move_to_end(user_id)
+            return entry[1]
+        async with self.session_factory() as session:
+            tier = await session.scalar(select(User.subscription_tier).where(User.id == user_id))
+        tier = tier or DEFAULT_TIER
+        self._cache[user_id] = (now + self.ttl, tier)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return tier
+
+    def invalidate(self, user_id: int):
+        self._cache.pop(user_id, None)
+
+
+async def get_tier(request: Request, user_id: Optional[int] = Depends(get_user_id)) -> str:
+    """FastAPI dependency returning the caller's subscription tier"""
+    return await request.app.state.tiers.tier_for(user_id)
@@ -0,0 +1,353 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple, Type
+from urllib.parse import urlsplit
+
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import select, update
+
+from app.core.identity import get_user_id
+from app.core.prompts import PromptError
+from app.core.resilience import UpstreamRejected
+from app.models import Job
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# tool name -> (request model, handler(request, llm, model_router, user_id) -> result dict)
+JobHandler = Callable[..., Awaitable[dict]]
+JOB_HANDLERS: Dict[str, Tuple[Type[BaseModel], JobHandler]] = {}
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def register_job(tool: str, request_model: Type[BaseModel]):
+    """Decorator exposing a tool's generation function to the job queue"""
+    def decorator(handler: JobHandler) -> JobHandler:
+        JOB_HANDLERS[tool] = (request_model, handler)
+        return handler
+    return decorator
+
+
+class CallbackURLError(ValueError):
+    """A callback URL the server must not call"""
+
+
+async def check_callback_url(url: str) -> str:
+    """Reject callback URLs that could reach internal services; returns a checked address.
+
+    Only https is allowed, and every address the host resolves to must be
+    public: loopback, private, link-local (cloud metadata such as
+    169.254.169.254), reserved and multicast addresses are refused.
+    Deliveries connect to the returned address rather than resolving the
+    name again, so a host cannot rebind to an internal address after the
+    check.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != "https" or not parts.hostname:
+        raise CallbackURLError("callback_url must be an https URL")
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, parts.port or 443, type=socket.SOCK_STREAM
+        )
+    except (socket.gaierror, UnicodeError):
+        raise CallbackURLError(f"callback_url host {parts.hostname!r} does not resolve") from None
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if not address.is_global or address.is_multicast:
+            raise CallbackURLError(f"callback_url host {parts.hostname!r} resolves to a non-public address")
+    return infos[0][4][0]
+
+
+def _pinned(url: str, address: str) -> Tuple[str, dict, dict]:
+    """(url, headers, extensions) for requesting `url` from `address`.
+
+    The Host header and TLS server name stay the URL's host, so the
+    certificate is still verified against it.
+    """
+    parts = urlsplit(url)
+    port = f":{parts.port}" if parts.port else ""
+    host = f"[{address}]" if ":" in address else address
+    return (
+        parts._replace(netloc=f"{host}{port}").geturl(),
+        {"Host": f"{parts.hostname}{port}"},
+        {"sni_hostname": parts.hostname},
+    )
+
+
+def _parse_concurrency(raw: Optional[str]) -> Dict[str, int]:
+    """Parse "business_plan=2,pitch_deck=4" into a dict"""
+    limits = {}
+    for item in (raw or "").split(","):
+        if "=" in item:
+            tool, limit = item.split("=", 1)
+            limits[tool.strip()] = int(limit)
+    return limits
+
+
+class JobQueue:
+    """Persistent background job runner for long generations.
+
+    Jobs are stored in the jobs table and executed as asyncio tasks on the
+    worker that owns them, limited per tool. Ownership is a lease the owner
+    keeps renewing; when a worker dies or restarts its lease runs out and
+    any worker (including the restarted one) reclaims and re-runs the job.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        llm,
+        model_router,
+        default_concurrency: int = 4,
+        tool_concurrency: Optional[Dict[str, int]] = None,
+        lease_seconds: float = 60,
+        callback_timeout: float = 10,
+        max_attempts: int = 3,
+    ):
+        self.session_factory = session_factory
+        self.llm = llm
+        self.model_router = model_router
+        self.default_concurrency = default_concurrency
+        self.tool_concurrency = tool_concurrency or {}
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        self._maintainer: Optional[asyncio.Task] = None
+        # Redirects could bounce a checked callback to an internal address
+        self._http = httpx.AsyncClient(timeout=callback_timeout, follow_redirects=False)
+
+    @classmethod
+    def from_env(cls, session_factory, llm, model_router) -> "JobQueue":
+        return cls(
+            session_factory,
+            llm,
+            model_router,
+            default_concurrency=int(os.getenv("JOB_DEFAULT_CONCURRENCY", "4")),
+            tool_concurrency=_parse_concurrency(os.getenv("JOB_TOOL_CONCURRENCY")),
+            lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "60")),
+        )
+
+    def _limit(self, tool: str) -> asyncio.Semaphore:
+        semaphore = self._limits.get(tool)
+        if semaphore is None:
+            limit = self.tool_concurrency.get(tool, self.default_concurrency)
+            semaphore = self._limits[tool] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def _lease(self) -> datetime:
+        return datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+
+    async def submit(self, tool: str, payload: dict, user_id: Optional[int] = None,
+                     callback_url: Optional[str] = None) -> str:
+        """Validate and persist a job, then schedule it; returns the job id"""
+        request_model, _ = JOB_HANDLERS[tool]
+        request_model(**payload)  # fail fast on bad input, before queueing
+        if callback_url:
+            await check_callback_url(callback_url)
+        job_id = uuid.uuid4().hex
+        async with self.session_factory() as session:
+            session.add(Job(
+                id=job_id,
+                user_id=user_id,
+                tool_name=tool,
+                status="queued",
+                payload=json.dumps(payload),
+                callback_url=callback_url,
+                owner=self.worker_id,
+                lease_expires_at=self._lease(),
+            ))
+            await session.commit()
+        self._schedule(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        async with self.session_factory() as session:
+            return await session.get(Job, job_id)
+
+    def _schedule(self, job_id: str):
+        if job_id not in self._tasks:
+            task = asyncio.get_running_loop().create_task(self._run(job_id))
+            self._tasks[job_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _set(self, job_id: str, **values):
+        async with self.session_factory() as session:
+            await session.execute(
+                update(Job).where(Job.id == job_id, Job.owner == self.worker_id).values(**values)
+            )
+            await session.commit()
+
+    async def _run(self, job_id: str):
+        job = await self.get(job_id)
+        if job is None or job.status not in ACTIVE_STATUSES:
+            return
+        request_model, handler = JOB_HANDLERS[job.tool_name]
+        async with self._limit(job.tool_name):
+            await self._set(job_id, status="running", started_at=datetime.utcnow(), attempts=(job.attempts or 0) + 1)
+            try:
+                request = request_model(**json.loads(job.payload))
+                result = await handler(request, self.llm, self.model_router, job.user_id)
+            except asyncio.CancelledError:
+                # Shutdown: leave the job running so its lease expires and it is re-run
+                raise
+            except Exception as e:
+                if isinstance(e, (ValidationError, PromptError, UpstreamRejected)) or (job.attempts or 0) + 1 >= self.max_attempts:
+                    await self._set(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+                    self._notify(job_id, job.callback_url, {"status": "failed", "error": str(e)})
+                else:
+                    logger.exception("Job %s failed, will retry", job_id)
+                    await self._set(job_id, status="queued", error=str(e))
+                    self._schedule_retry(job_id)
+                return
+            await self._set(job_id, status="succeeded", result=json.dumps(result), error=None,
+                            finished_at=datetime.utcnow())
+            self._notify(job_id, job.callback_url, {"status": "succeeded", "result": result})
+
+    def _schedule_retry(self, job_id: str):
+        async def retry():
+            await asyncio.sleep(5)
+            self._schedule(job_id)
+        self._spawn(retry())
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _notify(self, job_id: str, callback_url: Optional[str], body: dict):
+        if callback_url:
+            self._spawn(self._deliver(callback_url, {"job_id": job_id, **body}))
+
+    async def _deliver(self, callback_url: str, body: dict):
+        for attempt in range(3):
+            try:
+                # Checked again, as DNS may have changed since the job was submitted
+                address = await check_callback_url(callback_url)
+            except CallbackURLError as e:
+                logger.warning("Not delivering callback for job %s: %s", body["job_id"], e)
+                return
+            url, headers, extensions = _pinned(callback_url, address)
+            try:
+                response = await self._http.post(url, json=body, headers=headers, extensions=extensions)
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(2 ** attempt)
+        logger.warning("Giving up on callback %s for job %s", callback_url, body["job_id"])
+
+    async def _maintain(self):
+        """Renew our leases and adopt jobs whose owner stopped renewing"""
+        now = datetime.utcnow()
+        async with self.session_factory() as session:
+            await session.execute(
+                update(Job)
+                .where(Job.owner == self.worker_id, Job.status.in_(ACTIVE_STATUSES))
+                .values(lease_expires_at=self._lease())
+            )
+            await session.execute(
+                update(Job)
+                .where(Job.status.in_(ACTIVE_STATUSES), Job.lease_expires_at < now)
+                .values(owner=self.worker_id, status="queued", lease_expires_at=self._lease())
+            )
+            await session.commit()
+            owned = await session.scalars(
+                select(Job.id).where(Job.owner == self.worker_id, Job.status == "queued")
+            )
+            owned = list(owned)
+        for job_id in owned:
+            self._schedule(job_id)
+
+    async def _maintain_forever(self):
+        while True:
+            try:
+                await self._maintain()
+            except Exception:
+                logger.exception("Job lease maintenance failed")
+            await asyncio.sleep(self.lease_seconds / 3)
+
+    def start(self):
+        self._maintainer = asyncio.get_running_loop().create_task(self._maintain_forever())
+
+    async def stop(self):
+        tasks = list(self._tasks.values()) + list(self._background)
+        if self._maintainer is not None:
+            tasks.append(self._maintainer)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._http.aclose()
+
+
+def get_jobs(request: Request) -> JobQueue:
+    """FastAPI dependency returning the job queue created in the app lifespan"""
+    return request.app.state.jobs
+
+
+class JobRequest(BaseModel):
+    tool: str
+    payload: dict
+    callback_url: Optional[str] = None
+
+
+def _job_response(job: Job) -> dict:
+    return {
+        "job_id": job.id,
+        "tool": job.tool_name,
+        "status": job.status,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+@router.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest, jobs: JobQueue = Depends(get_jobs),
+                     user_id: Optional[int] = Depends(get_user_id)):
+    """Queue a long-running generation and return its job id immediately
+
+    Jobs belong to the signed-in user who submitted them; only they can
+    poll the result.
+    """
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Sign in to run background jobs")
+    if request.tool not in JOB_HANDLERS:
+        raise HTTPException(status_code=400, detail=f"Unknown tool; expected one of {sorted(JOB_HANDLERS)}")
+    try:
+        job_id = await jobs.submit(request.tool, request.payload, user_id, request.callback_url)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    except CallbackURLError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}"
+    }
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, jobs: JobQueue = Depends(get_jobs),
+                  user_id: Optional[int] = Depends(get_user_id)):
+    """Poll a job's status and, once finished, its result"""
+    job = await jobs.get(job_id)
+    # Someone else's job is reported as missing, so ids cannot be probed
+    if job is None or user_id is None or job.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_response(job)
@@ -0,0 +1,464 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from fastapi import APIRouter, Request
+
+from app.core import providers as provider_backends
+from app.core.metrics import UPSTREAM_ERRORS
+from app.core.providers import AnthropicProvider, CompletionUsage, FakeProvider, OpenAIProvider, Provider
+from app.core.resilience import CircuitOpen, UpstreamError, UpstreamRejected, UpstreamTimeout
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _int_env(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _float_env(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _parse_pairs(raw: Optional[str]) -> Dict[str, str]:
+    """Parse "gpt-4-turbo-preview=8,gpt-3.5-turbo=32" into a dict"""
+    pairs = {}
+    if not raw:
+        return pairs
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        pairs[key.strip()] = value.strip()
+    return pairs
+
+
+def _parse_model_limits(raw: Optional[str]) -> Dict[str, int]:
+    return {model: int(limit) for model, limit in _parse_pairs(raw).items()}
+
+
+# USD per 1K (prompt, completion) tokens, for cost reporting
+MODEL_PRICING: Dict[str, Tuple[float, float]] = {
+    "gpt-4-turbo-preview": (0.01, 0.03),
+    "gpt-4": (0.03, 0.06),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Approximate USD cost of a completion; 0 for models without a price"""
+    prompt_price, completion_price = MODEL_PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+@dataclass
+class CompletionEvent:
+    """Summary of one finished upstream call, handed to gateway listeners"""
+    tool: Optional[str]
+    model: str
+    user_id: Optional[int]
+    prompt_tokens: int
+    completion_tokens: int
+    latency: float
+    fallback_from: Optional[str] = None  # model that failed before `model` answered
+    provider: Optional[str] = None
+    first_token_latency: Optional[float] = None  # streams only
+
+
+class LLMGateway:
+    """Single app-wide entry point for chat completions.
+
+    Calls go to an ordered list of providers (OpenAI, Anthropic, or local
+    fakes for testing) under a global concurrency limit plus optional
+    per-model limits. A provider whose circuit breaker is open is skipped,
+    and one that is throttled, times out or errors hands the call to the
+    next. With `hedge` enabled, a call that has not answered (or produced
+    its first streamed token) within the primary provider's recent p95
+    latency is also sent to the next provider and the first answer wins.
+    """
+
+    def __init__(
+        self,
+        providers: List[Provider],
+        global_concurrency: int = 64,
+        model_concurrency: Optional[Dict[str, int]] = None,
+        hedge: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.5,
+        deadline: float = 180.0,
+    ):
+        self.providers = providers
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self._global_limit = asyncio.Semaphore(global_concurrency)
+        self._model_limits = {
+            model: asyncio.Semaphore(limit)
+            for model, limit in (model_concurrency or {}).items()
+        }
+        self._listeners: List[Callable[[CompletionEvent], None]] = []
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    @classmethod
+    def from_env(cls) -> "LLMGateway":
+        """Build a gateway from LLM_* environment variables.
+
+        LLM_PROVIDERS lists providers in order of preference (default
+        "openai", plus "anthropic" when ANTHROPIC_API_KEY is set and the
+        anthropic package is installed). Other
+        names refer to fake providers defined as a JSON list of FakeProvider
+        options in LLM_FAKE_PROVIDERS. OPENAI_BASE_URL can point at a local
+        OpenAI-compatible stub server for load testing connection reuse and
+        tail latency.
+        """
+        def http_client() -> httpx.AsyncClient:
+            # One keep-alive pool per provider, shared by every tool
+            return httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=_int_env("LLM_MAX_CONNECTIONS", 100),
+                    max_keepalive_connections=_int_env("LLM_MAX_KEEPALIVE_CONNECTIONS", 20),
+                    keepalive_expiry=_float_env("LLM_KEEPALIVE_EXPIRY", 30.0),
+                ),
+                timeout=httpx.Timeout(_float_env("LLM_TIMEOUT", 120.0), connect=10.0),
+            )
+
+        with_anthropic = os.getenv("ANTHROPIC_API_KEY") and provider_backends.anthropic is not None
+        default = "openai,anthropic" if with_anthropic else "openai"
+        fakes = {fake["name"]: fake for fake in json.loads(os.getenv("LLM_FAKE_PROVIDERS") or "[]")}
+        breaker = {
+            "failure_threshold": _int_env("LLM_BREAKER_FAILURES", 5),
+            "cooldown": _float_env("LLM_BREAKER_COOLDOWN", 30.0),
+        }
+        providers: List[Provider] = []
+        for name in (os.getenv("LLM_PROVIDERS") or default).split(","):
+            name = name.strip()
+            if name == "openai":
+                provider = OpenAIProvider(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    base_url=os.getenv("OPENAI_BASE_URL") or None,
+                    http_client=http_client(),
+                    max_retries=_int_env("LLM_MAX_RETRIES", 2),
+                )
+            elif name == "anthropic":
+                provider = AnthropicProvider(
+                    api_key=os.getenv("ANTHROPIC_API_KEY"),
+                    http_client=http_client(),
+                    max_retries=_int_env("LLM_MAX_RETRIES", 2),
+                    **({"models": _parse_pairs(os.getenv("ANTHROPIC_MODEL_MAP"))} if os.getenv("ANTHROPIC_MODEL_MAP") else {}),
+                )
+            elif name in fakes:
+                provider = FakeProvider(**fakes[name])
+            else:
+                raise ValueError(f"Unknown LLM provider {name!r}")
+            provider.breaker.failure_threshold = breaker["failure_threshold"]
+            provider.breaker.cooldown = breaker["cooldown"]
+            providers.append(provider)
+        return cls(
+            providers,
+            global_concurrency=_int_env("LLM_GLOBAL_CONCURRENCY", 64),
+            model_concurrency=_parse_model_limits(os.getenv("LLM_MODEL_CONCURRENCY")),
+            hedge=os.getenv("LLM_HEDGE", "").lower() in ("1", "true", "yes"),
+            hedge_quantile=_float_env("LLM_HEDGE_QUANTILE", 0.95),
+            hedge_min_delay=_float_env("LLM_HEDGE_MIN_DELAY", 0.5),
+            deadline=_float_env("LLM_DEADLINE", 180.0),
+        )
+
+    def add_listener(self, listener: Callable[[CompletionEvent], None]):
+        """Register a callback invoked after every successful completion"""
+        self._listeners.append(listener)
+
+    def _emit(self, event: CompletionEvent):
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("LLM gateway listener failed")
+
+    def _hedge_delay(self, provider: Provider, model: str) -> Optional[float]:
+        quantile = provider.latency(model).quantile(self.hedge_quantile)
+        return None if quantile is None else max(self.hedge_min_delay, quantile)
+
+    async def _race(self, model: str, candidates: List[Provider], start: Callable[[Provider], Awaitable],
+                    discard: Optional[Callable] = None):
+        """Run `start` on the first candidate, failing over and hedging to the rest.
+
+        Returns (result, provider) of the first attempt that succeeds, or
+        raises the last UpstreamError once every candidate failed.
+        Losing attempts are cancelled; `discard` cleans up the result of
+        one that finished but lost.
+        """
+        remaining = list(candidates)
+        pending: Dict[asyncio.Task, Provider] = {}
+        error: UpstreamError = CircuitOpen("llm", f"every provider for {model} has an open circuit")
+        failed = False
+
+        def launch() -> bool:
+            # Breakers are consulted only now, so a half-open one spends its
+            # trial call on a request that is actually sent
+            while remaining:
+                provider = remaining.pop(0)
+                if provider.breaker.allow():
+                    pending[asyncio.ensure_future(start(provider))] = provider
+                    return True
+            return False
+
+        launch()
+        try:
+            while pending:
+                delay = None
+                if self.hedge and remaining and len(pending) == 1:
+                    delay = self._hedge_delay(next(iter(pending.values())), model)
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        self.hedges += 1
+                    continue
+                winner = None
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except UpstreamRejected:
+                        raise
+                    except UpstreamError as e:
+                        error, failed = e, True
+                        continue
+                    if winner is None:
+                        winner = (result, provider)
+                    elif discard is not None:
+                        discard(result)
+                if winner is not None:
+                    if winner[1] is not candidates[0]:
+                        if not failed:
+                            self.hedge_wins += 1
+                        else:
+                            self.failovers += 1
+                    return winner
+                if not pending and remaining:
+                    launch()
+            raise error
+        finally:
+            for task, provider in pending.items():
+                task.cancel()
+                provider.breaker.release()
+
+    def _retry_after(self, model: str) -> float:
+        return min((p.breaker.retry_after() for p in self.providers if p.supports(model)), default=0.0)
+
+    def _candidates(self, model: str) -> List[Provider]:
+        candidates = [p for p in self.providers if p.supports(model) and p.breaker.state != "open"]
+        if not candidates:
+            raise CircuitOpen("llm", f"no provider available for {model}", self._retry_after(model))
+        return candidates
+
+    async def _attempt(self, provider: Provider, model: str, call: Callable[[], Awaitable]):
+        """Run one provider call, feeding its breaker and latency window"""
+        started = time.perf_counter()
+        try:
+            result = await call()
+        except UpstreamRejected as e:
+            # A request the provider rejected outright says nothing about its health
+            provider.breaker.release()
+            UPSTREAM_ERRORS.inc(provider.name, e.code)
+            raise
+        except UpstreamError as e:
+            provider.breaker.record_failure()
+            UPSTREAM_ERRORS.inc(provider.name, e.code)
+            raise
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            provider.breaker.release()
+            raise
+        provider.breaker.record_success()
+        provider.latency(model).add(time.perf_counter() - started)
+        return result
+
+    async def chat(self, model: str, messages: list, tool: Optional[str] = None,
+                   user_id: Optional[int] = None, fallbacks: Sequence[str] = (), **params):
+        """Create a chat completion under the global and per-model limits.
+
+        `tool` and `user_id` only label the call for listeners (metering).
+        When every provider fails for `model`, the call is repeated on each
+        of `fallbacks` in turn.
+        """
+        response, _ = await self.chat_with_fallbacks([model, *fallbacks], messages, tool, user_id, **params)
+        return response
+
+    async def chat_with_fallbacks(self, models: Sequence[str], messages: list, tool: Optional[str] = None,
+                                  user_id: Optional[int] = None, timeout: Optional[float] = None, **params):
+        """Like chat(), trying `models` in order; returns (response, model that answered).
+
+        `timeout` bounds each upstream request; the gateway's `deadline`
+        bounds the whole call, queueing, failover and fallbacks included.
+        Only the very last provider of the last model uses the SDK's own
+        retries, so a throttled or slow backend hands over straight away.
+        """
+        if timeout is not None:
+            params["timeout"] = timeout
+        try:
+            return await asyncio.wait_for(self._chat(models, messages, tool, user_id, params), self.deadline)
+        except asyncio.TimeoutError:
+            raise UpstreamTimeout("llm", f"no answer within {self.deadline:g}s") from None
+
+    async def _chat(self, models: Sequence[str], messages: list, tool: Optional[str],
+                    user_id: Optional[int], params: dict):
+        error: Optional[UpstreamError] = None
+        for attempt, model in enumerate(models):
+            last_model = attempt == len(models) - 1
+            model_limit = self._model_limits.get(model)
+            started = time.perf_counter()
+            try:
+                candidates = self._candidates(model)
+
+                def start(provider: Provider):
+                    retry = last_model and provider is candidates[-1]
+                    return self._attempt(provider, model, lambda: provider.complete(
+                        model, messages, retry=retry, **params
+                    ))
+
+                async with self._global_limit:
+                    if model_limit is None:
+                        response, provider = await self._race(model, candidates, start)
+                    else:
+                        async with model_limit:
+                            response, provider = await self._race(model, candidates, start)
+            except UpstreamRejected:
+                raise
+            except UpstreamError as e:
+                error = e
+                if not last_model:
+                    logger.warning("%s failed for %s (%s), falling back to %s", model, tool, e, models[attempt + 1])
+                continue
+            usage = response.usage
+            self._emit(CompletionEvent(
+                tool=tool,
+                model=model,
+                user_id=user_id,
+                prompt_tokens=usage.prompt_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0,
+                latency=time.perf_counter() - started,
+                fallback_from=models[0] if attempt else None,
+                provider=provider.name,
+            ))
+            return response, model
+        raise error
+
+    async def stream_chat(self, model: str, messages: list, tool: Optional[str] = None,
+                          user_id: Optional[int] = None, timeout: Optional[float] = None,
+                          on_finish: Optional[Callable[[Optional[str]], None]] = None, **params):
+        """Stream a chat completion, yielding content deltas as they arrive.
+
+        Failover, hedging and the gateway deadline apply until the first
+        token; after that the stream is committed to its provider. The concurrency slot is held
+        until the stream is exhausted or closed. `on_finish` is called with
+        the finish_reason ("stop", "length", ...) once the stream is exhausted.
+        """
+        if timeout is not None:
+            params["timeout"] = timeout
+        model_limit = self._model_limits.get(model)
+        started = time.perf_counter()
+        first_token_at = None
+        usage = None
+
+        async def open_stream(provider: Provider, retry: bool):
+            stream = provider.stream(model, messages, retry=retry, **params)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                await stream.aclose()
+                raise
+            return first, stream
+
+        async def close(opened):
+            await opened[1].aclose()
+
+        def discard(opened):
+            asyncio.ensure_future(close(opened))
+
+        async with self._global_limit:
+            if model_limit is not None:
+                await model_limit.acquire()
+            try:
+                candidates = self._candidates(model)
+                try:
+                    (first, stream), provider = await asyncio.wait_for(self._race(
+                        model, candidates,
+                        lambda p: self._attempt(p, model, lambda: open_stream(p, p is candidates[-1])),
+                        discard
+                    ), self.deadline)
+                except asyncio.TimeoutError:
+                    raise UpstreamTimeout("llm", f"no first token within {self.deadline:g}s") from None
+                try:
+                    item = first
+                    while item is not None:
+                        if isinstance(item, CompletionUsage):
+                            usage = item
+                        else:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                            yield item
+                        try:
+                            item = await stream.__anext__()
+                        except StopAsyncIteration:
+                            item = None
+                        except UpstreamError as e:
+                            # Too late to fail over, but the provider's health still counts
+                            provider.breaker.record_failure()
+                            UPSTREAM_ERRORS.inc(provider.name, e.code)
+                            raise
+                finally:
+                    await stream.aclose()
+            finally:
+                if model_limit is not None:
+                    model_limit.release()
+        if on_finish is not None:
+            on_finish(usage.finish_reason if usage else None)
+        self._emit(CompletionEvent(
+            tool=tool,
+            model=model,
+            user_id=user_id,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+            latency=time.perf_counter() - started,
+            provider=provider.name,
+            first_token_latency=first_token_at - started if first_token_at is not None else None,
+        ))
+
+    def stats(self) -> dict:
+        return {
+            "hedging": self.hedge,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "providers": [provider.stats() for provider in self.providers],
+        }
+
+    async def aclose(self):
+        for provider in self.providers:
+            await provider.aclose()
+
+
+def get_llm(request: Request) -> LLMGateway:
+    """FastAPI dependency returning the gateway created in the app lifespan"""
+    return request.app.state.llm
+
+
+@router.get("/llm/providers")
+async def llm_providers(request: Request):
+    """Breaker state and recent latency per provider, plus hedge and failover counts"""
+    return get_llm(request).stats()
@@ -0,0 +1,369 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Request
+from sqlalchemy import insert, select
+
+from app.core.identity import current_client
+from app.models import UsageLog
+
+logger = logging.getLogger(__name__)
+
+
+class RollingCounter:
+    """Sum over a trailing time window, kept in fixed-width buckets.
+
+    Adding and reading are O(1) amortised: expired buckets are subtracted
+    from the running total as the window slides forward.
+    """
+
+    __slots__ = ("bucket_seconds", "buckets", "counts", "stamps", "total")
+
+    def __init__(self, window_seconds: float, buckets: int = 24):
+        self.bucket_seconds = window_seconds / buckets
+        self.buckets = buckets
+        self.counts = [0] * buckets
+        self.stamps = [-1] * buckets
+        self.total = 0
+
+    def _expire(self, now: float) -> int:
+        current = int(now // self.bucket_seconds)
+        for i in range(self.buckets):
+            if self.stamps[i] != -1 and self.stamps[i] <= current - self.buckets:
+                self.total -= self.counts[i]
+                self.counts[i] = 0
+                self.stamps[i] = -1
+        return current
+
+    def add(self, amount: int, now: Optional[float] = None):
+        current = self._expire(now if now is not None else time.time())
+        slot = current % self.buckets
+        if self.stamps[slot] != current:
+            self.total -= self.counts[slot]
+            self.counts[slot] = 0
+            self.stamps[slot] = current
+        self.counts[slot] += amount
+        self.total += amount
+
+    def value(self, now: Optional[float] = None) -> int:
+        self._expire(now if now is not None else time.time())
+        return self.total
+
+    def seconds_until_release(self, now: Optional[float] = None) -> float:
+        """Time until the oldest non-empty bucket drops out of the window"""
+        now = now if now is not None else time.time()
+        self._expire(now)
+        stamps = [stamp for stamp in self.stamps if stamp != -1]
+        if not stamps:
+            return 0.0
+        return max(0.0, (min(stamps) + self.buckets) * self.bucket_seconds - now)
+
+
+# (unix time, credits) spent by one client
+CreditEntry = Tuple[float, int]
+
+
+class MemoryCreditStore:
+    """Per-process rolling credit counters, one per client.
+
+    At most `max_keys` counters are kept; the least recently used are
+    dropped and re-seeded from usage_logs when the client returns.
+    """
+
+    def __init__(self, window_seconds: float = 86400, max_keys: int = 100000):
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._counters: "OrderedDict[str, RollingCounter]" = OrderedDict()
+
+    async def usage(self, client: str) -> Optional[Tuple[int, float]]:
+        """(credits in the window, seconds until some are released); None if never seeded"""
+        counter = self._counters.get(client)
+        if counter is None:
+            return None
+        self._counters.move_to_end(client)
+        return counter.value(), counter.seconds_until_release()
+
+    async def seed(self, client: str, entries: Sequence[CreditEntry]):
+        """Start the client's counter from its history, unless it already has one"""
+        if client in self._counters:
+            return
+        counter = self._counters[client] = RollingCounter(self.window_seconds)
+        for at, credits in sorted(entries):
+            counter.add(credits, now=at)
+        while len(self._counters) > self.max_keys:
+            self._counters.popitem(last=False)
+
+    async def add(self, client: str, credits: int):
+        counter = self._counters.get(client)
+        if counter is not None:
+            counter.add(credits)
+
+    async def aclose(self):
+        self._counters.clear()
+
+
+class SQLiteCreditStore:
+    """Credit spend in a SQLite file shared by every worker on the host.
+
+    Each spend is a row in credit_events; the window total is a SUM over
+    the client's rows, and rows older than the window are pruned as new
+    ones arrive. credit_clients records which clients were seeded, so a
+    client's usage_logs history is only ever loaded once. Any store with
+    the same async methods (e.g. Redis sorted sets) can replace it.
+    """
+
+    def __init__(self, path: str = "rate_limit.db", window_seconds: float = 86400):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS credit_events ("
+            "client TEXT NOT NULL, at REAL NOT NULL, credits INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS credit_events_client ON credit_events (client, at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS credit_events_at ON credit_events (at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS credit_clients (client TEXT PRIMARY KEY)")
+
+    def _usage(self, client: str) -> Optional[Tuple[int, float]]:
+        now = time.time()
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM credit_clients WHERE client = ?", (client,)).fetchone() is None:
+                return None
+            total, oldest = self._conn.execute(
+                "SELECT COALESCE(SUM(credits), 0), MIN(at) FROM credit_events WHERE client = ? AND at > ?",
+                (client, now - self.window_seconds),
+            ).fetchone()
+        return total, (max(0.0, oldest + self.window_seconds - now) if oldest is not None else 0.0)
+
+    def _write(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                work()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _seed(self, client: str, entries: Sequence[CreditEntry]):
+        def work():
+            # Another worker may have seeded the client since usage() was checked
+            if self._conn.execute("INSERT OR IGNORE INTO credit_clients (client) VALUES (?)", (client,)).rowcount:
+                self._conn.executemany(
+                    "INSERT INTO credit_events (client, at, credits) VALUES (?, ?, ?)",
+                    [(client, at, credits) for at, credits in entries],
+                )
+        self._write(work)
+
+    def _add(self, client: str, credits: int):
+        now = time.time()
+
+        def work():
+            self._conn.execute("DELETE FROM credit_events WHERE at <= ?", (now - self.window_seconds,))
+            self._conn.execute("INSERT INTO credit_events (client, at, credits) VALUES (?, ?, ?)", (client, now, credits))
+        self._write(work)
+
+    async def usage(self, client: str) -> Optional[Tuple[int, float]]:
+        return await asyncio.to_thread(self._usage, client)
+
+    async def seed(self, client: str, entries: Sequence[CreditEntry]):
+        await asyncio.to_thread(self._seed, client, entries)
+
+    async def add(self, client: str, credits: int):
+        await asyncio.to_thread(self._add, client, credits)
+
+    async def aclose(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_credit_store_from_env(window_seconds: float):
+    """Pick the credit store from RATE_LIMIT_BACKEND (memory or sqlite), like the token buckets"""
+    if os.getenv("RATE_LIMIT_BACKEND", "memory") == "sqlite":
+        return SQLiteCreditStore(os.getenv("RATE_LIMIT_PATH", "rate_limit.db"), window_seconds)
+    return MemoryCreditStore(window_seconds, int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")))
+
+
+class UsageMeter:
+    """Write-behind usage metering into the usage_logs table.
+
+    Calls are buffered in memory and flushed with one bulk INSERT once
+    `flush_size` rows are pending or every `flush_interval` seconds, and
+    once more on shutdown.
+
+    Credit spend per client is tracked in a credit store (shared between
+    workers with the sqlite backend) so quotas hold across workers and
+    restarts. A user's store entry is seeded from usage_logs for the window
+    the first time it is needed; spend recorded since the last flush is
+    held locally and counted on top.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        flush_size: int = 200,
+        flush_interval: float = 5.0,
+        window_seconds: float = 86400,
+        max_buffer: int = 10000,
+        store=None,
+    ):
+        self.session_factory = session_factory
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.window_seconds = window_seconds
+        self.max_buffer = max_buffer
+        self._buffer: List[dict] = []
+        self.store = store if store is not None else MemoryCreditStore(window_seconds)
+        self._pending_credits: Dict[str, int] = {}  # credits not yet in the store, keyed by client_key()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._pending_flush: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, session_factory) -> "UsageMeter":
+        window_seconds = float(os.getenv("USAGE_WINDOW_SECONDS", "86400"))
+        return cls(
+            session_factory,
+            flush_size=int(os.getenv("USAGE_FLUSH_SIZE", "200")),
+            flush_interval=float(os.getenv("USAGE_FLUSH_INTERVAL", "5")),
+            window_seconds=window_seconds,
+            store=create_credit_store_from_env(window_seconds),
+        )
+
+    def record(
+        self,
+        user_id: Optional[int],
+        tool_name: str,
+        action: str = "generate",
+        credits_used: int = 1,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+    ):
+        """Buffer one usage row and charge its credits to the caller"""
+        client = client_key(user_id)
+        if client is not None and credits_used:
+            self._pending_credits[client] = self._pending_credits.get(client, 0) + credits_used
+
+        self._buffer.append({
+            "user_id": user_id,
+            "tool_name": tool_name,
+            "action": action,
+            "credits_used": credits_used,
+            "timestamp": datetime.utcnow(),
+            "extra_data": json.dumps({
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+            }),
+        })
+        if len(self._buffer) >= self.flush_size and self._pending_flush is None:
+            self._pending_flush = asyncio.get_running_loop().create_task(self._flush_soon())
+
+    async def usage(self, client: str) -> Tuple[int, float]:
+        """(credits the client spent within the rolling window, seconds until some are released)"""
+        used, release = await self._stored_usage(client)
+        pending = self._pending_credits.get(client, 0)
+        if pending and not used:
+            release = self.window_seconds
+        return used + pending, release
+
+    async def _stored_usage(self, client: str) -> Tuple[int, float]:
+        usage = await self.store.usage(client)
+        if usage is None:
+            await self.store.seed(client, await self._history(client))
+            usage = await self.store.usage(client) or (0, 0.0)
+        return usage
+
+    async def _history(self, client: str) -> List[CreditEntry]:
+        """The client's spend within the window, from usage_logs"""
+        if not client.startswith("user:"):
+            return []  # anonymous rows are not attributed to an IP
+        since = datetime.utcnow() - timedelta(seconds=self.window_seconds)
+        async with self.session_factory() as session:
+            rows = await session.execute(
+                select(UsageLog.timestamp, UsageLog.credits_used).where(
+                    UsageLog.user_id == int(client[len("user:"):]),
+                    UsageLog.timestamp > since,
+                    UsageLog.credits_used > 0,
+                )
+            )
+            return [(timestamp.replace(tzinfo=timezone.utc).timestamp(), credits) for timestamp, credits in rows]
+
+    def on_completion(self, event):
+        """LLMGateway listener: meter every completed upstream call"""
+        self.record(
+            event.user_id,
+            event.tool or "unknown",
+            prompt_tokens=event.prompt_tokens,
+            completion_tokens=event.completion_tokens,
+        )
+
+    async def _flush_soon(self):
+        try:
+            await self.flush()
+        finally:
+            self._pending_flush = None
+
+    async def flush(self):
+        """Write all buffered rows in a single bulk insert"""
+        async with self._flush_lock:
+            pending, self._pending_credits = self._pending_credits, {}
+            for client, credits in pending.items():
+                try:
+                    # Seeded before the rows reach usage_logs, so they are never counted twice
+                    await self._stored_usage(client)
+                    await self.store.add(client, credits)
+                except Exception:
+                    logger.exception("Failed to record credits for %s", client)
+                    self._pending_credits[client] = self._pending_credits.get(client, 0) + credits
+            if not self._buffer:
+                return
+            rows, self._buffer = self._buffer, []
+            try:
+                async with self.session_factory() as session:
+                    await session.execute(insert(UsageLog), rows)
+                    await session.commit()
+            except Exception:
+                logger.exception("Failed to flush %d usage rows", len(rows))
+                # Keep the rows for the next attempt, dropping the oldest if
+                # the database has been unavailable for a long time
+                self._buffer = (rows + self._buffer)[-self.max_buffer:]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        if self._pending_flush is not None:
+            await asyncio.gather(self._pending_flush, return_exceptions=True)
+        await self.flush()
+        await self.store.aclose()
+
+
+def client_key(user_id: Optional[int]) -> Optional[str]:
+    """Quota key: the user when known, else the client IP of the request being served"""
+    return f"user:{user_id}" if user_id is not None else current_client.get()
+
+
+def get_meter(request: Request) -> UsageMeter:
+    """FastAPI dependency returning the usage meter created in the app lifespan"""
+    return request.app.state.meter
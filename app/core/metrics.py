@@ -0,0 +1,371 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from functools import lru_cache
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple
+
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+from starlette.routing import compile_path
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+FIRST_TOKEN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+class _Metric:
+    """Base for metrics whose values are sharded per thread.
+
+    Each thread writes only to its own dict of label values -> cell, so
+    recording takes no lock; shards are merged when metrics are scraped.
+    On the event loop thread this is a plain dict update.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str]):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._shards_lock:
+                self._shards.append(values)
+            return values
+
+    def _add(self, into, value):
+        raise NotImplementedError
+
+    def merge(self, into: dict, values: dict):
+        for labels, value in values.items():
+            if labels in into:
+                into[labels] = self._add(into[labels], value)
+            else:
+                into[labels] = self._add(None, value)
+
+    def snapshot(self) -> dict:
+        """Label values -> cell, merged across every thread's shard"""
+        merged: dict = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            self.merge(merged, dict(shard))
+        return merged
+
+    def render(self, values: dict) -> List[str]:
+        raise NotImplementedError
+
+    def _label_text(self, labels: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, labels))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0.0) + amount
+
+    def _add(self, into, value):
+        return (into or 0.0) + value
+
+    def render(self, values: dict) -> List[str]:
+        return [f"{self.name}{self._label_text(labels)} {_number(value)}" for labels, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; a cell is the per-bucket counts (last one +Inf) then the sum"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float]):
+        super().__init__(name, help, labels)
+        self.bounds = tuple(buckets)
+
+    def observe(self, value: float, *labels: str):
+        shard = self._shard()
+        cell = shard.get(labels)
+        if cell is None:
+            cell = shard[labels] = [0] * (len(self.bounds) + 1) + [0.0]
+        cell[bisect.bisect_left(self.bounds, value)] += 1
+        cell[-1] += value
+
+    def _add(self, into, value):
+        if into is None:
+            return list(value)
+        return [a + b for a, b in zip(into, value)]
+
+    def render(self, values: dict) -> List[str]:
+        lines = []
+        for labels, cell in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), cell):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{self._label_text(labels, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {_number(cell[-1])}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class MetricsRegistry:
+    """The set of metrics exposed at /metrics"""
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def snapshot(self) -> dict:
+        """JSON-serialisable values of every metric in this process"""
+        return {
+            name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+            for name, metric in self.metrics.items()
+        }
+
+    def render(self, snapshots: Sequence[dict]) -> str:
+        """Prometheus text exposition of the sum of `snapshots`"""
+        lines = []
+        for name, metric in self.metrics.items():
+            merged: dict = {}
+            for snapshot in snapshots:
+                metric.merge(merged, {tuple(labels): value for labels, value in snapshot.get(name, ())})
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render(merged))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "sphere_http_request_duration_seconds", "End-to-end request latency, until the last body byte",
+    ("route", "method", "status"),
+)
+REQUEST_ERRORS = REGISTRY.counter(
+    "sphere_http_errors_total", "Responses with status >= 400 by error class", ("route", "status", "code"),
+)
+LLM_LATENCY = REGISTRY.histogram(
+    "sphere_llm_request_duration_seconds", "Upstream LLM call latency, including queueing and failover",
+    ("tool", "model", "provider"),
+)
+LLM_FIRST_TOKEN = REGISTRY.histogram(
+    "sphere_llm_time_to_first_token_seconds", "Time until a streamed completion produced its first token",
+    ("tool", "model", "provider"), FIRST_TOKEN_BUCKETS,
+)
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    "sphere_llm_prompt_tokens", "Prompt tokens per LLM call", ("tool", "model"), TOKEN_BUCKETS,
+)
+LLM_COMPLETION_TOKENS = REGISTRY.histogram(
+    "sphere_llm_completion_tokens", "Completion tokens per LLM call", ("tool", "model"), TOKEN_BUCKETS,
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "sphere_cache_lookups_total", "Response and semantic cache lookups", ("cache", "tool", "result"),
+)
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "sphere_upstream_errors_total", "Failed calls to LLM providers and payment gateways, retried or not",
+    ("upstream", "code"),
+)
+
+
+def on_completion(event):
+    """LLMGateway listener: latency, first-token time and token counts per tool and model"""
+    tool = event.tool or "unknown"
+    provider = event.provider or "unknown"
+    LLM_LATENCY.observe(event.latency, tool, event.model, provider)
+    if event.first_token_latency is not None:
+        LLM_FIRST_TOKEN.observe(event.first_token_latency, tool, event.model, provider)
+    LLM_PROMPT_TOKENS.observe(event.prompt_tokens, tool, event.model)
+    LLM_COMPLETION_TOKENS.observe(event.completion_tokens, tool, event.model)
+
+
+class MetricsExporter:
+    """Serves REGISTRY for this worker, or for every worker sharing `directory`.
+
+    With a directory (METRICS_DIR), each worker writes its snapshot to its
+    own file every `flush_interval` seconds and on shutdown, and a scrape
+    sums those files with the scraping worker's live values, so whichever
+    worker answers /metrics reports the whole host. Files of exited workers
+    are kept so counters never go backwards; clear the directory on deploy.
+    File names carry a random suffix, so a recycled pid (or the same pid in
+    another container sharing the directory) never overwrites an old file.
+    """
+
+    def __init__(self, registry: MetricsRegistry = REGISTRY, directory: Optional[str] = None,
+                 flush_interval: float = 5.0):
+        self.registry = registry
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._own_file = os.path.join(directory, f"worker-{os.getpid()}-{uuid.uuid4().hex[:8]}.json") if directory else None
+        self._flusher: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "MetricsExporter":
+        return cls(
+            directory=os.getenv("METRICS_DIR") or None,
+            flush_interval=float(os.getenv("METRICS_FLUSH_INTERVAL", "5")),
+        )
+
+    def _write(self):
+        tmp = f"{self._own_file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp, self._own_file)
+
+    def _read_others(self) -> List[dict]:
+        snapshots = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".json") or path == self._own_file:
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                logger.warning("Skipping unreadable metrics file %s", path)
+        return snapshots
+
+    async def render(self) -> str:
+        snapshots = [self.registry.snapshot()]
+        if self.directory:
+            snapshots += await asyncio.to_thread(self._read_others)
+        return self.registry.render(snapshots)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self._write)
+            except OSError:
+                logger.exception("Failed to write metrics snapshot")
+
+    def start(self):
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._flusher = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            await asyncio.to_thread(self._write)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request and counting error responses.
+
+    Requests are labelled with the route template rather than the raw
+    path, so path parameters do not multiply series. Error responses
+    are classed by the `error_code` an exception handler left in the
+    request state (e.g. upstream_timeout), else by status.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+        finished = False
+
+        async def send_and_observe(message):
+            nonlocal status, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finished = True
+                self._observe(scope, status, started)
+
+        try:
+            await self.app(scope, receive, send_and_observe)
+        except Exception:
+            if not finished:
+                self._observe(scope, 500, started)
+            raise
+
+    @staticmethod
+    def _observe(scope, status: int, started: float):
+        path = _route_template(scope)
+        REQUEST_LATENCY.observe(time.perf_counter() - started, path, scope["method"], str(status))
+        if status >= 400:
+            code = (scope.get("state") or {}).get("error_code") or _status_class(status)
+            REQUEST_ERRORS.inc(path, str(status), code)
+
+
+@lru_cache(maxsize=4)
+def _path_templates(app) -> List[Tuple[Pattern, str]]:
+    """(regex, template) for every documented route of `app`"""
+    return [(compile_path(path)[0], path) for path in app.openapi()["paths"]]
+
+
+def _route_template(scope) -> str:
+    """Request path with path parameters put back as {name}; "unmatched" for 404s"""
+    if scope.get("route") is None:
+        # Requests turned away by RateLimitMiddleware never reach routing
+        for pattern, template in _path_templates(scope["app"]):
+            if pattern.match(scope["path"]):
+                return template
+        return "unmatched"
+    params = {str(value): "{" + name + "}" for name, value in scope.get("path_params", {}).items()}
+    if not params:
+        return scope["path"]
+    return "/".join(params.get(segment, segment) for segment in scope["path"].split("/"))
+
+
+def _status_class(status: int) -> str:
+    if status == 429:
+        return "rate_limited"
+    if status >= 500:
+        return "internal_error"
+    return "client_error"
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(await request.app.state.metrics.render(), media_type="text/plain; version=0.0.4")
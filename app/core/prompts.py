@@ -0,0 +1,124 @@
+import logging
+import string
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional; token counts fall back to an estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# model -> (context window, max completion tokens)
+MODEL_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gpt-4-turbo-preview": (128000, 4096),
+    "gpt-4": (8192, 4096),
+    "gpt-3.5-turbo": (16385, 4096),
+}
+DEFAULT_LIMITS = (8192, 4096)
+
+# Per-message framing overhead of the chat format, in tokens
+MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """Token count of `text` for `model`.
+
+    Exact when tiktoken is installed, otherwise ~4 characters per token,
+    which is close enough for budgeting English prompts.
+    """
+    if tiktoken is not None:
+        return len(_encoding(model).encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(messages: List[dict], model: str = "gpt-3.5-turbo") -> int:
+    return sum(count_tokens(m["content"], model) + MESSAGE_OVERHEAD for m in messages) + 3
+
+
+class PromptError(ValueError):
+    """A prompt could not be rendered from the given fields"""
+
+
+class PromptTooLarge(PromptError):
+    """The rendered prompt leaves no room for a useful completion"""
+
+
+@dataclass(frozen=True)
+class RenderedPrompt:
+    model: str
+    messages: List[dict]
+    prompt_tokens: int
+    max_tokens: int  # completion budget that still fits the context window
+
+
+class PromptTemplate:
+    """A tool's system and user prompt, parsed once at import.
+
+    render() checks that exactly the template's fields were supplied,
+    formats both messages, counts their tokens and sizes max_tokens to what
+    is left of the model's context window (never more than `max_tokens`).
+    Inputs that would push the prompt past `max_input_tokens`, or leave
+    fewer than `min_completion_tokens`, raise PromptTooLarge before any
+    upstream call is made.
+    """
+
+    def __init__(self, name: str, model: str, system: str, user: str, max_tokens: int,
+                 max_input_tokens: Optional[int] = None, min_completion_tokens: int = 256):
+        self.name = name
+        self.model = model
+        self.system = system
+        self.user = user
+        self.max_tokens = max_tokens
+        self.max_input_tokens = max_input_tokens
+        self.min_completion_tokens = min_completion_tokens
+        self.fields: FrozenSet[str] = frozenset(
+            field.split(".")[0].split("[")[0]
+            for template in (system, user)
+            for _, field, _, _ in string.Formatter().parse(template)
+            if field
+        )
+
+    def render(self, **values) -> RenderedPrompt:
+        missing = self.fields - values.keys()
+        if missing:
+            raise PromptError(f"Prompt {self.name} is missing fields: {', '.join(sorted(missing))}")
+        values = {field: values[field] for field in self.fields}
+        messages = [
+            {"role": "system", "content": self.system.format_map(values)},
+            {"role": "user", "content": self.user.format_map(values)},
+        ]
+        prompt_tokens = count_message_tokens(messages, self.model)
+        context_window, max_output = MODEL_LIMITS.get(self.model, DEFAULT_LIMITS)
+        if self.max_input_tokens is not None and prompt_tokens > self.max_input_tokens:
+            raise PromptTooLarge(
+                f"Input too long for {self.name}: {prompt_tokens} prompt tokens (limit {self.max_input_tokens})"
+            )
+        max_tokens = min(self.max_tokens, max_output, context_window - prompt_tokens)
+        if max_tokens < self.min_completion_tokens:
+            raise PromptTooLarge(
+                f"Input too long for {self.name}: {prompt_tokens} prompt tokens leave no room for a response"
+            )
+        logger.debug("prompt %s: %d prompt tokens, max_tokens %d", self.name, prompt_tokens, max_tokens)
+        return RenderedPrompt(self.model, messages, prompt_tokens, max_tokens)
+
+
+PROMPTS: Dict[str, PromptTemplate] = {}
+
+
+def register_prompt(name: str, model: str, system: str, user: str, max_tokens: int, **options) -> PromptTemplate:
+    """Compile a tool's prompt into the central registry"""
+    if name in PROMPTS:
+        raise ValueError(f"Prompt {name} is already registered")
+    template = PROMPTS[name] = PromptTemplate(name, model, system, user, max_tokens, **options)
+    return template
@@ -0,0 +1,330 @@
+import asyncio
+import random
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+import httpx
+import openai
+from openai import AsyncOpenAI
+
+from app.core.resilience import CircuitBreaker, UpstreamError, UpstreamRateLimited, UpstreamRejected, UpstreamTimeout
+
+try:
+    import anthropic
+except ImportError:  # only needed when the Anthropic provider is enabled
+    anthropic = None
+
+
+# Provider-neutral completion, shaped like the OpenAI response the tools read
+@dataclass
+class CompletionMessage:
+    content: str
+    role: str = "assistant"
+
+
+@dataclass
+class CompletionChoice:
+    message: CompletionMessage
+    finish_reason: Optional[str] = None
+
+
+@dataclass
+class CompletionUsage:
+    prompt_tokens: int
+    completion_tokens: int
+    finish_reason: Optional[str] = None  # set on the last item of a stream
+
+
+@dataclass
+class ChatResult:
+    model: str
+    choices: List[CompletionChoice]
+    usage: Optional[CompletionUsage] = None
+
+    @classmethod
+    def of(cls, model: str, content: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+           finish_reason: Optional[str] = "stop") -> "ChatResult":
+        return cls(model, [CompletionChoice(CompletionMessage(content), finish_reason)],
+                   CompletionUsage(prompt_tokens, completion_tokens))
+
+
+# A stream yields text deltas and, once at the end, a CompletionUsage
+StreamItem = Union[str, CompletionUsage]
+
+
+class LatencyWindow:
+    """Recent latencies of one provider and model, for hedging deadlines"""
+
+    def __init__(self, size: int = 200):
+        self.samples: deque = deque(maxlen=size)
+        self._quantiles: Dict[float, float] = {}
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+        if len(self.samples) % 20 == 0:
+            self._quantiles.clear()
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Latency below which a fraction `q` of recent calls finished; None until 20 samples"""
+        if len(self.samples) < 20:
+            return None
+        value = self._quantiles.get(q)
+        if value is None:
+            ordered = sorted(self.samples)
+            value = self._quantiles[q] = ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        return value
+
+
+class Provider:
+    """One chat completion backend.
+
+    Subclasses implement complete() and stream() for the logical (OpenAI)
+    model names in `models`, translating upstream failures into UpstreamError
+    subclasses so the gateway can fail over (or, for UpstreamRejected, not). `retry` says whether
+    the SDK's own retries are wanted, which is only the case when nothing
+    is left to fail over to.
+    """
+
+    name = "provider"
+
+    def __init__(self, models: Optional[Dict[str, str]] = None, breaker: Optional[CircuitBreaker] = None):
+        self.models = models  # logical model -> provider model; None serves every model as named
+        self.breaker = breaker or CircuitBreaker()
+        self._latency: Dict[str, LatencyWindow] = {}
+
+    def supports(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def model_for(self, model: str) -> str:
+        return model if self.models is None else self.models[model]
+
+    def latency(self, model: str) -> LatencyWindow:
+        window = self._latency.get(model)
+        if window is None:
+            window = self._latency[model] = LatencyWindow()
+        return window
+
+    async def complete(self, model: str, messages: list, retry: bool = True, **params) -> ChatResult:
+        raise NotImplementedError
+
+    def stream(self, model: str, messages: list, retry: bool = True, **params) -> AsyncIterator[StreamItem]:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {
+            "provider": self.name,
+            "breaker": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "p95_latency_ms": {
+                model: round(window.quantile(0.95) * 1000, 1)
+                for model, window in self._latency.items()
+                if window.quantile(0.95) is not None
+            },
+        }
+
+    async def aclose(self):
+        pass
+
+
+# Every SDK failure, including auth/permission errors and errors sent mid-stream
+OPENAI_ERRORS = (openai.APIError,)
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 http_client: Optional[httpx.AsyncClient] = None, max_retries: int = 2, **options):
+        super().__init__(**options)
+        self.http_client = http_client or httpx.AsyncClient()
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=max_retries,
+                                  http_client=self.http_client)
+        self._no_retry_client = self.client.with_options(max_retries=0)
+
+    def _upstream_error(self, error: Exception) -> UpstreamError:
+        if isinstance(error, openai.RateLimitError):
+            return UpstreamRateLimited(self.name, "rate limited")
+        if isinstance(error, openai.APITimeoutError):
+            return UpstreamTimeout(self.name, "timed out")
+        if isinstance(error, (openai.BadRequestError, openai.UnprocessableEntityError)):
+            return UpstreamRejected(self.name, str(error))
+        return UpstreamError(self.name, str(error))
+
+    async def complete(self, model: str, messages: list, retry: bool = True, **params):
+        client = self.client if retry else self._no_retry_client
+        try:
+            return await client.chat.completions.create(model=self.model_for(model), messages=messages, **params)
+        except OPENAI_ERRORS as e:
+            raise self._upstream_error(e) from e
+
+    async def stream(self, model: str, messages: list, retry: bool = True, **params):
+        client = self.client if retry else self._no_retry_client
+        try:
+            stream = await client.chat.completions.create(
+                model=self.model_for(model), messages=messages, stream=True,
+                stream_options={"include_usage": True}, **params
+            )
+        except OPENAI_ERRORS as e:
+            raise self._upstream_error(e) from e
+        usage, finish_reason = None, None
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                if choice.delta.content:
+                    yield choice.delta.content
+        except OPENAI_ERRORS as e:
+            raise self._upstream_error(e) from e
+        yield CompletionUsage(usage.prompt_tokens if usage else 0, usage.completion_tokens if usage else 0, finish_reason)
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+# Logical model -> Claude model used when failing over to Anthropic
+ANTHROPIC_MODELS = {
+    "gpt-4-turbo-preview": "claude-3-5-sonnet-latest",
+    "gpt-4": "claude-3-5-sonnet-latest",
+    "gpt-3.5-turbo": "claude-3-5-haiku-latest",
+}
+
+ANTHROPIC_ERRORS = (anthropic.APIError,) if anthropic is not None else ()
+
+# Messages API stop reasons in OpenAI's finish_reason vocabulary
+_STOP_REASONS = {"end_turn": "stop", "stop_sequence": "stop", "max_tokens": "length"}
+
+# OpenAI-only request options the Messages API does not take
+_OPENAI_ONLY_PARAMS = ("response_format", "stream_options", "presence_penalty", "frequency_penalty")
+
+
+class AnthropicProvider(Provider):
+    name = "anthropic"
+
+    def __init__(self, api_key: Optional[str] = None, max_retries: int = 2,
+                 http_client: Optional[httpx.AsyncClient] = None, **options):
+        if anthropic is None:
+            raise RuntimeError("The anthropic package is required for the Anthropic provider")
+        options.setdefault("models", ANTHROPIC_MODELS)
+        super().__init__(**options)
+        self.http_client = http_client or httpx.AsyncClient()
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=max_retries,
+                                               http_client=self.http_client)
+        self._no_retry_client = self.client.with_options(max_retries=0)
+
+    def _request(self, model: str, messages: list, params: dict) -> dict:
+        # The Messages API takes one system prompt and strictly alternating turns
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        turns: List[dict] = []
+        for message in messages:
+            if message["role"] == "system":
+                continue
+            if turns and turns[-1]["role"] == message["role"]:
+                turns[-1]["content"] += "\n\n" + message["content"]
+            else:
+                turns.append({"role": message["role"], "content": message["content"]})
+        request = {key: value for key, value in params.items() if key not in _OPENAI_ONLY_PARAMS}
+        request.setdefault("max_tokens", 1024)
+        if system:
+            request["system"] = system
+        return {"model": self.model_for(model), "messages": turns, **request}
+
+    def _upstream_error(self, error: Exception) -> UpstreamError:
+        if isinstance(error, anthropic.RateLimitError):
+            return UpstreamRateLimited(self.name, "rate limited")
+        if isinstance(error, anthropic.APITimeoutError):
+            return UpstreamTimeout(self.name, "timed out")
+        if isinstance(error, (anthropic.BadRequestError, anthropic.UnprocessableEntityError)):
+            return UpstreamRejected(self.name, str(error))
+        return UpstreamError(self.name, str(error))
+
+    async def complete(self, model: str, messages: list, retry: bool = True, **params) -> ChatResult:
+        client = self.client if retry else self._no_retry_client
+        try:
+            response = await client.messages.create(**self._request(model, messages, params))
+        except ANTHROPIC_ERRORS as e:
+            raise self._upstream_error(e) from e
+        content = "".join(block.text for block in response.content if block.type == "text")
+        return ChatResult.of(model, content, response.usage.input_tokens, response.usage.output_tokens,
+                             _STOP_REASONS.get(response.stop_reason, response.stop_reason))
+
+    async def stream(self, model: str, messages: list, retry: bool = True, **params):
+        client = self.client if retry else self._no_retry_client
+        try:
+            stream = await client.messages.create(stream=True, **self._request(model, messages, params))
+        except ANTHROPIC_ERRORS as e:
+            raise self._upstream_error(e) from e
+        prompt_tokens = completion_tokens = 0
+        stop_reason = None
+        try:
+            async for event in stream:
+                if event.type == "message_start":
+                    prompt_tokens = event.message.usage.input_tokens
+                elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                    yield event.delta.text
+                elif event.type == "message_delta":
+                    completion_tokens = event.usage.output_tokens
+                    stop_reason = event.delta.stop_reason
+        except ANTHROPIC_ERRORS as e:
+            raise self._upstream_error(e) from e
+        yield CompletionUsage(prompt_tokens, completion_tokens, _STOP_REASONS.get(stop_reason, stop_reason))
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+class FakeProvider(Provider):
+    """Local stand-in backend for load and failover testing.
+
+    Waits `latency` seconds (plus up to `jitter`) per call and fails a
+    fraction `error_rate` of calls with UpstreamError and
+    `rate_limit_rate` with UpstreamRateLimited. Replies echo the last
+    message unless `reply` is set, and end with `finish_reason`.
+    """
+
+    def __init__(self, name: str = "fake", latency: float = 0.05, jitter: float = 0.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, reply: Optional[str] = None,
+                 seed: Optional[int] = None, finish_reason: str = "stop", **options):
+        super().__init__(**options)
+        self.name = name
+        self.delay = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.reply = reply
+        self.finish_reason = finish_reason
+        self._random = random.Random(seed)
+
+    async def _wait_and_maybe_fail(self, timeout: Optional[float]):
+        delay = self.delay + self._random.uniform(0, self.jitter)
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise UpstreamTimeout(self.name, "timed out")
+        await asyncio.sleep(delay)
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            raise UpstreamRateLimited(self.name, "rate limited")
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise UpstreamError(self.name, "injected failure")
+
+    def _content(self, messages: list) -> str:
+        return self.reply if self.reply is not None else f"[{self.name}] {messages[-1]['content'][:200]}"
+
+    async def complete(self, model: str, messages: list, retry: bool = True, **params) -> ChatResult:
+        await self._wait_and_maybe_fail(params.get("timeout"))
+        content = self._content(messages)
+        return ChatResult.of(model, content, sum(len(m["content"]) // 4 for m in messages), len(content) // 4,
+                             self.finish_reason)
+
+    async def stream(self, model: str, messages: list, retry: bool = True, **params):
+        await self._wait_and_maybe_fail(params.get("timeout"))
+        content = self._content(messages)
+        for word in content.split(" "):
+            yield word + " "
+            await asyncio.sleep(0)
+        yield CompletionUsage(sum(len(m["content"]) // 4 for m in messages), len(content) // 4, self.finish_reason)
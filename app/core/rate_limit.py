@@ -0,0 +1,289 @@
+import asyncio
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from app.core.identity import current_client, verify_user_token
+from app.core.prompts import PROMPTS
+
+# Token-bucket budget per (user, tool), in LLM tokens: (capacity, refill per second)
+TIER_BUDGETS: Dict[str, Tuple[float, float]] = {
+    "free": (8000, 8000 / 60),
+    "starter": (24000, 24000 / 60),
+    "growth": (80000, 80000 / 60),
+    "enterprise": (400000, 400000 / 60),
+}
+
+# Credits per rolling metering window (a day by default); None is unlimited
+TIER_CREDIT_QUOTAS: Dict[str, Optional[int]] = {
+    "free": 20,
+    "starter": 200,
+    "growth": 1000,
+    "enterprise": None,
+}
+
+# Prompts each tool route can render in one call. Its cost is their combined
+# max_tokens, read from the prompt registry when a request arrives so the
+# two cannot drift; a name ending in "*" stands for every prompt with that prefix
+TOOL_PROMPTS: Dict[str, Tuple[str, ...]] = {
+    "/api/tools/generate-business-plan": ("business_plan",),
+    "/api/tools/generate-business-plan-sections": ("business_plan_part_*",),
+    "/api/tools/regenerate-business-plan-section": ("business_plan_section",),
+    "/api/tools/generate-pitch-deck": ("pitch_deck",),
+    "/api/tools/regenerate-pitch-deck-slide": ("pitch_deck_slide",),
+    "/api/tools/market-research": ("market_research",),
+    "/api/tools/generate-content": ("content_generator",),
+    "/api/tools/financial-forecast": ("financial_forecast",),
+    "/api/tools/analyze-time-usage": ("time_usage",),
+    "/api/tools/calendar-optimization": ("calendar_commentary",),
+    "/api/tools/prioritize-tasks": ("task_narration",),
+    "/api/tools/generate-schedule": ("task_narration",),
+    "/api/tools/analyze-support-ticket": ("support_ticket_analysis",),
+    "/api/tools/generate-support-response": ("support_response",),
+    # One sample answer per common question (CHATBOT_MAX_SAMPLE_QUESTIONS, 5 by default)
+    "/api/tools/create-chatbot-config": ("chatbot_sample_response",) * 5,
+    "/api/tools/chatbot-config/{id}": ("chatbot_sample_response",) * 5,
+}
+
+# Tools that render no registered prompt
+FIXED_COSTS: Dict[str, int] = {
+    # A conversation turn, routed with a 300-token reply budget
+    "/api/tools/chatbot-respond": 300,
+    # Admission only: each batch of a bulk import is charged per ticket as it runs
+    "/api/tools/analyze-support-tickets/bulk": 1000,
+    # No LLM call, but NumPy sweeps and file rendering are CPU-heavy
+    "/api/tools/financial-forecast/scenarios": 1000,
+    "/api/tools/financial-forecast/monte-carlo": 1000,
+    "/api/tools/export-document": 300,
+}
+
+# POST and PUT requests under these prefixes are always throttled; a route
+# in neither table above costs DEFAULT_TOOL_COST, so new tools are covered
+THROTTLED_PREFIXES = ("/api/tools/", "/api/jobs")
+DEFAULT_TOOL_COST = 2000
+JOBS_PATH = "/api/jobs"
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def tool_route(path: str) -> Optional[str]:
+    """The throttled route a request path belongs to (numeric ids become {id}), or None"""
+    if not path.startswith(THROTTLED_PREFIXES):
+        return None
+    return _ID_SEGMENT.sub("/{id}", path)
+
+
+def _max_tokens(name: str) -> int:
+    if name.endswith("*"):
+        return sum(t.max_tokens for prompt, t in PROMPTS.items() if prompt.startswith(name[:-1]))
+    return PROMPTS[name].max_tokens
+
+
+def tool_cost(route: str) -> int:
+    """Token-bucket cost of one call to a throttled route"""
+    if route in FIXED_COSTS:
+        return FIXED_COSTS[route]
+    if route == JOBS_PATH:
+        # Queued jobs are charged as the most expensive tool they can run
+        return max(map(tool_cost, TOOL_PROMPTS))
+    prompts = TOOL_PROMPTS.get(route)
+    if prompts is None:
+        return DEFAULT_TOOL_COST
+    return sum(_max_tokens(name) for name in prompts)
+
+
+# Token cost of each ticket a bulk import sends to the LLM (prompt plus its share of the reply)
+BULK_TICKET_COST = 600
+
+
+class MemoryBucketStore:
+    """Per-process token buckets.
+
+    Buckets that have refilled to capacity hold no state worth keeping, so
+    once more than `max_keys` exist the full ones are dropped; if that is
+    not enough, the least recently used go too.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> (tokens, updated_at, full_at)
+        self._buckets: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+
+    async def take(self, key: str, cost: float, capacity: float, refill_rate: float) -> float:
+        """Consume `cost` tokens; return 0 if allowed, else seconds to wait"""
+        now = time.monotonic()
+        tokens, updated_at, _ = self._buckets.get(key, (capacity, now, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / refill_rate
+        self._buckets[key] = (tokens, now, now + (capacity - tokens) / refill_rate)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._evict(now)
+        return wait
+
+    def _evict(self, now: float):
+        for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+        # Leave headroom so the sweep does not run again on the next take()
+        while len(self._buckets) > self.max_keys * 0.9:
+            self._buckets.popitem(last=False)
+
+    async def aclose(self):
+        self._buckets.clear()
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file shared by every worker on the host.
+
+    Each take() is a single read-modify-write inside BEGIN IMMEDIATE, so
+    concurrent workers never double-spend a bucket. Any store exposing the
+    same async take()/aclose() (e.g. a Redis script) can replace it.
+    """
+
+    def __init__(self, path: str = "rate_limit.db"):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _take(self, key: str, cost: float, capacity: float, refill_rate: float) -> float:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at FROM token_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * refill_rate)
+                wait = 0.0
+                if tokens >= cost:
+                    tokens -= cost
+                else:
+                    wait = (cost - tokens) / refill_rate
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO token_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    async def take(self, key: str, cost: float, capacity: float, refill_rate: float) -> float:
+        return await asyncio.to_thread(self._take, key, cost, capacity, refill_rate)
+
+    async def aclose(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_bucket_store_from_env():
+    """Pick the bucket store from RATE_LIMIT_BACKEND (memory or sqlite)"""
+    if os.getenv("RATE_LIMIT_BACKEND", "memory") == "sqlite":
+        return SQLiteBucketStore(os.getenv("RATE_LIMIT_PATH", "rate_limit.db"))
+    return MemoryBucketStore(int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")))
+
+
+class RateLimitMiddleware:
+    """ASGI admission control for the AI tool endpoints.
+
+    Every POST or PUT under THROTTLED_PREFIXES spends the tool's cost
+    (tool_cost) from a token
+    bucket keyed by (client, tool) and sized by the caller's subscription
+    tier, and is held to the tier's credit quota. The client is the user
+    proven by a signed X-User-Token; anything unverified is keyed by client
+    IP and gets the free tier (run uvicorn with --proxy-headers behind a
+    proxy so the IP is the caller's). Rejected requests get a 429 with
+    Retry-After. Other paths pass straight through.
+
+    Relies on app.state.rate_limits, app.state.tiers and app.state.meter
+    created in the lifespan hook.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+        route = tool_route(scope["path"])
+        if route is None:
+            return await self.app(scope, receive, send)
+        cost = tool_cost(route)
+
+        state = scope["app"].state
+        user_id = verify_user_token(_header(scope, b"x-user-token"))
+        tier = await state.tiers.tier_for(user_id)
+        capacity, refill_rate = TIER_BUDGETS.get(tier, TIER_BUDGETS["free"])
+        client = f"user:{user_id}" if user_id is not None else f"ip:{_client_ip(scope)}"
+
+        quota = TIER_CREDIT_QUOTAS.get(tier)
+        if quota is not None:
+            used, retry_after = await state.meter.usage(client)
+            if used >= quota:
+                return await _reject(send, retry_after, f"{tier} plan usage quota exhausted")
+
+        wait = await state.rate_limits.take(f"{client}:{route}", cost, capacity, refill_rate)
+        if wait > 0:
+            return await _reject(send, wait, "Rate limit exceeded")
+        # Lets the usage meter charge LLM calls made for this request to the same client
+        token = current_client.set(client)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_client.reset(token)
+
+
+async def throttle(state, client: str, tier: str, path: str, cost: float):
+    """Spend `cost` from the client's bucket for `path`, waiting for it to refill instead of rejecting.
+
+    For work metered after admission, such as the batches of a bulk import.
+    """
+    capacity, refill_rate = TIER_BUDGETS.get(tier, TIER_BUDGETS["free"])
+    cost = min(cost, capacity)
+    while True:
+        wait = await state.rate_limits.take(f"{client}:{path}", cost, capacity, refill_rate)
+        if wait <= 0:
+            return
+        await asyncio.sleep(wait)
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _client_ip(scope) -> str:
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _reject(send, retry_after: float, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from app.core.metrics import UPSTREAM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class UpstreamError(Exception):
+    """An outbound call failed for reasons on the upstream's side.
+
+    `status_code` and `code` are what the API answers with, so clients can
+    tell a slow upstream from a throttled or broken one.
+    """
+
+    status_code = 502
+    code = "upstream_error"
+    retryable = True
+
+    def __init__(self, upstream: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{upstream}: {message}")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class UpstreamTimeout(UpstreamError):
+    status_code = 504
+    code = "upstream_timeout"
+
+
+class UpstreamRateLimited(UpstreamError):
+    status_code = 503
+    code = "upstream_rate_limited"
+
+
+class CircuitOpen(UpstreamError):
+    """Refused locally because the upstream's breaker is open"""
+
+    status_code = 503
+    code = "upstream_unavailable"
+    retryable = False
+
+
+class UpstreamRejected(UpstreamError):
+    """The upstream refused the request itself (bad input); never retried"""
+
+    status_code = 400
+    code = "bad_input"
+    retryable = False
+
+
+class CircuitBreaker:
+    """Stops sending traffic to a failing upstream.
+
+    Opens after `failure_threshold` consecutive failures; after `cooldown`
+    seconds one trial call is let through (half-open) and its outcome
+    closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release(self):
+        """A call was abandoned (e.g. lost a hedge) without an outcome"""
+        self._trial_in_flight = False
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for retry `attempt` (1-based)"""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class Upstream:
+    """Policy for calls to one external service.
+
+    call() refuses immediately while the breaker is open, bounds each
+    attempt by `timeout`, and retries retryable failures with jittered
+    exponential backoff, but only for calls marked idempotent. `classify`
+    turns the service's own exceptions into UpstreamError subclasses;
+    anything it returns None for is passed through untouched.
+
+    Set `abandon_on_timeout` to False for calls that enforce `timeout`
+    themselves, such as blocking SDK calls on a thread pool whose HTTP
+    session has that timeout: abandoning those only stops waiting, while
+    the thread keeps its pool slot and the request may still land.
+    """
+
+    def __init__(self, name: str, timeout: float, retries: int = 2, backoff_base: float = 0.25,
+                 backoff_cap: float = 4.0, breaker: Optional[CircuitBreaker] = None,
+                 classify: Optional[Callable[[Exception], Optional[UpstreamError]]] = None,
+                 abandon_on_timeout: bool = True):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = breaker or CircuitBreaker()
+        self.classify = classify or (lambda error: None)
+        self.abandon_on_timeout = abandon_on_timeout
+
+    async def call(self, fn: Callable[[], Awaitable[T]], idempotent: bool = False) -> T:
+        attempts = 1 + (self.retries if idempotent else 0)
+        for attempt in range(1, attempts + 1):
+            if not self.breaker.allow():
+                raise CircuitOpen(self.name, "temporarily unavailable", self.breaker.retry_after())
+            try:
+                result = await (asyncio.wait_for(fn(), timeout=self.timeout) if self.abandon_on_timeout else fn())
+            except asyncio.TimeoutError:
+                error: UpstreamError = UpstreamTimeout(self.name, f"no response within {self.timeout:g}s")
+            except UpstreamError as e:
+                error = e
+            except Exception as e:
+                classified = self.classify(e)
+                if classified is None:
+                    self.breaker.release()
+                    raise
+                error = classified
+                error.__cause__ = e
+            else:
+                self.breaker.record_success()
+                return result
+            UPSTREAM_ERRORS.inc(self.name, error.code)
+            if isinstance(error, UpstreamRejected):
+                self.breaker.release()
+            else:
+                self.breaker.record_failure()
+            if not error.retryable or attempt == attempts:
+                raise error
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+            logger.warning("%s (attempt %d/%d), retrying in %.2fs", error, attempt, attempts, delay)
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")
+
+
+async def upstream_error_handler(request: Request, exc: UpstreamError) -> JSONResponse:
+    """Answer UpstreamError with its own status and machine-readable code"""
+    request.state.error_code = exc.code  # picked up by MetricsMiddleware
+    headers = {"Retry-After": str(max(1, round(exc.retry_after)))} if exc.retry_after else None
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc), "code": exc.code},
+        headers=headers,
+    )
+
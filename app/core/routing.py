@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from fastapi import APIRouter, Request
+
+from app.core.identity import TierResolver
+from app.core.prompts import DEFAULT_LIMITS, MODEL_LIMITS, RenderedPrompt, count_message_tokens
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@dataclass(frozen=True)
+class RouteRule:
+    """One row of the routing policy; unset conditions match anything.
+
+    `when` matches request attributes such as content_type or length, e.g.
+    {"length": {"short"}}. `max_tokens` caps the completion budget and
+    `fallbacks` are tried in order when `model` times out or is throttled.
+    """
+    model: str
+    tools: Optional[FrozenSet[str]] = None
+    tiers: Optional[FrozenSet[str]] = None
+    when: Dict[str, FrozenSet[str]] = field(default_factory=dict)
+    max_prompt_tokens: Optional[int] = None
+    max_tokens: Optional[int] = None
+    fallbacks: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RouteRule":
+        return cls(
+            model=data["model"],
+            tools=frozenset(data["tools"]) if data.get("tools") else None,
+            tiers=frozenset(data["tiers"]) if data.get("tiers") else None,
+            when={key: frozenset(values) for key, values in (data.get("when") or {}).items()},
+            max_prompt_tokens=data.get("max_prompt_tokens"),
+            max_tokens=data.get("max_tokens"),
+            fallbacks=tuple(data.get("fallbacks") or ()),
+            timeout=data.get("timeout"),
+        )
+
+    def matches(self, tool: str, tier: str, prompt_tokens: int, attributes: Dict[str, str]) -> bool:
+        return (
+            (self.tools is None or tool in self.tools)
+            and (self.tiers is None or tier in self.tiers)
+            and (self.max_prompt_tokens is None or prompt_tokens <= self.max_prompt_tokens)
+            and all(attributes.get(key) in values for key, values in self.when.items())
+        )
+
+
+_CHEAP = "gpt-3.5-turbo"
+_STRONG = "gpt-4-turbo-preview"
+
+# First matching rule wins
+DEFAULT_POLICY: List[RouteRule] = [
+    # Short-form content does not need GPT-4 on any plan
+    RouteRule(_CHEAP, tools=frozenset({"content_generator"}), when={"content_type": frozenset({"social"})}, max_tokens=600),
+    RouteRule(_CHEAP, tools=frozenset({"content_generator"}), when={"length": frozenset({"short"})}, max_tokens=800),
+    RouteRule(_CHEAP, tools=frozenset({"chatbot_builder", "conversation_summary"})),
+    # Small structured analyses are fine on the cheap model below the top plans
+    RouteRule(_CHEAP, tools=frozenset({"customer_support", "task_manager", "time_management"}),
+              tiers=frozenset({"free", "starter"}), max_prompt_tokens=1500),
+    # Free plan stays on the cheap model unless the prompt outgrows its context.
+    # No max_tokens cap: long documents (plans, decks) keep the tool's full budget
+    RouteRule(_CHEAP, tiers=frozenset({"free"}), max_prompt_tokens=12000),
+    RouteRule(_STRONG, fallbacks=(_CHEAP,), timeout=90),
+]
+
+
+@dataclass(frozen=True)
+class Route:
+    """The model and completion budget chosen for one request"""
+    tool: str
+    tier: str
+    model: str
+    max_tokens: int
+    fallbacks: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+    rule: int = -1  # index of the matching policy rule, -1 for the tool default
+
+
+class RouteStats:
+    __slots__ = ("decisions", "completions", "fallbacks", "latency_total", "latency_max")
+
+    def __init__(self):
+        self.decisions = 0
+        self.completions = 0
+        self.fallbacks = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+
+class ModelRouter:
+    """Chooses the model and max_tokens for each tool call from a policy table.
+
+    Rules are matched in order on tool name, subscription tier, estimated
+    prompt tokens and request attributes (content_type, length). The
+    policy can be replaced with a JSON list of rules via MODEL_ROUTING_POLICY.
+    Decisions and the latency of the completions they lead to are counted
+    per (tool, model) for /routing/stats.
+    """
+
+    def __init__(self, tiers: TierResolver, policy: Optional[List[RouteRule]] = None):
+        self.tiers = tiers
+        self.policy = policy if policy is not None else DEFAULT_POLICY
+        self._stats: Dict[Tuple[str, str], RouteStats] = {}
+
+    @classmethod
+    def from_env(cls, tiers: TierResolver) -> "ModelRouter":
+        path = os.getenv("MODEL_ROUTING_POLICY")
+        if not path:
+            return cls(tiers)
+        with open(path) as f:
+            return cls(tiers, [RouteRule.from_dict(rule) for rule in json.load(f)])
+
+    def _entry(self, tool: str, model: str) -> RouteStats:
+        entry = self._stats.get((tool, model))
+        if entry is None:
+            entry = self._stats[(tool, model)] = RouteStats()
+        return entry
+
+    def choose(self, tool: str, tier: str, prompt_tokens: int, model: str, max_tokens: int,
+               **attributes: str) -> Route:
+        """Route a call whose tool default is `model` with `max_tokens`"""
+        route = Route(tool, tier, model, max_tokens)
+        for index, rule in enumerate(self.policy):
+            if rule.matches(tool, tier, prompt_tokens, attributes):
+                context_window, max_output = MODEL_LIMITS.get(rule.model, DEFAULT_LIMITS)
+                budget = min(max_tokens, rule.max_tokens or max_tokens, max_output, context_window - prompt_tokens)
+                if budget > 0:
+                    route = Route(tool, tier, rule.model, budget, rule.fallbacks, rule.timeout, index)
+                    break
+        self._entry(tool, route.model).decisions += 1
+        logger.debug("route %s tier=%s tokens=%d -> %s (rule %d)", tool, tier, prompt_tokens, route.model, route.rule)
+        return route
+
+    async def route(self, tool: str, user_id: Optional[int], prompt_tokens: int, model: str, max_tokens: int,
+                    **attributes: str) -> Route:
+        return self.choose(tool, await self.tiers.tier_for(user_id), prompt_tokens, model, max_tokens, **attributes)
+
+    async def route_prompt(self, tool: str, user_id: Optional[int], prompt: RenderedPrompt,
+                           **attributes: str) -> Route:
+        return await self.route(tool, user_id, prompt.prompt_tokens, prompt.model, prompt.max_tokens, **attributes)
+
+    async def route_messages(self, tool: str, user_id: Optional[int], messages: List[dict], model: str,
+                             max_tokens: int, **attributes: str) -> Route:
+        """Route an inline prompt, estimating its size from `messages`"""
+        return await self.route(tool, user_id, count_message_tokens(messages, model), model, max_tokens, **attributes)
+
+    def on_completion(self, event):
+        """LLMGateway listener: per-route latency and fallback counts"""
+        entry = self._entry(event.tool or "unknown", event.model)
+        entry.completions += 1
+        entry.latency_total += event.latency
+        entry.latency_max = max(entry.latency_max, event.latency)
+        if event.fallback_from is not None:
+            entry.fallbacks += 1
+
+    def stats(self) -> dict:
+        return {
+            "routes": [
+                {
+                    "tool": tool,
+                    "model": model,
+                    "decisions": entry.decisions,
+                    "completions": entry.completions,
+                    "fallbacks_served": entry.fallbacks,
+                    "avg_latency_ms": round(entry.latency_total / entry.completions * 1000, 1) if entry.completions else 0.0,
+                    "max_latency_ms": round(entry.latency_max * 1000, 1),
+                }
+                for (tool, model), entry in sorted(self._stats.items())
+            ]
+        }
+
+
+def get_model_router(request: Request) -> ModelRouter:
+    """FastAPI dependency returning the model router created in the app lifespan"""
+    return request.app.state.model_router
+
+
+@router.get("/routing/stats")
+async def routing_stats(request: Request):
+    """Routing decisions, fallbacks and completion latency per tool and model"""
+    return get_model_router(request).stats()
@@ -0,0 +1,332 @@
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from fastapi import APIRouter, Request
+
+from app.core.metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+_WORD = re.compile(r"[a-z0-9']+")
+# Emails and anything with a digit (order numbers, amounts, dates)
+_IDENTIFIER = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+|\w*\d[\w-]*")
+_DATE_WORDS = frozenset(
+    "monday tuesday wednesday thursday friday saturday sunday today tomorrow yesterday "
+    "january february march april june july august september october november december".split()
+)
+
+
+def identifiers(text: str) -> str:
+    """The tokens of `text` that name a specific order, account or day, as one key.
+
+    Messages differing only in these embed almost identically (one order
+    number against another scores ~0.96), so a cached reply is only served
+    when they match exactly.
+    """
+    lowered = text.lower()
+    found = set(_IDENTIFIER.findall(lowered))
+    found.update(word for word in _WORD.findall(lowered) if word in _DATE_WORDS)
+    return " ".join(sorted(found))
+
+
+class HashingEmbedder:
+    """Dependency-free text embedding via the hashing trick.
+
+    Words and character trigrams are hashed (crc32, stable across processes)
+    into a fixed number of signed buckets and the result is L2-normalised,
+    so cosine similarity is a plain dot product.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = _WORD.findall(text.lower())
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class Probe(NamedTuple):
+    """A looked-up message, kept so a miss can be stored without re-embedding it"""
+    vector: np.ndarray
+    identifiers: str
+
+
+class NamespaceIndex:
+    """Vectors, identifier keys and answers for one bot or business.
+
+    Search is an exact dot product over at most `max_entries` rows, which at
+    this size is faster than maintaining an ANN structure; once full the
+    oldest entries are overwritten ring-buffer style.
+    """
+
+    def __init__(self, dim: int, max_entries: int, vectors: Optional[np.ndarray] = None,
+                 answers: Optional[List[str]] = None, keys: Optional[List[str]] = None, cursor: int = 0):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.vectors = vectors if vectors is not None else np.zeros((0, dim), dtype=np.float32)
+        self.answers = answers or []
+        self.keys = keys or []
+        self.cursor = cursor
+        self.dirty = False
+
+    def search(self, probe: Probe, threshold: float) -> Optional[str]:
+        """Answer of the most similar entry clearing `threshold` whose identifiers match"""
+        if not self.answers:
+            return None
+        scores = self.vectors[:len(self.answers)] @ probe.vector
+        candidates = np.flatnonzero(scores >= threshold)
+        for row in candidates[np.argsort(-scores[candidates])]:
+            if self.keys[row] == probe.identifiers:
+                return self.answers[row]
+        return None
+
+    def add(self, probe: Probe, answer: str):
+        vector = probe.vector
+        if isinstance(self.vectors, np.memmap):
+            # First write after a memory-mapped load: move to a private copy
+            self.vectors = np.array(self.vectors)
+        if len(self.answers) < self.max_entries:
+            if len(self.answers) == self.vectors.shape[0]:
+                grown = np.zeros((min(self.max_entries, max(16, 2 * len(self.answers))), self.dim), dtype=np.float32)
+                grown[:len(self.answers)] = self.vectors[:len(self.answers)]
+                self.vectors = grown
+            self.vectors[len(self.answers)] = vector
+            self.answers.append(answer)
+            self.keys.append(probe.identifiers)
+        else:
+            self.vectors[self.cursor] = vector
+            self.answers[self.cursor] = answer
+            self.keys[self.cursor] = probe.identifiers
+            self.cursor = (self.cursor + 1) % self.max_entries
+        self.dirty = True
+
+    def merge(self, other: "NamespaceIndex"):
+        """Add the entries of `other` (e.g. another worker's save) this index lacks, while there is room"""
+        have = set(zip(self.keys, self.answers))
+        for row, (key, answer) in enumerate(zip(other.keys, other.answers)):
+            if len(self.answers) >= self.max_entries:
+                break
+            if (key, answer) not in have:
+                self.add(Probe(np.asarray(other.vectors[row]), key), answer)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.vectors.nbytes) + sum(len(answer) for answer in self.answers)
+
+
+def _kind(namespace: str) -> str:
+    """Metric label for a namespace: "bot:42" -> "bot", so bots do not multiply series"""
+    return namespace.split(":", 1)[0]
+
+
+class SemanticCache:
+    """Serves cached replies for messages that are near-duplicates of earlier ones.
+
+    One index per namespace (e.g. per chatbot config). A lookup embeds the
+    message and returns the stored reply of the most similar past message
+    if its cosine similarity clears `threshold` and it names the same
+    orders, emails and days (see `identifiers`). At most `max_namespaces`
+    indexes are kept, least recently used evicted first. Indexes can be
+    saved to `path`, which several workers may share: each save merges
+    with the file under a lock rather than overwriting it. They are
+    memory-mapped back in on startup.
+    """
+
+    def __init__(self, threshold: float = 0.95, dim: int = 1024, max_entries: int = 5000,
+                 max_namespaces: int = 1000, path: Optional[str] = None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_namespaces = max_namespaces
+        self.path = path
+        self.embedder = HashingEmbedder(dim)
+        # Least recently used first; there is a namespace per user/business and
+        # per bot version, so without a cap a long-lived worker grows forever
+        self._indexes: "OrderedDict[str, NamespaceIndex]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lookup_seconds = 0.0
+        self._lookup_max = 0.0
+
+    @classmethod
+    def from_env(cls) -> "SemanticCache":
+        cache = cls(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+            dim=int(os.getenv("SEMANTIC_CACHE_DIM", "1024")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000")),
+            max_namespaces=int(os.getenv("SEMANTIC_CACHE_MAX_NAMESPACES", "1000")),
+            path=os.getenv("SEMANTIC_CACHE_DIR") or None,
+        )
+        cache.load()
+        return cache
+
+    def _index(self, namespace: str) -> NamespaceIndex:
+        index = self._indexes.get(namespace)
+        if index is None:
+            index = self._indexes[namespace] = NamespaceIndex(self.embedder.dim, self.max_entries)
+            while len(self._indexes) > self.max_namespaces:
+                evicted, old = self._indexes.popitem(last=False)
+                self.evictions += 1
+                if self.path and old.dirty:
+                    self._write(evicted, old)
+        self._indexes.move_to_end(namespace)
+        return index
+
+    def lookup(self, namespace: str, message: str) -> Tuple[Optional[str], Probe]:
+        """Return (cached reply or None, probe to pass to `store` on a miss)"""
+        started = time.perf_counter()
+        probe = Probe(self.embedder.embed(message), identifiers(message))
+        index = self._indexes.get(namespace)
+        answer = None
+        if index is not None:
+            self._indexes.move_to_end(namespace)
+            answer = index.search(probe, self.threshold)
+        elapsed = time.perf_counter() - started
+        self._lookup_seconds += elapsed
+        self._lookup_max = max(self._lookup_max, elapsed)
+        if answer is not None:
+            self.hits += 1
+            CACHE_LOOKUPS.inc("semantic", _kind(namespace), "hit")
+            return answer, probe
+        self.misses += 1
+        CACHE_LOOKUPS.inc("semantic", _kind(namespace), "miss")
+        return None, probe
+
+    def store(self, namespace: str, probe: Probe, answer: str):
+        self._index(namespace).add(probe, answer)
+
+    def clear(self, namespace: str):
+        """Forget every stored reply for a namespace, e.g. after its bot changes"""
+        self._indexes.pop(namespace, None)
+        if self.path:
+            with self._locked(namespace):
+                self._remove(namespace)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "namespaces": len(self._indexes),
+            "entries": sum(len(index.answers) for index in self._indexes.values()),
+            "evictions": self.evictions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avg_lookup_ms": round(self._lookup_seconds / lookups * 1000, 4) if lookups else 0.0,
+            "max_lookup_ms": round(self._lookup_max * 1000, 4),
+            "index_bytes": sum(index.nbytes for index in self._indexes.values()),
+        }
+
+    def _files(self, namespace: str) -> Tuple[str, str]:
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", namespace)
+        return os.path.join(self.path, f"{safe}.npy"), os.path.join(self.path, f"{safe}.json")
+
+    @contextmanager
+    def _locked(self, namespace: str):
+        """Hold the namespace's file lock, shared by every worker using `path`"""
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._files(namespace)[0][:-4] + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _remove(self, namespace: str):
+        for file in self._files(namespace):
+            if os.path.exists(file):
+                os.remove(file)
+
+    def _read(self, namespace: str) -> Optional[NamespaceIndex]:
+        """The saved index of a namespace, memory-mapped, or None if missing or unreadable"""
+        vectors_file, meta_file = self._files(namespace)
+        if not os.path.exists(meta_file):
+            return None
+        try:
+            with open(meta_file) as f:
+                meta = json.load(f)
+            vectors = np.load(vectors_file, mmap_mode="r")
+            if vectors.shape[1] != self.embedder.dim or not vectors.shape[0] == len(meta["answers"]) == len(meta["keys"]):
+                return None
+            return NamespaceIndex(self.embedder.dim, self.max_entries, vectors, meta["answers"], meta["keys"], meta.get("cursor", 0))
+        except (OSError, ValueError, KeyError):
+            logger.exception("Skipping unreadable semantic cache file %s", meta_file)
+            return None
+
+    def _write(self, namespace: str, index: NamespaceIndex):
+        """Save one index, first merging in what other workers saved since it was loaded"""
+        vectors_file, meta_file = self._files(namespace)
+        tmp = f".{os.getpid()}.tmp"
+        with self._locked(namespace):
+            saved = self._read(namespace)
+            if saved is not None:
+                index.merge(saved)
+            with open(vectors_file + tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(index.vectors[:len(index.answers)]))
+            with open(meta_file + tmp, "w") as f:
+                json.dump({"namespace": namespace, "answers": index.answers, "keys": index.keys, "cursor": index.cursor}, f)
+            os.replace(vectors_file + tmp, vectors_file)
+            os.replace(meta_file + tmp, meta_file)
+        index.dirty = False
+
+    def save(self):
+        """Write changed namespaces to disk, merged with other workers' saves"""
+        if not self.path:
+            return
+        for namespace, index in list(self._indexes.items()):
+            if index.dirty:
+                self._write(namespace, index)
+
+    def load(self):
+        """Memory-map the `max_namespaces` most recently saved namespaces; delete older ones"""
+        if not self.path or not os.path.isdir(self.path):
+            return
+        saved = []
+        for name in os.listdir(self.path):
+            if name.endswith(".json"):
+                meta_file = os.path.join(self.path, name)
+                try:
+                    with open(meta_file) as f:
+                        saved.append((os.path.getmtime(meta_file), json.load(f)["namespace"]))
+                except (OSError, ValueError, KeyError):
+                    logger.exception("Skipping unreadable semantic cache file %s", meta_file)
+        saved.sort()
+        for _, namespace in saved[:-self.max_namespaces or None]:
+            with self._locked(namespace):
+                self._remove(namespace)
+        for _, namespace in saved[-self.max_namespaces:]:
+            with self._locked(namespace):
+                index = self._read(namespace)
+            if index is not None:
+                self._indexes[namespace] = index
+
+
+def get_semantic_cache(request: Request) -> SemanticCache:
+    """FastAPI dependency returning the semantic cache created in the app lifespan"""
+    return request.app.state.semantic_cache
+
+
+@router.get("/semantic-cache/stats")
+async def semantic_cache_stats(request: Request):
+    """Hit rate, lookup latency and index memory of the semantic cache"""
+    return get_semantic_cache(request).stats()
@@ -0,0 +1,78 @@
+import json
+from typing import AsyncIterator, Callable, List, Optional
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # stop nginx from buffering the event stream
+}
+
+
+def sse_event(data, event: Optional[str] = None) -> str:
+    """Encode one Server-Sent Event frame"""
+    payload = data if isinstance(data, str) else json.dumps(data)
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in payload.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def sse_response(
+    chunks: AsyncIterator[str],
+    finalize: Callable[[str], dict],
+) -> StreamingResponse:
+    """Forward text deltas as SSE "token" events.
+
+    Once the upstream stream is exhausted, `finalize` is called with the full
+    text and its result is sent as the closing "done" event, so clients get
+    the same metadata the JSON response carries.
+    """
+
+    async def event_stream():
+        # Flush headers straight away so time-to-first-byte is not gated on
+        # the first upstream token
+        yield ": stream-open\n\n"
+        parts = []
+        try:
+            async for delta in chunks:
+                parts.append(delta)
+                yield sse_event({"content": delta}, event="token")
+            yield sse_event(finalize("".join(parts)), event="done")
+        except Exception as e:
+            # Upstream failures carry a code (upstream_timeout, ...) like JSON errors do
+            yield sse_event({"detail": str(e), "code": getattr(e, "code", "internal_error")}, event="error")
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+def sse_items_response(
+    chunks: AsyncIterator[str],
+    parse: Callable[[str], List[BaseModel]],
+    finalize: Callable[[str], dict],
+    event: str = "item",
+) -> StreamingResponse:
+    """Send each structured item as its own SSE event as soon as it is complete.
+
+    `parse` is fed every text delta and returns the items that delta
+    completed (see app.core.structured.StructuredStream); raw tokens are
+    not forwarded. `finalize` works as for sse_response().
+    """
+
+    async def event_stream():
+        yield ": stream-open\n\n"
+        parts = []
+        try:
+            async for delta in chunks:
+                parts.append(delta)
+                for item in parse(delta):
+                    yield sse_event(item.model_dump(), event=event)
+            yield sse_event(finalize("".join(parts)), event="done")
+        except Exception as e:
+            yield sse_event({"detail": str(e), "code": getattr(e, "code", "internal_error")}, event="error")
+
+    return StreamingResponse(
+        event_stream(), media_type="text/event-stream", headers=SSE_HEADERS
+    )
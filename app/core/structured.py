@@ -0,0 +1,102 @@
+import json
+from typing import Any, Generic, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+from app.core.resilience import UpstreamError
+
+M = TypeVar("M", bound=BaseModel)
+
+# OpenAI JSON mode; providers without it (Anthropic) drop it and rely on the prompt
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+
+class InvalidOutput(UpstreamError):
+    """The model answered, but not with JSON matching the requested schema"""
+
+    status_code = 502
+    code = "invalid_output"
+    retryable = False
+
+
+def schema_instructions(model: Type[BaseModel], what: str = "a single JSON object") -> str:
+    """Prompt text asking for `what` matching `model`'s JSON schema, brace-escaped for PromptTemplate"""
+    schema = json.dumps(model.model_json_schema(), separators=(",", ":"))
+    text = f"Respond only with {what}, matching this JSON schema:\n{schema}"
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def parse_structured(text: str, model: Type[M], upstream: str = "llm") -> M:
+    """Validate a complete JSON answer, ignoring any prose or code fence around the object"""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end < start:
+        raise InvalidOutput(upstream, "response contained no JSON object")
+    try:
+        return model.model_validate_json(text[start:end + 1])
+    except ValidationError as e:
+        raise InvalidOutput(upstream, f"response did not match the {model.__name__} schema: {e.error_count()} errors") from e
+
+
+class JsonItemStream:
+    """Incremental parser for the array in a streamed `{"key": [{...}, {...}]}` answer.
+
+    feed() takes text deltas and returns the array's elements that were
+    completed by them, so each can be handed on as soon as its closing
+    brace arrives rather than when the whole document has been received.
+    Only the first array directly inside the root object is read.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._array_depth: Optional[int] = None
+        self._in_string = False
+        self._escape = False
+        self._item: Optional[List[str]] = None
+        self.done = False
+
+    def feed(self, text: str) -> List[Any]:
+        items = []
+        for char in text:
+            if self.done:
+                break
+            if self._item is not None:
+                self._item.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char == "{" or char == "[":
+                self._depth += 1
+                if char == "[" and self._array_depth is None and self._depth == 2:
+                    self._array_depth = self._depth
+                elif char == "{" and self._item is None and self._depth == (self._array_depth or -1) + 1:
+                    self._item = ["{"]
+            elif char == "}" or char == "]":
+                if char == "}" and self._item is not None and self._depth == self._array_depth + 1:
+                    items.append(json.loads("".join(self._item)))
+                    self._item = None
+                elif char == "]" and self._depth == self._array_depth:
+                    self.done = True
+                self._depth -= 1
+        return items
+
+
+class StructuredStream(Generic[M]):
+    """JsonItemStream whose items are validated as `model` instances"""
+
+    def __init__(self, model: Type[M], upstream: str = "llm"):
+        self.model = model
+        self.upstream = upstream
+        self._parser = JsonItemStream()
+
+    def feed(self, text: str) -> List[M]:
+        try:
+            return [self.model.model_validate(item) for item in self._parser.feed(text)]
+        except (ValueError, ValidationError) as e:
+            raise InvalidOutput(self.upstream, f"streamed {self.model.__name__} was invalid: {e}") from e
@@ -0,0 +1,53 @@
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models import Base, GeneratedContent
+
+logger = logging.getLogger(__name__)
+
+# aiosqlite locally; point DATABASE_URL at postgresql+asyncpg://... in production
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./database.db")
+
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DATABASE_POOL_SIZE", "10")),
+        "max_overflow": int(os.getenv("DATABASE_MAX_OVERFLOW", "20")),
+        "pool_pre_ping": True,
+    }
+
+
+engine = create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+
+async def init_db():
+    """Create any missing tables and indexes"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def get_session():
+    """FastAPI dependency yielding a pooled AsyncSession"""
+    async with SessionLocal() as session:
+        yield session
+
+
+async def save_generated_content(tool_name: str, title: str, content: str, user_id: Optional[int] = None):
+    """Persist a generated artifact; meant to run as a background task"""
+    try:
+        async with SessionLocal() as session:
+            session.add(GeneratedContent(
+                user_id=user_id,
+                tool_name=tool_name,
+                title=title,
+                content=content,
+            ))
+            await session.commit()
+    except Exception:
+        logger.exception("Failed to persist %s output", tool_name)
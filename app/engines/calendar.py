@@ -0,0 +1,240 @@
+"""Deterministic calendar analysis: conflicts, busy blocks, free slots and focus time.
+
+Meetings become half-open [start, end) intervals in minutes from the
+start of the planning range. Sorted by start, they give double bookings by
+bisection (the later meetings overlapping one are exactly those starting
+before it ends) and merge into busy blocks in one sweep. The busy blocks
+are indexed in a static interval tree that answers "what overlaps this
+window" in O(log n + k), so each working window (scheduler.WorkWeek) only
+looks at its own meetings. Free time is what is left of the windows once
+busy blocks, padded by a buffer, are cut out; it is divided into maker
+(deep work) and manager (meeting-ready) blocks according to the work
+style. Proposed blocks are carved from free time only, so they can never
+overlap a meeting.
+"""
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.engines.scheduler import WorkWeek
+
+MIN_SLOT_MINUTES = 15  # shorter free gaps are not worth reporting
+MAX_CONFLICTS = 500  # conflict pairs listed; all are counted
+
+
+class IntervalTree:
+    """Static interval tree over half-open (start, end, id) intervals.
+
+    Intervals are sorted by start and read as an implicit balanced binary
+    tree (the middle of each range is its root). Each root stores the
+    largest end in its subtree, so a query skips any subtree that ends
+    before the window and stops descending right once starts pass its end.
+    """
+
+    def __init__(self, intervals: Sequence[Tuple[int, int, int]]):
+        self._items = sorted(intervals)
+        self._max_end = [0] * len(self._items)
+        if self._items:
+            self._build(0, len(self._items))
+
+    def _build(self, lo: int, hi: int) -> int:
+        mid = (lo + hi) // 2
+        end = self._items[mid][1]
+        if lo < mid:
+            end = max(end, self._build(lo, mid))
+        if mid + 1 < hi:
+            end = max(end, self._build(mid + 1, hi))
+        self._max_end[mid] = end
+        return end
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def overlapping(self, start: int, end: int) -> List[Tuple[int, int, int]]:
+        """Intervals overlapping [start, end), in start order"""
+        found = []
+        stack = [(0, len(self._items))] if self._items else []
+        items, max_end = self._items, self._max_end
+        while stack:
+            lo, hi = stack.pop()
+            mid = (lo + hi) // 2
+            if max_end[mid] <= start:
+                continue
+            if lo < mid:
+                stack.append((lo, mid))
+            item = items[mid]
+            if item[0] < end:
+                if item[1] > start:
+                    found.append(item)
+                if mid + 1 < hi:
+                    stack.append((mid + 1, hi))
+        found.sort()
+        return found
+
+
+@dataclass(frozen=True)
+class WorkStyle:
+    min_maker: int  # shortest free slot, in minutes, that becomes a maker block
+    max_maker: int  # longer slots are split into maker blocks of at most this length
+    maker_until: int  # minute of the day after which free time is left for meetings
+    makers_per_day: int = 0  # 0 for no limit
+
+
+WORK_STYLES: Dict[str, WorkStyle] = {
+    # Long uninterrupted stretches whenever possible
+    "maker": WorkStyle(min_maker=90, max_maker=240, maker_until=24 * 60),
+    # Open for meetings, with one protected focus block a day
+    "manager": WorkStyle(min_maker=60, max_maker=90, maker_until=24 * 60, makers_per_day=1),
+    # Deep work in the morning, meetings in the afternoon
+    "mixed": WorkStyle(min_maker=90, max_maker=180, maker_until=13 * 60),
+}
+
+
+@dataclass
+class Conflict:
+    events: Tuple[int, int]  # indices in the submitted list
+    start: str
+    end: str
+
+
+@dataclass
+class Block:
+    start: str
+    end: str
+    minutes: int
+    kind: str = "free"  # free, busy, maker or manager
+    events: List[int] = field(default_factory=list)  # meetings in a busy block
+
+
+@dataclass
+class CalendarPlan:
+    conflicts: List[Conflict] = field(default_factory=list)
+    conflict_count: int = 0
+    busy: List[Block] = field(default_factory=list)
+    free: List[Block] = field(default_factory=list)
+    blocks: List[Block] = field(default_factory=list)  # proposed maker/manager time
+    summary: Dict[str, float] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        def block(b: Block, events: bool = False) -> dict:
+            data = {"start": b.start, "end": b.end, "minutes": b.minutes}
+            if events:
+                data["events"] = b.events
+            elif b.kind != "free":
+                data["kind"] = b.kind
+            return data
+
+        return {
+            "conflicts": [{"events": list(c.events), "start": c.start, "end": c.end} for c in self.conflicts],
+            "conflict_count": self.conflict_count,
+            "busy": [block(b, events=True) for b in self.busy],
+            "free": [block(b) for b in self.free],
+            "blocks": [block(b) for b in self.blocks],
+            "summary": self.summary,
+        }
+
+
+def _subtract(window: Tuple[int, int], busy: Sequence[Tuple[int, int, int]], buffer: int) -> List[Tuple[int, int]]:
+    """Parts of `window` not within `buffer` minutes of a busy interval (busy sorted by start)"""
+    free, cursor = [], window[0]
+    for start, end, _ in busy:
+        if start - buffer > cursor:
+            free.append((cursor, min(start - buffer, window[1])))
+        cursor = max(cursor, end + buffer)
+    if cursor < window[1]:
+        free.append((cursor, window[1]))
+    return [(s, e) for s, e in free if e - s >= MIN_SLOT_MINUTES]
+
+
+def _split(slot: Tuple[int, int], day_offset: int, style: WorkStyle, makers_left: Optional[int]) -> Tuple[List[Tuple[int, int, str]], Optional[int]]:
+    """Divide a free slot into maker and manager blocks"""
+    start, end = slot
+    limit = day_offset + style.maker_until
+    blocks = []
+    while (makers_left is None or makers_left > 0) and min(end, limit) - start >= style.min_maker:
+        length = min(style.max_maker, min(end, limit) - start)
+        blocks.append((start, start + length, "maker"))
+        start += length
+        if makers_left is not None:
+            makers_left -= 1
+    if end - start >= MIN_SLOT_MINUTES:
+        blocks.append((start, end, "manager"))
+    return blocks, makers_left
+
+
+def analyse_calendar(
+    events: Sequence[Tuple[datetime, datetime]],
+    start: date,
+    end: date,
+    style: str = "mixed",
+    week: WorkWeek = WorkWeek(),
+    buffer_minutes: int = 10,
+) -> CalendarPlan:
+    """Find conflicts, busy and free time, and propose maker/manager blocks from `start` to `end` inclusive.
+
+    `events` are (start, end) naive datetimes in the calendar's own time;
+    indices in the result refer to their position in this sequence.
+    """
+    origin = datetime.combine(start, time())
+    minute = timedelta(minutes=1)
+
+    def stamp(value: int) -> str:
+        return (origin + value * minute).isoformat(timespec="minutes")
+
+    intervals = [((s - origin) // minute, (e - origin) // minute, i) for i, (s, e) in enumerate(events)]
+    items = sorted(intervals)
+    plan = CalendarPlan()
+
+    # Double bookings, counted by bisection: O(n log n) however many pairs there are
+    starts = [s for s, _, _ in items]
+    for position, (s, e, i) in enumerate(items):
+        last = bisect_left(starts, e, position + 1)
+        plan.conflict_count += last - position - 1
+        for os_, oe, j in items[position + 1:min(last, position + 1 + MAX_CONFLICTS - len(plan.conflicts))]:
+            plan.conflicts.append(Conflict((i, j), stamp(os_), stamp(min(e, oe))))
+
+    # Overlapping and back-to-back meetings form one busy block
+    merged: List[list] = []  # [start, end, event indices]
+    for s, e, i in items:
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+            merged[-1][2].append(i)
+        else:
+            merged.append([s, e, [i]])
+    plan.busy = [Block(stamp(s), stamp(e), e - s, "busy", events) for s, e, events in merged]
+    busy_tree = IntervalTree([(s, e, n) for n, (s, e, _) in enumerate(merged)])
+
+    work_style = WORK_STYLES[style]
+    windows = week.free_intervals()
+    meeting_minutes = free_minutes = 0
+    totals = {"maker": 0, "manager": 0}
+    day, day_offset = start, 0
+    while day <= end:
+        if week.weekends or day.weekday() < 5:
+            makers_left = work_style.makers_per_day or None
+            for window_start, window_end in windows:
+                window = (day_offset + window_start, day_offset + window_end)
+                busy = busy_tree.overlapping(window[0] - buffer_minutes, window[1] + buffer_minutes)
+                meeting_minutes += sum(min(e, window[1]) - max(s, window[0]) for s, e, _ in busy if s < window[1] and e > window[0])
+                for slot in _subtract(window, busy, buffer_minutes):
+                    free_minutes += slot[1] - slot[0]
+                    plan.free.append(Block(stamp(slot[0]), stamp(slot[1]), slot[1] - slot[0]))
+                    blocks, makers_left = _split(slot, day_offset, work_style, makers_left)
+                    for s, e, kind in blocks:
+                        totals[kind] += e - s
+                        plan.blocks.append(Block(stamp(s), stamp(e), e - s, kind))
+        day += timedelta(days=1)
+        day_offset += 24 * 60
+
+    plan.summary = {
+        "meeting_hours": round(meeting_minutes / 60, 2),  # within working hours
+        "free_hours": round(free_minutes / 60, 2),
+        "maker_hours": round(totals["maker"] / 60, 2),
+        "manager_hours": round(totals["manager"] / 60, 2),
+        "longest_maker_minutes": max((b.minutes for b in plan.blocks if b.kind == "maker"), default=0),
+    }
+    return plan
@@ -0,0 +1,163 @@
+"""Structured document model for generated business plans and pitch decks.
+
+The LLM answers in loosely formatted markdown: "#" headings, whole-line
+bold headings, "1. EXECUTIVE SUMMARY" style section titles, "SLIDE 3:"
+markers, bullet and numbered lists. parse_document() turns that into
+sections of typed blocks that the PDF and PPTX renderers lay out, so
+neither renderer has to understand markdown itself.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple, Union
+
+KINDS = ("business_plan", "pitch_deck")
+
+_HASH_HEADING = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_BOLD_HEADING = re.compile(r"^\*\*(.+?)\*\*:?\s*$")
+_CAPS_HEADING = re.compile(r"^(\d{1,2})[.)]\s+([A-Z][A-Z0-9 &/,\-']+)$")
+_SLIDE = re.compile(r"^slide\s+(\d{1,2})\s*[:.\-–—]?\s*(.*)$", re.IGNORECASE)
+_BULLET = re.compile(r"^(\s*)[-*•]\s+(.+)$")
+_NUMBERED = re.compile(r"^(\s*)\d{1,2}[.)]\s+(.+)$")
+_RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_LEADING_MARKUP = re.compile(r"^[#*\s]+|[*\s]+$")
+
+
+@dataclass(frozen=True)
+class Heading:
+    text: str
+    level: int = 2  # 1 is a section title; deeper levels are sub-headings
+
+
+@dataclass(frozen=True)
+class Paragraph:
+    text: str
+
+
+@dataclass(frozen=True)
+class ListBlock:
+    items: Tuple[str, ...]
+    ordered: bool = False
+
+
+Block = Union[Heading, Paragraph, ListBlock]
+
+
+@dataclass
+class Section:
+    title: str
+    blocks: List[Block] = field(default_factory=list)
+
+
+@dataclass
+class Document:
+    kind: str
+    title: str
+    sections: List[Section] = field(default_factory=list)
+
+
+def _heading(line: str, kind: str) -> Optional[Tuple[int, str]]:
+    """(level, text) when `line` is a heading; slide markers are level 0"""
+    bare = _LEADING_MARKUP.sub("", line)
+    slide = _SLIDE.match(bare)
+    if slide and kind == "pitch_deck":
+        return 0, slide.group(2).strip(" :*") or f"Slide {slide.group(1)}"
+    match = _HASH_HEADING.match(line)
+    if match:
+        return len(match.group(1)), match.group(2).strip("* ")
+    match = _CAPS_HEADING.match(bare)
+    if match:
+        return 1, match.group(2).strip()
+    match = _BOLD_HEADING.match(line)
+    if match:
+        return 3, match.group(1).strip()
+    return None
+
+
+def parse_document(kind: str, title: str, markdown: str) -> Document:
+    """Split generated markdown into sections of headings, paragraphs and lists.
+
+    Sections start at the outermost heading level the text uses (slide
+    markers for a deck that has them); deeper headings become Heading
+    blocks inside the current section. A lone leading heading above all
+    the others is the document's own title and is dropped. Text before the
+    first section heading becomes an untitled introduction.
+    """
+    lines = markdown.replace("\r\n", "\n").split("\n")
+    headings = [_heading(line.strip(), kind) for line in lines]
+    levels = [h[0] for h in headings if h is not None]
+    section_level = min(levels) if levels else None
+    if levels.count(section_level) == 1 and levels[0] == section_level and len(set(levels)) > 1:
+        # A lone leading top-level heading is the document's own title
+        first = next(i for i, h in enumerate(headings) if h is not None)
+        del lines[first], headings[first]
+        section_level = min(levels[1:])
+
+    document = Document(kind, title)
+    section = Section("")
+    paragraph: List[str] = []
+    items: List[str] = []
+    ordered = False
+
+    def flush_paragraph():
+        if paragraph:
+            section.blocks.append(Paragraph(" ".join(paragraph)))
+            paragraph.clear()
+
+    def flush_list():
+        if items:
+            section.blocks.append(ListBlock(tuple(items), ordered))
+            items.clear()
+
+    for raw, heading in zip(lines, headings):
+        line = raw.strip()
+        if heading is not None:
+            flush_paragraph()
+            flush_list()
+            level, text = heading
+            if level == section_level:
+                if section.title or section.blocks:
+                    document.sections.append(section)
+                section = Section(text)
+            else:
+                section.blocks.append(Heading(text, 2 if level <= 2 else 3))
+            continue
+        if not line or _RULE.match(line):
+            flush_paragraph()
+            flush_list()
+            continue
+        bullet = _BULLET.match(raw) or _NUMBERED.match(raw)
+        if bullet:
+            flush_paragraph()
+            is_ordered = bullet.re is _NUMBERED
+            if items and is_ordered != ordered:
+                flush_list()
+            ordered = is_ordered
+            items.append(bullet.group(2).strip())
+            continue
+        if items:
+            # A wrapped line continues the previous list item
+            items[-1] += " " + line
+        else:
+            paragraph.append(line)
+    flush_paragraph()
+    flush_list()
+    if section.title or section.blocks:
+        document.sections.append(section)
+    return document
+
+
+_BOLD = re.compile(r"\*\*(.+?)\*\*|__(.+?)__")
+_ITALIC = re.compile(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?![*\w])|(?<![_\w])_(?!\s)(.+?)(?<!\s)_(?![_\w])")
+
+
+def strip_inline(text: str) -> str:
+    """Text without **bold** / *italic* markers, for renderers without inline styles"""
+    text = _BOLD.sub(lambda m: m.group(1) or m.group(2), text)
+    return _ITALIC.sub(lambda m: m.group(1) or m.group(2), text)
+
+
+def inline_markup(text: str) -> str:
+    """XML-escaped text with bold/italic markers turned into <b>/<i> tags"""
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    text = _BOLD.sub(lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    return _ITALIC.sub(lambda m: f"<i>{m.group(1) or m.group(2)}</i>", text)
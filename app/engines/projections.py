@@ -0,0 +1,127 @@
+"""Vectorised revenue/cost projections.
+
+Every function broadcasts over its rate arguments, so a single call can
+project one scenario, a grid of scenarios or thousands of Monte Carlo paths;
+the month axis is always the last one.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def project(
+    revenue_month1: float,
+    monthly_costs: float,
+    growth_rate,
+    months: int,
+    cost_inflation=2.0,
+    churn_rate=0.0,
+) -> Dict[str, np.ndarray]:
+    """Monthly revenue, cost, profit and cumulative series.
+
+    Rates are percentages per month and may be scalars or arrays; their
+    broadcast shape becomes the leading axes of every returned series.
+    Churn is applied on top of growth, so revenue compounds by
+    (1 + growth) * (1 - churn) each month.
+    """
+    t = np.arange(months, dtype=np.float64)
+    growth = np.asarray(growth_rate, dtype=np.float64)[..., None] / 100
+    inflation = np.asarray(cost_inflation, dtype=np.float64)[..., None] / 100
+    churn = np.asarray(churn_rate, dtype=np.float64)[..., None] / 100
+
+    revenue = revenue_month1 * ((1 + growth) * (1 - churn)) ** t
+    costs = monthly_costs * (1 + inflation) ** t
+    revenue, costs = np.broadcast_arrays(revenue, costs)
+    cumulative_revenue = np.cumsum(revenue, axis=-1)
+    cumulative_profit = cumulative_revenue - np.cumsum(costs, axis=-1)
+    return {
+        "revenue": revenue,
+        "costs": costs,
+        "profit": revenue - costs,
+        "cumulative_revenue": cumulative_revenue,
+        "cumulative_profit": cumulative_profit,
+    }
+
+
+def break_even_months(cumulative_profit: np.ndarray, initial_investment: float) -> np.ndarray:
+    """First month (1-based) whose cumulative profit exceeds the investment.
+
+    Returns 0 where the investment is never recovered within the horizon.
+    """
+    recovered = cumulative_profit > initial_investment
+    first = recovered.argmax(axis=-1) + 1
+    return np.where(recovered.any(axis=-1), first, 0)
+
+
+def monte_carlo(
+    revenue_month1: float,
+    monthly_costs: float,
+    initial_investment: float,
+    growth_rate: float,
+    growth_volatility: float,
+    months: int,
+    paths: int,
+    cost_inflation: float = 2.0,
+    churn_rate: float = 0.0,
+    seed: Optional[int] = None,
+) -> Dict[str, object]:
+    """Simulate `paths` revenue paths with normally distributed monthly growth.
+
+    Each month's growth is drawn independently around `growth_rate` with
+    standard deviation `growth_volatility` (both percentages). Returns
+    per-month percentile bands plus the break-even distribution.
+    """
+    rng = np.random.default_rng(seed)
+    growth = rng.normal(growth_rate, growth_volatility, size=(paths, months - 1)) / 100
+    factors = (1 + growth) * (1 - churn_rate / 100)
+    revenue = np.empty((paths, months))
+    revenue[:, 0] = revenue_month1
+    np.cumprod(factors, axis=1, out=revenue[:, 1:])
+    revenue[:, 1:] *= revenue_month1
+
+    costs = monthly_costs * (1 + cost_inflation / 100) ** np.arange(months, dtype=np.float64)
+    cumulative_profit = np.cumsum(revenue - costs, axis=1)
+    break_even = break_even_months(cumulative_profit, initial_investment)
+    recovered = break_even[break_even > 0]
+
+    revenue_bands = np.percentile(revenue, PERCENTILES, axis=0)
+    profit_bands = np.percentile(cumulative_profit, PERCENTILES, axis=0)
+    return {
+        "revenue_percentiles": {
+            f"p{p}": np.round(band, 2).tolist() for p, band in zip(PERCENTILES, revenue_bands)
+        },
+        "cumulative_profit_percentiles": {
+            f"p{p}": np.round(band, 2).tolist() for p, band in zip(PERCENTILES, profit_bands)
+        },
+        "break_even_probability": round(float(recovered.size / paths), 4),
+        "break_even_month_percentiles": (
+            {f"p{p}": int(v) for p, v in zip(PERCENTILES, np.percentile(recovered, PERCENTILES))}
+            if recovered.size else None
+        ),
+        "final_cumulative_profit_mean": round(float(cumulative_profit[:, -1].mean()), 2),
+    }
+
+
+def series_to_rows(series: Dict[str, np.ndarray]) -> list:
+    """Convert one scenario's series into the per-month dicts the API returns"""
+    columns = {name: np.round(values, 2).tolist() for name, values in series.items()}
+    return [
+        {
+            "month": month,
+            "revenue": revenue,
+            "costs": costs,
+            "profit": profit,
+            "cumulative_revenue": cumulative_revenue,
+            "cumulative_profit": cumulative_profit,
+        }
+        for month, revenue, costs, profit, cumulative_revenue, cumulative_profit in zip(
+            range(1, len(columns["revenue"]) + 1),
+            columns["revenue"],
+            columns["costs"],
+            columns["profit"],
+            columns["cumulative_revenue"],
+            columns["cumulative_profit"],
+        )
+    ]
@@ -0,0 +1,111 @@
+"""PDF and PPTX rendering of parsed documents.
+
+Pure CPU and synchronous: meant to run in a worker process, which is why
+the entry point render_export() takes plain strings and writes the file
+itself instead of shipping bytes back to the caller.
+"""
+import os
+from typing import List, Tuple
+
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import ListFlowable, ListItem, PageBreak, Paragraph as PdfParagraph, SimpleDocTemplate, Spacer
+
+from app.engines.documents import Document, Heading, ListBlock, Paragraph, inline_markup, parse_document, strip_inline
+
+try:
+    from pptx import Presentation
+    from pptx.util import Pt
+except ImportError:  # only needed for PPTX exports
+    Presentation = None
+
+FORMATS = ("pdf", "pptx")
+
+# Bump when layout changes so cached exports are re-rendered
+RENDERER_VERSION = 1
+
+
+def render_pdf(document: Document, path: str):
+    """A4 report for plans; landscape pages, one slide per page, for decks"""
+    deck = document.kind == "pitch_deck"
+    styles = getSampleStyleSheet()
+    pdf = SimpleDocTemplate(
+        path, pagesize=landscape(A4) if deck else A4, title=document.title,
+        leftMargin=2 * cm, rightMargin=2 * cm, topMargin=2 * cm, bottomMargin=2 * cm,
+    )
+    story = [Spacer(1, 4 * cm if deck else 0), PdfParagraph(inline_markup(document.title), styles["Title"])]
+    for section in document.sections:
+        if deck:
+            story.append(PageBreak())
+        if section.title:
+            story.append(PdfParagraph(inline_markup(section.title), styles["Heading1"]))
+        for block in section.blocks:
+            if isinstance(block, Heading):
+                story.append(PdfParagraph(inline_markup(block.text), styles["Heading2" if block.level <= 2 else "Heading3"]))
+            elif isinstance(block, Paragraph):
+                story.append(PdfParagraph(inline_markup(block.text), styles["BodyText"]))
+            elif isinstance(block, ListBlock):
+                story.append(ListFlowable(
+                    [ListItem(PdfParagraph(inline_markup(item), styles["BodyText"])) for item in block.items],
+                    bulletType="1" if block.ordered else "bullet",
+                    leftIndent=0.6 * cm,
+                ))
+    pdf.build(story)
+
+
+def _slide_lines(blocks) -> List[Tuple[str, int, bool]]:
+    """(text, indent level, bold) for each line of a slide body"""
+    lines = []
+    for block in blocks:
+        if isinstance(block, Heading):
+            lines.append((strip_inline(block.text), 0, True))
+        elif isinstance(block, Paragraph):
+            lines.append((strip_inline(block.text), 0, False))
+        else:
+            lines.extend((strip_inline(item), 1, False) for item in block.items)
+    return lines
+
+
+def render_pptx(document: Document, path: str):
+    """Title slide plus one title-and-content slide per section"""
+    if Presentation is None:
+        raise RuntimeError("The python-pptx package is required for PPTX exports")
+    presentation = Presentation()
+    cover = presentation.slides.add_slide(presentation.slide_layouts[0])
+    cover.shapes.title.text = document.title
+    cover.placeholders[1].text = "Investor pitch deck" if document.kind == "pitch_deck" else "Business plan"
+    for section in document.sections:
+        slide = presentation.slides.add_slide(presentation.slide_layouts[1])
+        slide.shapes.title.text = strip_inline(section.title) or document.title
+        body = slide.placeholders[1].text_frame
+        lines = _slide_lines(section.blocks)
+        # The default template does not shrink text to fit, so dense slides get a smaller font
+        size = Pt(20 if len(lines) <= 6 else 16 if len(lines) <= 10 else 12)
+        for index, (text, level, bold) in enumerate(lines):
+            paragraph = body.paragraphs[0] if index == 0 else body.add_paragraph()
+            paragraph.text = text
+            paragraph.level = level
+            paragraph.font.size = size
+            paragraph.font.bold = bold
+    presentation.save(path)
+
+
+def render_export(kind: str, title: str, markdown: str, fmt: str, path: str) -> int:
+    """Parse `markdown` and write it to `path` as `fmt`; returns the file size.
+
+    The file is written under a temporary name and moved into place, so a
+    concurrent reader never sees a partial export.
+    """
+    document = parse_document(kind, title, markdown)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        if fmt == "pptx":
+            render_pptx(document, tmp)
+        else:
+            render_pdf(document, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return os.path.getsize(path)
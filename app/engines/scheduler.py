@@ -0,0 +1,208 @@
+"""Deterministic task prioritisation and time-block scheduling.
+
+Tasks are ranked by Eisenhower quadrant, then by weighted shortest job
+first (WSJF: value plus time criticality, divided by size), and packed in
+rank order into the free intervals of the working days, so the highest
+ranked work always gets the earliest time. Everything is plain arithmetic
+on minutes and dates: a 10k-task list ranks and schedules in well under a
+second, with no model calls.
+
+Tasks are read duck-typed: anything with `title`, `deadline` (ISO date or
+datetime string), `priority` and `estimated_hours` attributes works.
+"""
+import math
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Business value of each stated priority; high and above count as important
+PRIORITY_VALUE: Dict[str, float] = {"low": 1.0, "medium": 2.0, "high": 3.0, "urgent": 4.0, "critical": 4.0}
+IMPORTANT_VALUE = 3.0
+
+# Due within this many days counts as urgent
+URGENT_DAYS = 2
+# Time criticality of a task due today or overdue; decays as the deadline moves away
+MAX_CRITICALITY = 4.0
+
+DEFAULT_HOURS = 2.0
+MIN_HOURS = 0.25
+
+QUADRANTS = ("do_first", "schedule", "delegate", "eliminate")
+
+
+@lru_cache(maxsize=4096)
+def parse_deadline(value: Optional[str]) -> Optional[date]:
+    """Date part of an ISO date/datetime string; None when missing or unparseable"""
+    if not value:
+        return None
+    text = value.strip()
+    try:
+        return datetime.fromisoformat(text.replace("Z", "+00:00")).date()
+    except ValueError:
+        try:
+            return date.fromisoformat(text[:10])
+        except ValueError:
+            return None
+
+
+@dataclass
+class RankedTask:
+    index: int  # position in the submitted list
+    title: str
+    rank: int
+    quadrant: str
+    score: float  # WSJF
+    priority: str
+    hours: float
+    deadline: Optional[str] = None
+    days_left: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def rank_tasks(tasks: Sequence, today: Optional[date] = None) -> List[RankedTask]:
+    """Rank tasks by Eisenhower quadrant, then WSJF, then deadline"""
+    today = today or date.today()
+    keyed = []
+    for index, task in enumerate(tasks):
+        priority = (task.priority or "medium").lower()
+        value = PRIORITY_VALUE.get(priority, PRIORITY_VALUE["medium"])
+        hours = max(MIN_HOURS, task.estimated_hours or DEFAULT_HOURS)
+        deadline = parse_deadline(task.deadline)
+        days_left = (deadline - today).days if deadline is not None else None
+
+        if days_left is None:
+            criticality = 0.0
+        elif days_left <= 0:
+            criticality = MAX_CRITICALITY
+        else:
+            criticality = MAX_CRITICALITY / (1 + days_left / URGENT_DAYS)
+
+        important = value >= IMPORTANT_VALUE
+        urgent = priority in ("urgent", "critical") or (days_left is not None and days_left <= URGENT_DAYS)
+        quadrant = QUADRANTS[(0 if urgent else 1) if important else (2 if urgent else 3)]
+        score = (value + criticality) / hours
+
+        ranked = RankedTask(index, task.title, 0, quadrant, round(score, 4), priority, hours,
+                            deadline.isoformat() if deadline else None, days_left)
+        keyed.append(((QUADRANTS.index(quadrant), -score, days_left if days_left is not None else math.inf, index), ranked))
+    keyed.sort(key=lambda pair: pair[0])
+    result = []
+    for rank, (_, ranked) in enumerate(keyed, start=1):
+        ranked.rank = rank
+        result.append(ranked)
+    return result
+
+
+def _minutes(value: str) -> int:
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _clock(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+@dataclass(frozen=True)
+class WorkWeek:
+    """Working hours as minutes after midnight"""
+    day_start: int = 9 * 60
+    day_end: int = 18 * 60
+    breaks: Tuple[Tuple[int, int], ...] = ((12 * 60, 13 * 60),)  # lunch
+    focus_minutes: int = 90  # longest stretch of work before a short break
+    break_minutes: int = 15
+    min_block_minutes: int = 30  # shorter gaps are left free
+    weekends: bool = False
+
+    @classmethod
+    def from_clock(cls, day_start: str = "09:00", day_end: str = "18:00",
+                   lunch: Optional[Tuple[str, str]] = ("12:00", "13:00"), **options) -> "WorkWeek":
+        breaks = ((_minutes(lunch[0]), _minutes(lunch[1])),) if lunch else ()
+        return cls(_minutes(day_start), _minutes(day_end), breaks, **options)
+
+    def free_intervals(self) -> List[Tuple[int, int]]:
+        intervals, start = [], self.day_start
+        for break_start, break_end in sorted(self.breaks):
+            if break_start > start:
+                intervals.append((start, min(break_start, self.day_end)))
+            start = max(start, break_end)
+        if start < self.day_end:
+            intervals.append((start, self.day_end))
+        return intervals
+
+    def working_days(self, start: date, count: int) -> List[date]:
+        days, day = [], start
+        while len(days) < count:
+            if self.weekends or day.weekday() < 5:
+                days.append(day)
+            day += timedelta(days=1)
+        return days
+
+
+@dataclass
+class TimeBlock:
+    task: int  # index in the submitted list
+    title: str
+    date: str
+    start: str
+    end: str
+
+
+@dataclass
+class Schedule:
+    blocks: List[TimeBlock] = field(default_factory=list)
+    unscheduled: List[int] = field(default_factory=list)  # did not (fully) fit in the horizon
+    late: List[int] = field(default_factory=list)  # finish after their deadline
+    scheduled_hours: float = 0.0
+    capacity_hours: float = 0.0
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["utilisation"] = round(self.scheduled_hours / self.capacity_hours, 4) if self.capacity_hours else 0.0
+        return data
+
+
+def schedule_tasks(ranked: Sequence[RankedTask], start: date, days: int, week: WorkWeek = WorkWeek()) -> Schedule:
+    """Pack ranked tasks, in rank order, into the free intervals of `days` working days.
+
+    Each task takes the earliest free time left, split into blocks of at
+    most `focus_minutes` with a break between consecutive focus blocks. A
+    task that does not fit in the current interval is split across it and
+    the next, so no usable gap is left behind and every interval is
+    visited once: packing is linear in blocks plus intervals.
+    """
+    gaps = [(day.isoformat(), begin, end) for day in week.working_days(start, days) for begin, end in week.free_intervals()]
+    schedule = Schedule(capacity_hours=round(sum(end - begin for _, begin, end in gaps) / 60, 2))
+    g = 0
+    cursor = gaps[0][1] if gaps else 0
+    worked = 0  # minutes since the last break
+    scheduled = 0
+    for task in ranked:
+        remaining = round(task.hours * 60)
+        last_day = None
+        while remaining > 0 and g < len(gaps):
+            day, _, gap_end = gaps[g]
+            if worked and worked + min(remaining, week.focus_minutes) > week.focus_minutes:
+                cursor += week.break_minutes
+                worked = 0
+            free = gap_end - cursor
+            if free <= 0 or (free < week.min_block_minutes and free < remaining):
+                g += 1
+                if g < len(gaps):
+                    cursor, worked = gaps[g][1], 0
+                continue
+            length = min(remaining, free, week.focus_minutes)
+            schedule.blocks.append(TimeBlock(task.index, task.title, day, _clock(cursor), _clock(cursor + length)))
+            cursor += length
+            worked += length
+            remaining -= length
+            scheduled += length
+            last_day = day
+        if remaining > 0:
+            schedule.unscheduled.append(task.index)
+        elif task.deadline is not None and last_day is not None and last_day > task.deadline:
+            schedule.late.append(task.index)
+    schedule.scheduled_hours = round(scheduled / 60, 2)
+    return schedule
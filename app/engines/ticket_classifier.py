@@ -0,0 +1,159 @@
+"""Lexicon-based support ticket classifier.
+
+Pure CPU, no model files: every lexicon is a module-level dict built once at
+import, and classifying a ticket is a single pass over its words and word
+pairs. Good enough to label clear-cut tickets on its own and to tell which
+ones are ambiguous enough to send to an LLM.
+"""
+import re
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+SENTIMENTS = ("positive", "neutral", "negative", "angry")
+CATEGORIES = ("technical", "billing", "feature_request", "complaint", "question")
+URGENCIES = ("low", "medium", "high", "urgent")
+
+# word -> polarity weight; negators flip the next few words
+POLARITY: Dict[str, float] = {
+    **dict.fromkeys([
+        "thanks", "thank", "great", "love", "awesome", "excellent", "amazing", "happy",
+        "helpful", "appreciate", "perfect", "good", "nice", "wonderful", "glad", "pleased",
+    ], 1.0),
+    **dict.fromkeys([
+        "problem", "issue", "broken", "bad", "poor", "wrong", "fail", "failed", "failing",
+        "error", "unable", "cannot", "can't", "disappointed", "frustrated", "annoying",
+        "slow", "confusing", "missing", "lost", "stuck", "unhappy",
+    ], -1.0),
+}
+
+# Multi-word polarity cues; not subject to negation
+POLARITY_PHRASES: Dict[str, float] = dict.fromkeys([
+    "not working", "doesn't work", "does not work", "charged twice", "money back", "still waiting",
+], -1.0)
+
+# Strong words that mark an angry rather than merely negative customer
+ANGER = frozenset([
+    "angry", "furious", "ridiculous", "unacceptable", "outrageous", "worst", "terrible",
+    "horrible", "scam", "fraud", "useless", "pathetic", "disgusting", "lawyer", "sue",
+    "never again", "fed up", "waste of",
+])
+
+NEGATORS = frozenset(["not", "no", "never", "don't", "doesn't", "didn't", "isn't", "wasn't", "won't"])
+
+CATEGORY_TERMS: Dict[str, Dict[str, float]] = {
+    "technical": dict.fromkeys([
+        "error", "bug", "crash", "crashes", "crashed", "login", "log in", "password", "broken",
+        "not working", "api", "timeout", "install", "installation", "sync", "load", "loading",
+        "page", "app", "server", "500", "404", "integration", "reset", "upload", "download",
+    ], 1.0),
+    "billing": dict.fromkeys([
+        "charge", "charged", "charges", "invoice", "refund", "payment", "paid", "pay",
+        "subscription", "price", "pricing", "billing", "billed", "card", "receipt", "plan",
+        "upgrade", "downgrade", "cancel", "renewal", "charged twice", "money back",
+    ], 1.0),
+    "feature_request": dict.fromkeys([
+        "feature", "would be nice", "would love", "add", "support for", "wish", "request",
+        "suggestion", "suggest", "could you add", "roadmap", "option to", "ability to",
+    ], 1.0),
+    "complaint": dict.fromkeys([
+        "disappointed", "unacceptable", "worst", "complaint", "terrible", "rude", "poor service",
+        "waste of", "never again", "horrible", "ridiculous",
+    ], 1.0),
+    "question": dict.fromkeys([
+        "how", "what", "where", "when", "which", "can i", "is it possible", "do you",
+        "does it", "wondering", "question",
+    ], 0.6),
+}
+
+URGENCY_TERMS: Dict[str, float] = {
+    **dict.fromkeys(["urgent", "urgently", "asap", "immediately", "emergency", "critical", "right now"], 2.0),
+    **dict.fromkeys([
+        "outage", "down", "production", "data loss", "security", "hacked", "breach",
+        "charged twice", "locked out", "cannot access", "can't access", "deadline", "today",
+    ], 1.5),
+    **dict.fromkeys(["blocked", "blocking", "stuck", "broken", "not working", "refund", "lawyer"], 1.0),
+}
+
+STATED_PRIORITY = {"low": -1.0, "medium": 0.0, "high": 1.0, "urgent": 2.0}
+
+
+@dataclass
+class TicketClassification:
+    sentiment: str
+    category: str
+    urgency: str
+    confidence: float  # 0-1; low values mark tickets worth a second opinion
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _terms(text: str) -> List[str]:
+    words = _WORD.findall(text.lower())
+    terms = list(words)
+    terms.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    terms.extend(f"{a} {b} {c}" for a, b, c in zip(words, words[1:], words[2:]))
+    return terms
+
+
+def _polarity(words: List[str]) -> float:
+    score = 0.0
+    negate_until = -1
+    for i, word in enumerate(words):
+        if word in NEGATORS:
+            negate_until = i + 3
+            continue
+        weight = POLARITY.get(word, 0.0)
+        score += -weight if i <= negate_until else weight
+    return score
+
+
+def _score(terms: Iterable[str], lexicon: Dict[str, float]) -> float:
+    return sum(lexicon.get(term, 0.0) for term in terms)
+
+
+def classify_ticket(subject: str, message: str, priority: Optional[str] = None) -> TicketClassification:
+    """Label a ticket's sentiment, category and urgency from its text"""
+    text = f"{subject}\n{message}"
+    words = _WORD.findall(text.lower())
+    terms = _terms(text)
+    term_set = set(terms)
+
+    polarity = _polarity(words) + sum(weight for phrase, weight in POLARITY_PHRASES.items() if phrase in term_set)
+    anger = len(ANGER & term_set)
+    shouting = text.count("!") >= 3 or sum(1 for w in text.split() if len(w) > 3 and w.isupper()) >= 3
+    if anger >= 2 or (anger and (shouting or polarity < 0)):
+        sentiment = "angry"
+    elif polarity <= -1 or anger:
+        sentiment = "negative"
+    elif polarity >= 1:
+        sentiment = "positive"
+    else:
+        sentiment = "neutral"
+
+    category_scores = {category: _score(terms, lexicon) for category, lexicon in CATEGORY_TERMS.items()}
+    if "?" in text:
+        category_scores["question"] += 0.5
+    ranked = sorted(category_scores.items(), key=lambda item: item[1], reverse=True)
+    (category, best), (_, runner_up) = ranked[0], ranked[1]
+    if best == 0:
+        category = "question"
+
+    urgency_score = _score(terms, URGENCY_TERMS) + STATED_PRIORITY.get((priority or "medium").lower(), 0.0)
+    urgency_score += {"angry": 1.5, "negative": 0.5}.get(sentiment, 0.0)
+    if urgency_score >= 3:
+        urgency = "urgent"
+    elif urgency_score >= 1.5:
+        urgency = "high"
+    elif urgency_score >= 0:
+        urgency = "medium"
+    else:
+        urgency = "low"
+
+    # Confident when the top category clearly wins and the sentiment is not mixed
+    category_margin = (best - runner_up) / best if best else 0.0
+    sentiment_clarity = 1.0 if sentiment == "angry" else min(1.0, 0.5 + abs(polarity) / 4)
+    confidence = round(0.6 * category_margin + 0.4 * sentiment_clarity, 3)
+    return TicketClassification(sentiment, category, urgency, confidence)
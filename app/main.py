@@ -3,6 +3,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.payment import razorpay_integration, stripe_integration
@@ -17,13 +20,73 @@ from app.ai_tools import (
     task_manager,
     time_management
 )
+from app.core.bot_registry import BotRegistry
+from app.core.cache import create_cache_from_env
+from app.core import conversations, exports, jobs, llm, metrics, routing, semantic_cache
+from app.core.identity import TierResolver
+from app.core.metering import UsageMeter
+from app.core.rate_limit import RateLimitMiddleware, create_bucket_store_from_env
+from app.core.resilience import UpstreamError, upstream_error_handler
+from app.database import SessionLocal, engine, init_db
+from app.payment.service import PaymentService
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    # One pooled LLM client per worker, shared by every tool router
+    app.state.llm = llm.LLMGateway.from_env()
+    app.state.metrics = metrics.MetricsExporter.from_env()
+    app.state.llm.add_listener(metrics.on_completion)
+    app.state.metrics.start()
+    app.state.meter = UsageMeter.from_env(SessionLocal)
+    app.state.llm.add_listener(app.state.meter.on_completion)
+    app.state.meter.start()
+    app.state.tiers = TierResolver.from_env(SessionLocal)
+    app.state.model_router = routing.ModelRouter.from_env(app.state.tiers)
+    app.state.llm.add_listener(app.state.model_router.on_completion)
+    app.state.rate_limits = create_bucket_store_from_env()
+    app.state.cache = create_cache_from_env()
+    app.state.semantic_cache = semantic_cache.SemanticCache.from_env()
+    app.state.bots = BotRegistry.from_env(SessionLocal)
+    # Free the replies cached for a bot's previous version once it changes
+    app.state.bots.add_listener(lambda bot: app.state.semantic_cache.clear(bot.cache_namespace))
+    await app.state.bots.warm_up(int(os.getenv("CHATBOT_WARM_UP", "100")))
+    app.state.conversations = conversations.ConversationStore.from_env()
+    app.state.payments = PaymentService.from_env()
+    app.state.exports = exports.ExportService.from_env()
+    app.state.jobs = jobs.JobQueue.from_env(SessionLocal, app.state.llm, app.state.model_router)
+    app.state.jobs.start()
+    try:
+        yield
+    finally:
+        await app.state.jobs.stop()
+        app.state.payments.close()
+        app.state.exports.close()
+        await app.state.meter.stop()
+        await app.state.rate_limits.aclose()
+        await app.state.cache.aclose()
+        await app.state.bots.flush_use_counts()
+        await app.state.conversations.aclose()
+        app.state.semantic_cache.save()
+        await app.state.llm.aclose()
+        await app.state.metrics.stop()
+        await engine.dispose()
+
 
 app = FastAPI(
     title="Sphere.AI Backend API",
     description="AI-powered tools for founders and entrepreneurs",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Timeouts, upstream 429s and open circuits answer 504/503 with a machine-readable code
+app.add_exception_handler(UpstreamError, upstream_error_handler)
+
+# Admission control; added before CORS so 429 responses still get CORS headers
+app.add_middleware(RateLimitMiddleware)
+
 # CORS Configuration - Allow your frontend to access the API
 app.add_middleware(
     CORSMiddleware,
@@ -38,6 +101,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so latency covers rate limiting and CORS too
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Include all AI tool routers
 app.include_router(business_plan.router, prefix="/api/tools", tags=["Business Plan"])
 app.include_router(market_research.router, prefix="/api/tools", tags=["Market Research"])
@@ -48,6 +114,14 @@ app.include_router(chatbot_builder.router, prefix="/api/tools", tags=["Chatbot B
 app.include_router(customer_support.router, prefix="/api/tools", tags=["Customer Support"])
 app.include_router(task_manager.router, prefix="/api/tools", tags=["Task Manager"])
 app.include_router(time_management.router, prefix="/api/tools", tags=["Time Management"])
+app.include_router(exports.router, prefix="/api/tools", tags=["Export"])
+
+app.include_router(jobs.router, prefix="/api", tags=["Jobs"])
+app.include_router(semantic_cache.router, prefix="/api", tags=["Semantic Cache"])
+app.include_router(conversations.router, prefix="/api", tags=["Conversations"])
+app.include_router(routing.router, prefix="/api", tags=["Model Routing"])
+app.include_router(llm.router, prefix="/api", tags=["LLM Providers"])
+app.include_router(metrics.router, tags=["Metrics"])
 
 app.include_router(razorpay_integration.router, prefix="/api/payment", tags=["Payment"])
 app.include_router(stripe_integration.router, prefix="/api/payment", tags=["Payment"])
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -25,7 +25,7 @@ class Subscription(Base):
     __tablename__ = "subscriptions"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     plan_name = Column(String)  # starter, growth, enterprise
     status = Column(String, default="active")  # active, cancelled, expired
     amount = Column(Float)
@@ -45,12 +45,13 @@ class UsageLog(Base):
     __tablename__ = "usage_logs"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    tool_name = Column(String)  # business_plan, pitch_deck, content_generator, etc.
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    tool_name = Column(String, index=True)  # business_plan, pitch_deck, content_generator, etc.
     action = Column(String)  # generate, export, save
     credits_used = Column(Integer, default=1)
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    metadata = Column(Text, nullable=True)  # JSON string with additional data
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    # "metadata" is reserved on declarative classes, so map the column under another name
+    extra_data = Column("metadata", Text, nullable=True)  # JSON string with additional data
     
     # Relationships
     user = relationship("User", back_populates="usage_logs")
@@ -58,11 +59,52 @@ class UsageLog(Base):
 
 class GeneratedContent(Base):
     __tablename__ = "generated_content"
+    __table_args__ = (
+        # History queries: a user's latest artifacts, optionally per tool
+        Index("ix_generated_content_user_created", "user_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    tool_name = Column(String)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    tool_name = Column(String, index=True)
     title = Column(String)
     content = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(String, primary_key=True)  # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=True)
+    tool_name = Column(String, index=True)
+    status = Column(String, default="queued", index=True)  # queued, running, succeeded, failed
+    payload = Column(Text)  # JSON request body
+    result = Column(Text, nullable=True)  # JSON response body
+    error = Column(Text, nullable=True)
+    callback_url = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)
+    owner = Column(String, nullable=True)  # worker currently responsible for the job
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class ChatbotConfigRecord(Base):
+    __tablename__ = "chatbot_configs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=True)
+    bot_name = Column(String)
+    business_name = Column(String)
+    business_description = Column(Text)
+    common_questions = Column(Text)  # JSON list
+    tone = Column(String)
+    language = Column(String)
+    system_prompt = Column(Text)
+    sample_responses = Column(Text)  # JSON object question -> answer
+    use_count = Column(Integer, default=0, index=True)  # drives startup warm-up
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
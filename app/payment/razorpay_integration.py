@@ -1,47 +1,46 @@
 import razorpay
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 from fastapi.responses import JSONResponse
-import os
 
-router = APIRouter()
+from app.core.resilience import UpstreamError
+from app.payment.service import PaymentService, get_payments
 
-# Initialize Razorpay client
-razorpay_client = razorpay.Client(
-    auth=(
-        os.getenv("RAZORPAY_KEY_ID"),
-        os.getenv("RAZORPAY_KEY_SECRET"))
-)
+router = APIRouter()
 
 @router.post("/create-order-razorpay")
-async def create_razorpay_order(request: Request):
+async def create_razorpay_order(request: Request, payments: PaymentService = Depends(get_payments)):
     try:
         data = await request.json()
-        amount = int(data.get("amount"))            # Amount in rupees
+        try:
+            amount = int(data.get("amount"))        # Amount in rupees
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="amount must be a whole number")
         currency = data.get("currency", "INR")
         plan_name = data.get("plan_name")
         user_email = data.get("user_email")
         order_data = {
             "amount": amount * 100,                 # Amount in paise
             "currency": currency,
-            "receipt": f"receipt_{plan_name}_{user_email}",
             "notes": {
                 "plan_name": plan_name,
                 "user_email": user_email
             }
         }
-        order = razorpay_client.order.create(data=order_data)
+        order = await payments.create_razorpay_order(order_data)
         return JSONResponse({
             "success": True,
             "order_id": order["id"],
             "amount": order["amount"],
             "currency": order["currency"],
-            "key_id": os.getenv("RAZORPAY_KEY_ID")
+            "key_id": payments.razorpay_key_id
         })
+    except (HTTPException, UpstreamError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/verify-payment-razorpay")
-async def verify_razorpay_payment(request: Request):
+async def verify_razorpay_payment(request: Request, payments: PaymentService = Depends(get_payments)):
     try:
         data = await request.json()
         params_dict = {
@@ -50,7 +49,7 @@ async def verify_razorpay_payment(request: Request):
             'razorpay_signature': data.get("razorpay_signature")
         }
         try:
-            razorpay_client.utility.verify_payment_signature(params_dict)
+            await payments.verify_razorpay_signature(params_dict)
             return JSONResponse({
                 "success": True,
                 "message": "Payment verified successfully",
@@ -58,5 +57,7 @@ async def verify_razorpay_payment(request: Request):
             })
         except razorpay.errors.SignatureVerificationError:
             raise HTTPException(status_code=400, detail="Invalid payment signature")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
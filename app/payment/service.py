@@ -0,0 +1,181 @@
+import asyncio
+import functools
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import razorpay
+import requests
+import stripe
+from fastapi import Request
+from requests.adapters import HTTPAdapter
+
+from app.core.resilience import (
+    CircuitBreaker,
+    Upstream,
+    UpstreamError,
+    UpstreamRateLimited,
+    UpstreamRejected,
+    UpstreamTimeout,
+)
+
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to every request"""
+
+    def __init__(self, timeout: float, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def _pooled_session(timeout: float, pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = _TimeoutHTTPAdapter(timeout, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _classify_razorpay(error: Exception) -> Optional[UpstreamError]:
+    if isinstance(error, razorpay.errors.BadRequestError):
+        return UpstreamRejected("razorpay", str(error))
+    if isinstance(error, requests.Timeout):
+        return UpstreamTimeout("razorpay", "request timed out")
+    if isinstance(error, (razorpay.errors.ServerError, razorpay.errors.GatewayError, requests.ConnectionError)):
+        return UpstreamError("razorpay", str(error))
+    return None
+
+
+def _classify_stripe(error: Exception) -> Optional[UpstreamError]:
+    if isinstance(error, stripe.RateLimitError):
+        return UpstreamRateLimited("stripe", error.user_message or "rate limited")
+    if isinstance(error, (stripe.InvalidRequestError, stripe.CardError)):
+        return UpstreamRejected("stripe", error.user_message or str(error))
+    if isinstance(error, (stripe.APIConnectionError, stripe.APIError)):
+        return UpstreamError("stripe", str(error))
+    return None
+
+
+class PaymentService:
+    """Async facade over the synchronous Razorpay and Stripe SDKs.
+
+    Every gateway call runs on a dedicated, bounded thread pool so a slow
+    checkout never blocks the event loop serving the AI tools. Each gateway
+    gets its own pooled keep-alive session and an Upstream policy: a circuit
+    breaker and jittered retries for calls that are safe to repeat. The
+    deadline is the session's own request timeout, so a timed-out call has
+    really stopped (and freed its thread) before it is retried. Stripe
+    creates carry an idempotency key; Razorpay has none, so a retried order
+    creation first looks for the order under its unique receipt.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        pool_size: int = 10,
+        razorpay_timeout: float = 15.0,
+        stripe_timeout: float = 20.0,
+        retries: int = 2,
+        breaker_failures: int = 5,
+        breaker_cooldown: float = 30.0,
+    ):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="payment")
+        self.upstreams = {
+            "razorpay": Upstream("razorpay", razorpay_timeout, retries,
+                                 breaker=CircuitBreaker(breaker_failures, breaker_cooldown),
+                                 classify=_classify_razorpay, abandon_on_timeout=False),
+            "stripe": Upstream("stripe", stripe_timeout, retries,
+                               breaker=CircuitBreaker(breaker_failures, breaker_cooldown),
+                               classify=_classify_stripe, abandon_on_timeout=False),
+        }
+
+        self._razorpay_session = _pooled_session(razorpay_timeout, pool_size)
+        self.razorpay_key_id = os.getenv("RAZORPAY_KEY_ID")
+        self.razorpay = razorpay.Client(
+            session=self._razorpay_session,
+            auth=(self.razorpay_key_id, os.getenv("RAZORPAY_KEY_SECRET")),
+        )
+
+        self._stripe_session = _pooled_session(stripe_timeout, pool_size)
+        stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+        stripe.default_http_client = stripe.RequestsClient(
+            timeout=stripe_timeout, session=self._stripe_session
+        )
+
+    @classmethod
+    def from_env(cls) -> "PaymentService":
+        return cls(
+            max_workers=int(os.getenv("PAYMENT_MAX_WORKERS", "8")),
+            pool_size=int(os.getenv("PAYMENT_POOL_SIZE", "10")),
+            razorpay_timeout=float(os.getenv("RAZORPAY_TIMEOUT", "15")),
+            stripe_timeout=float(os.getenv("STRIPE_TIMEOUT", "20")),
+            retries=int(os.getenv("PAYMENT_RETRIES", "2")),
+            breaker_failures=int(os.getenv("PAYMENT_BREAKER_FAILURES", "5")),
+            breaker_cooldown=float(os.getenv("PAYMENT_BREAKER_COOLDOWN", "30")),
+        )
+
+    def _offload(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    async def run(self, gateway: str, fn, *args, idempotent: bool = False, **kwargs):
+        """Run a blocking SDK call on the payment pool under the gateway's policy.
+
+        Raises an UpstreamError subclass when the gateway times out, is
+        throttled, rejects the request or has its circuit open.
+        """
+        return await self.upstreams[gateway].call(lambda: self._offload(fn, *args, **kwargs), idempotent)
+
+    async def create_razorpay_order(self, order_data: dict) -> dict:
+        """Create an order, retried safely: a retry first fetches the order by its receipt.
+
+        An attempt that timed out may still have created the order, so the
+        receipt (a fresh id unless one is given) is what makes it findable.
+        """
+        order_data = {**order_data, "receipt": order_data.get("receipt") or uuid.uuid4().hex}
+        attempted = False
+
+        def create() -> dict:
+            nonlocal attempted
+            if attempted:
+                existing = self.razorpay.order.all({"receipt": order_data["receipt"]}).get("items")
+                if existing:
+                    return existing[0]
+            attempted = True
+            return self.razorpay.order.create(data=order_data)
+
+        return await self.run("razorpay", create, idempotent=True)
+
+    async def verify_razorpay_signature(self, params: dict):
+        """Raises razorpay.errors.SignatureVerificationError on mismatch"""
+        # Local HMAC check, no request to Razorpay
+        return await self._offload(self.razorpay.utility.verify_payment_signature, params)
+
+    async def create_stripe_payment_intent(self, **params):
+        # One key for every attempt, so a retried create cannot charge twice
+        params.setdefault("idempotency_key", uuid.uuid4().hex)
+        return await self.run("stripe", stripe.PaymentIntent.create, idempotent=True, **params)
+
+    async def construct_stripe_event(self, payload: bytes, sig_header: str):
+        """Raises stripe.SignatureVerificationError on mismatch"""
+        # Local signature check, no request to Stripe
+        return await self._offload(
+            stripe.Webhook.construct_event,
+            payload, sig_header, os.getenv("STRIPE_WEBHOOK_SECRET")
+        )
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._razorpay_session.close()
+        self._stripe_session.close()
+
+
+def get_payments(request: Request) -> PaymentService:
+    """FastAPI dependency returning the payment service created in the app lifespan"""
+    return request.app.state.payments
@@ -1,21 +1,25 @@
 import stripe
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 from fastapi.responses import JSONResponse
 import os
 
-router = APIRouter()
+from app.core.resilience import UpstreamError
+from app.payment.service import PaymentService, get_payments
 
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+router = APIRouter()
 
 @router.post("/create-payment-intent-stripe")
-async def create_stripe_payment_intent(request: Request):
+async def create_stripe_payment_intent(request: Request, payments: PaymentService = Depends(get_payments)):
     try:
         data = await request.json()
-        amount = int(data.get("amount"))
+        try:
+            amount = int(data.get("amount"))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="amount must be a whole number")
         currency = data.get("currency", "usd")
         plan_name = data.get("plan_name")
         user_email = data.get("user_email")
-        intent = stripe.PaymentIntent.create(
+        intent = await payments.create_stripe_payment_intent(
             amount=amount * 100,  # dollars to cents
             currency=currency,
             metadata={
@@ -29,19 +33,17 @@ async def create_stripe_payment_intent(request: Request):
             "client_secret": intent.client_secret,
             "publishable_key": os.getenv("STRIPE_PUBLISHABLE_KEY")
         })
+    except (HTTPException, UpstreamError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/webhook/stripe")
-async def stripe_webhook(request: Request):
+async def stripe_webhook(request: Request, payments: PaymentService = Depends(get_payments)):
     payload = await request.body()
     sig_header = request.headers.get("Stripe-Signature")
     try:
-        event = stripe.Webhook.construct_event(
-            payload, 
-            sig_header, 
-            os.getenv("STRIPE_WEBHOOK_SECRET")
-        )
+        event = await payments.construct_stripe_event(payload, sig_header)
         if event["type"] == "payment_intent.succeeded":
             payment_intent = event["data"]["object"]
             # Activate subscription, send confirmation
@@ -52,5 +54,7 @@ async def stripe_webhook(request: Request):
             subscription = event["data"]["object"]
             # Deactivate subscription
         return JSONResponse({"status": "success"})
+    except (ValueError, stripe.SignatureVerificationError):
+        raise HTTPException(status_code=400, detail="Invalid webhook payload or signature")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,19 @@
+"""Shared test setup: a throwaway database and fake LLM providers.
+
+The environment is set before any app module is imported, because the
+database engine and the app services read it at import and startup.
+"""
+import json
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="sphere-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{_tmp}/test.db",
+    "CONVERSATION_DB_PATH": os.path.join(_tmp, "conversations.db"),
+    "EXPORT_CACHE_DIR": os.path.join(_tmp, "exports"),
+    "IDENTITY_SECRET": "test-secret",
+    "LLM_PROVIDERS": "fake",
+    "LLM_FAKE_PROVIDERS": json.dumps([{"name": "fake", "latency": 0, "reply": "ok"}]),
+    "CHATBOT_WARM_UP": "0",
+})
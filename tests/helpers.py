@@ -0,0 +1,34 @@
+import time
+import uuid
+from typing import Callable
+
+
+def bench(fn: Callable[[], object], iterations: int) -> float:
+    """Mean seconds per call of `fn` over `iterations` calls, after one warm-up call"""
+    fn()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations
+
+
+def report(name: str, seconds: float, unit: str = "call"):
+    if seconds >= 1e-3:
+        print(f"{name}: {seconds * 1e3:.2f} ms/{unit}")
+    else:
+        print(f"{name}: {seconds * 1e6:.1f} us/{unit}")
+
+
+def create_user(client, tier: str) -> int:
+    """Insert a user on the given plan through a running TestClient; returns its id"""
+    from app.database import SessionLocal
+    from app.models import User
+
+    async def insert() -> int:
+        async with SessionLocal() as session:
+            user = User(email=f"{uuid.uuid4().hex}@example.com", full_name="Test", subscription_tier=tier)
+            session.add(user)
+            await session.commit()
+            return user.id
+
+    return client.portal.call(insert)
@@ -0,0 +1,101 @@
+"""A local OpenAI-compatible chat completions server for gateway tests.
+
+Answers every call after `latency` seconds and records the client port
+of each request (one per TCP connection) and the most calls in flight.
+Set `status` to answer with that HTTP error instead, or `stream_error`
+to break off streams with an error event after the first token.
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class StubOpenAI:
+    def __init__(self, latency: float = 0.01, reply: str = "stub reply", status: int = 200,
+                 stream_error: bool = False):
+        self.latency = latency
+        self.reply = reply
+        self.status = status
+        self.stream_error = stream_error
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = set()
+        self._server = None
+        self._thread = None
+        self._socket = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._socket.getsockname()
+        return f"http://{host}:{port}/v1"
+
+    def _app(self) -> FastAPI:
+        app = FastAPI()
+
+        @app.post("/v1/chat/completions")
+        async def completions(request: Request):
+            body = await request.json()
+            self.calls += 1
+            self.connections.add(request.client.port)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                await asyncio.sleep(self.latency)
+            finally:
+                self.in_flight -= 1
+            if self.status != 200:
+                return JSONResponse({"error": {"message": f"stub error {self.status}", "type": "stub"}},
+                                    status_code=self.status)
+            if body.get("stream"):
+                return StreamingResponse(self._chunks(body["model"]), media_type="text/event-stream")
+            return {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13},
+            }
+
+        return app
+
+    async def _chunks(self, model: str):
+        def chunk(delta: dict, finish_reason=None, usage=None) -> str:
+            data = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model, "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            if usage:
+                data["usage"] = usage
+            return f"data: {json.dumps(data)}\n\n"
+
+        for word in self.reply.split(" "):
+            yield chunk({"content": word + " "})
+            if self.stream_error:
+                yield f"data: {json.dumps({'error': {'message': 'stub stream broke', 'type': 'server_error'}})}\n\n"
+                return
+        yield chunk({}, finish_reason="stop")
+        yield chunk({}, usage={"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13})
+        yield "data: [DONE]\n\n"
+
+    def __enter__(self) -> "StubOpenAI":
+        self._socket = socket.socket()
+        self._socket.bind(("127.0.0.1", 0))
+        config = uvicorn.Config(self._app(), log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=5)
+        self._socket.close()
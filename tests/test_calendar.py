@@ -0,0 +1,111 @@
+import random
+from datetime import date, datetime, time, timedelta
+
+from fastapi.testclient import TestClient
+
+from app.core.identity import sign_user_token
+from app.engines.calendar import IntervalTree, analyse_calendar
+from app.engines.scheduler import WorkWeek
+from app.main import app
+from tests.helpers import bench, create_user, report
+
+START = date(2026, 1, 5)  # a Monday
+
+
+def make_meetings(count: int, weeks: int, seed: int = 0):
+    """Meetings on working days, 15 minutes to 2 hours long, overlapping at random"""
+    rng = random.Random(seed)
+    days = [START + timedelta(days=n) for n in range(weeks * 7) if (START + timedelta(days=n)).weekday() < 5]
+    meetings = []
+    for _ in range(count):
+        begin = datetime.combine(rng.choice(days), time(8)) + timedelta(minutes=15 * rng.randint(0, 44))
+        meetings.append((begin, begin + timedelta(minutes=15 * rng.randint(1, 8))))
+    return meetings
+
+
+def end_date(weeks: int) -> date:
+    return START + timedelta(days=weeks * 7 - 1)
+
+
+def parse(stamp: str) -> datetime:
+    return datetime.fromisoformat(stamp)
+
+
+def test_interval_tree_matches_a_linear_scan():
+    rng = random.Random(1)
+    intervals = []
+    for n in range(2000):
+        start = rng.randint(0, 50_000)
+        intervals.append((start, start + rng.randint(1, 500), n))
+    tree = IntervalTree(intervals)
+    for _ in range(200):
+        start = rng.randint(0, 50_000)
+        end = start + rng.randint(1, 2000)
+        assert tree.overlapping(start, end) == sorted(i for i in intervals if i[0] < end and i[1] > start)
+
+
+def test_conflicts_match_a_pairwise_count():
+    meetings = make_meetings(600, 2)
+    plan = analyse_calendar(meetings, START, end_date(2))
+    pairs = {
+        (i, j)
+        for i, (s1, e1) in enumerate(meetings)
+        for j, (s2, e2) in enumerate(meetings)
+        if i < j and s1 < e2 and s2 < e1
+    }
+    assert plan.conflict_count == len(pairs)
+    assert {tuple(sorted(c.events)) for c in plan.conflicts} <= pairs
+    assert len(plan.conflicts) == min(len(pairs), 500)
+
+
+def test_proposed_blocks_never_touch_a_meeting():
+    meetings = make_meetings(80, 4)  # about four a day, so free time is left
+    buffer = timedelta(minutes=10)
+    plan = analyse_calendar(meetings, START, end_date(4), "maker", buffer_minutes=10)
+    windows = WorkWeek().free_intervals()
+
+    assert plan.blocks
+    every = sorted(meetings)
+    for block in plan.blocks:
+        start, end = parse(block.start), parse(block.end)
+        assert start.date() == end.date() and start.weekday() < 5
+        minutes = (start.hour * 60 + start.minute, end.hour * 60 + end.minute)
+        assert any(begin <= minutes[0] and minutes[1] <= finish for begin, finish in windows)
+        assert not any(s - buffer < end and start < e + buffer for s, e in every)
+    # Each meeting ends up in exactly one busy block
+    assert sorted(i for block in plan.busy for i in block.events) == list(range(len(meetings)))
+
+
+def test_calendar_benchmark():
+    timings = {}
+    for count, weeks in ((1000, 4), (5000, 8), (10_000, 13)):
+        meetings = make_meetings(count, weeks)
+        timings[count] = bench(lambda: analyse_calendar(meetings, START, end_date(weeks)), 5)
+        report(f"analyse_calendar ({count} meetings, {weeks} weeks)", timings[count])
+    # Multi-week calendars with thousands of meetings stay well under 100 ms
+    assert timings[1000] < 0.05
+    assert timings[5000] < 0.1
+
+
+def test_calendar_optimization_endpoint():
+    meetings = make_meetings(200, 4)
+    payload = {
+        "meetings": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in meetings],
+        "work_style": "manager",
+        "start_date": START.isoformat(),
+        "end_date": end_date(4).isoformat(),
+    }
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        response = client.post("/api/tools/calendar-optimization", json=payload, headers=headers)
+        too_long = client.post(
+            "/api/tools/calendar-optimization",
+            json={**payload, "end_date": (START + timedelta(days=200)).isoformat()},
+            headers=headers,
+        )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["meeting_count"] == 200 and body["conflict_count"] > 0
+    assert "commentary" not in body
+    assert body["blocks"] and all(block["kind"] in ("maker", "manager") for block in body["blocks"])
+    assert too_long.status_code == 400
@@ -0,0 +1,32 @@
+from fastapi.testclient import TestClient
+
+from app.core.identity import sign_user_token
+from app.main import app
+from tests.helpers import create_user
+
+CONFIG = {
+    "bot_name": "Ava",
+    "business_name": "Acme",
+    "business_description": "We sell anvils.",
+    "common_questions": ["Do you ship abroad?"],
+    "tone": "friendly",
+    "language": "english",
+}
+
+
+def test_only_the_verified_owner_can_edit_a_bot():
+    with TestClient(app) as client:
+        owner = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        other = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        owned = client.post("/api/tools/create-chatbot-config", json=CONFIG, headers=owner).json()["config_id"]
+        ownerless = client.post("/api/tools/create-chatbot-config", json=CONFIG).json()["config_id"]
+
+        edited = {**CONFIG, "bot_name": "Mallory"}
+        assert client.put(f"/api/tools/chatbot-config/{owned}", json=edited, headers=other).status_code == 403
+        assert client.put(f"/api/tools/chatbot-config/{owned}", json=edited).status_code == 403
+        assert client.put(f"/api/tools/chatbot-config/{ownerless}", json=edited, headers=other).status_code == 403
+        assert client.put(f"/api/tools/chatbot-config/{ownerless}", json=edited).status_code == 403
+        assert client.get(f"/api/tools/chatbot-config/{ownerless}").json()["bot_config"]["bot_name"] == "Ava"
+
+        assert client.put(f"/api/tools/chatbot-config/{owned}", json=edited, headers=owner).status_code == 200
+        assert client.get(f"/api/tools/chatbot-config/{owned}").json()["bot_config"]["bot_name"] == "Mallory"
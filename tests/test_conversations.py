@@ -0,0 +1,163 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from app.core.conversations import ConversationStore
+from app.core.llm import LLMGateway
+from app.core.providers import FakeProvider
+from tests.helpers import report
+
+SYSTEM = {"role": "system", "content": "You are a helpful bot."}
+
+
+def turn(role: str, text: str) -> dict:
+    return {"role": role, "content": text}
+
+
+def test_two_workers_never_lose_each_others_turns(tmp_path):
+    """Stores sharing a file stand in for two workers serving one session"""
+    path = str(tmp_path / "conversations.db")
+
+    async def run():
+        first, second = ConversationStore(path), ConversationStore(path)
+        try:
+            a = await first.get("s", 1)
+            b = await second.get("s", 1)  # both hold the empty hot copy
+            await first.append(a, turn("user", "one"), turn("assistant", "1"))
+            await second.append(b, turn("user", "two"), turn("assistant", "2"))
+            a = await first.get("s", 1)  # stale hot copy must be refreshed
+            return [t["content"] for t in a.turns]
+        finally:
+            await first.aclose()
+            await second.aclose()
+
+    assert asyncio.run(run()) == ["one", "1", "two", "2"]
+
+
+def test_session_of_another_bot_is_not_reused(tmp_path):
+    async def run():
+        store = ConversationStore(str(tmp_path / "conversations.db"))
+        try:
+            conversation = await store.get("s", 1)
+            await store.append(conversation, turn("user", "secret"))
+            return await store.get("s", 2)
+        finally:
+            await store.aclose()
+
+    other = asyncio.run(run())
+    assert other.session_id != "s"
+    assert other.turns == []
+
+
+def test_compaction_does_not_hold_the_session_lock_during_the_llm_call(tmp_path):
+    llm = LLMGateway([FakeProvider(latency=0.3, reply="summary")])
+
+    async def run():
+        store = ConversationStore(str(tmp_path / "conversations.db"), token_budget=100)
+        try:
+            conversation = await store.get("s", 1)
+            for n in range(20):
+                conversation = await store.append(conversation, turn("user", f"message {n} " * 10))
+            compaction = asyncio.create_task(store.compact(llm, conversation))
+            await asyncio.sleep(0.05)  # compaction is now waiting on the LLM
+            started = time.perf_counter()
+            async with store.lock("s"):
+                waited = time.perf_counter() - started
+                await store.append(conversation, turn("user", "during compaction"))
+            await compaction
+            return waited, await store.get("s", 1)
+        finally:
+            await store.aclose()
+
+    waited, conversation = asyncio.run(run())
+    assert waited < 0.1
+    assert conversation.summary == "summary"
+    assert conversation.turns[-1]["content"] == "during compaction"
+
+
+class FailingCommit:
+    """Wraps a sqlite3 connection so every COMMIT fails"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *args):
+        if sql == "COMMIT":
+            raise sqlite3.OperationalError("disk I/O error")
+        return self.conn.execute(sql, *args)
+
+    def close(self):
+        self.conn.close()
+
+
+def test_failed_write_leaves_the_hot_copy_untouched(tmp_path):
+    async def run():
+        store = ConversationStore(str(tmp_path / "conversations.db"))
+        try:
+            conversation = await store.append(await store.get("s", 1), turn("user", "one"))
+            store._conn = FailingCommit(store._conn)
+            with pytest.raises(sqlite3.OperationalError):
+                await store.append(conversation, turn("user", "two"))
+            store._conn = store._conn.conn
+            return conversation, await store.get("s", 1)
+        finally:
+            await store.aclose()
+
+    before, after = asyncio.run(run())
+    assert [t["content"] for t in before.turns] == ["one"]
+    assert before.version == after.version == 1
+    assert after is before  # still current, so the hot copy is reused
+
+
+def test_session_lock_outlives_eviction_from_the_hot_tier(tmp_path):
+    async def run():
+        store = ConversationStore(str(tmp_path / "conversations.db"), hot_capacity=1)
+        try:
+            await store.get("a", 1)
+            async with store.lock("a"):
+                await store.get("b", 1)  # evicts "a" from the hot tier
+                return store.lock("a").locked()
+        finally:
+            await store.aclose()
+
+    assert asyncio.run(run())
+
+
+def test_idle_sessions_are_deleted_after_the_retention_period(tmp_path):
+    async def run():
+        store = ConversationStore(str(tmp_path / "conversations.db"), retention_seconds=60, prune_interval=0)
+        try:
+            await store.append(await store.get("old", 1), turn("user", "hi"))
+            store._conn.execute("UPDATE conversations SET updated_at = updated_at - 120 WHERE session_id = 'old'")
+            await store.append(await store.get("new", 1), turn("user", "hi"))
+            return (await store.get("old", 1)).turns, (await store.get("new", 1)).turns
+        finally:
+            await store.aclose()
+
+    old, new = asyncio.run(run())
+    assert old == []
+    assert len(new) == 1
+
+
+def test_conversation_store_benchmark(tmp_path):
+    """get + build_messages + append per chat turn, over many sessions"""
+    sessions, turns = 200, 10
+
+    async def run() -> float:
+        store = ConversationStore(str(tmp_path / "conversations.db"), hot_capacity=sessions)
+        try:
+            started = time.perf_counter()
+            for n in range(turns):
+                for session in range(sessions):
+                    conversation = await store.get(f"s{session}", 1)
+                    store.build_messages(SYSTEM, conversation, f"question {n}")
+                    await store.append(conversation, turn("user", f"question {n}"), turn("assistant", f"answer {n}"))
+            return (time.perf_counter() - started) / (sessions * turns)
+        finally:
+            await store.aclose()
+
+    seconds = asyncio.run(run())
+    report("conversation turn (get+build+append)", seconds, "turn")
+    assert seconds < 0.01
@@ -0,0 +1,114 @@
+import base64
+import io
+import re
+import zlib
+
+from fastapi.testclient import TestClient
+from pptx import Presentation
+
+from app.engines.documents import Heading, ListBlock, Paragraph, inline_markup, parse_document
+from app.engines.rendering import render_export
+from app.main import app
+
+PLAN = """# Acme Business Plan
+
+## 1. EXECUTIVE SUMMARY
+
+R&D spend stays < 5% of revenue & margins > 20%.
+
+- A <b>literal</b> tag & an ampersand
+- **Bold** and *italic* still work
+
+## 2. MARKET ANALYSIS
+
+Tom & Jerry's <market> is large.
+"""
+
+DECK = """SLIDE 1: Problem & <Opportunity>
+- Costs < revenue & growing
+
+SLIDE 2: Solution
+Plain text with a stray < sign
+"""
+
+
+def pdf_text(data: bytes) -> str:
+    """Text drawn on the pages of a ReportLab PDF, one line per text object"""
+    lines = []
+    for match in re.finditer(rb"stream\r?\n(.*?)endstream", data, re.S):
+        content = zlib.decompress(base64.a85decode(match.group(1).strip(), adobe=True))
+        for text in re.findall(rb"BT(.*?)ET", content, re.S):
+            parts = re.findall(rb"\(((?:\\.|[^\\)])*)\) Tj", text)
+            if parts:
+                lines.append(re.sub(rb"\\(.)", rb"\1", b"".join(parts)).decode("latin-1"))
+    return "\n".join(lines)
+
+
+def pptx_text(data: bytes) -> str:
+    presentation = Presentation(io.BytesIO(data))
+    return "\n".join(
+        shape.text_frame.text
+        for slide in presentation.slides
+        for shape in slide.shapes
+        if shape.has_text_frame
+    )
+
+
+def test_inline_markup_escapes_before_styling():
+    assert inline_markup("A <b>x</b> & **y**") == "A &lt;b&gt;x&lt;/b&gt; &amp; <b>y</b>"
+    assert inline_markup("Tom & *Jerry*") == "Tom &amp; <i>Jerry</i>"
+
+
+def test_plan_is_parsed_into_sections():
+    document = parse_document("business_plan", "Acme", PLAN)
+    assert [section.title for section in document.sections] == ["1. EXECUTIVE SUMMARY", "2. MARKET ANALYSIS"]
+    summary = document.sections[0].blocks
+    assert summary[0] == Paragraph("R&D spend stays < 5% of revenue & margins > 20%.")
+    assert summary[1] == ListBlock(("A <b>literal</b> tag & an ampersand", "**Bold** and *italic* still work"))
+    deck = parse_document("pitch_deck", "Acme", DECK)
+    assert [section.title for section in deck.sections] == ["Problem & <Opportunity>", "Solution"]
+    assert not any(isinstance(block, Heading) for section in deck.sections for block in section.blocks)
+
+
+def test_pdf_keeps_angle_brackets_and_ampersands(tmp_path):
+    path = str(tmp_path / "plan.pdf")
+    assert render_export("business_plan", "R&D <Plan>", PLAN, "pdf", path) > 0
+    text = pdf_text(open(path, "rb").read())
+    assert "R&D <Plan>" in text
+    assert "R&D spend stays < 5% of revenue & margins > 20%." in text
+    assert "A <b>literal</b> tag & an ampersand" in text
+    assert "Tom & Jerry's <market> is large." in text
+    assert "**" not in text
+
+
+def test_pptx_keeps_angle_brackets_and_ampersands(tmp_path):
+    path = str(tmp_path / "deck.pptx")
+    render_export("pitch_deck", "Acme & Co", DECK, "pptx", path)
+    text = pptx_text(open(path, "rb").read())
+    assert "Acme & Co" in text
+    assert "Problem & <Opportunity>" in text
+    assert "Costs < revenue & growing" in text
+    assert "Plain text with a stray < sign" in text
+
+
+def test_export_endpoint_renders_and_caches(tmp_path):
+    with TestClient(app) as client:
+        app.state.exports.directory = str(tmp_path)
+        request = {"kind": "pitch_deck", "title": "Acme <Deck> & Co", "content": DECK, "format": "pdf"}
+        first = client.post("/api/tools/export-document", json=request)
+        second = client.post("/api/tools/export-document", json=request)
+        pptx = client.post("/api/tools/export-document", json={**request, "format": "pptx"})
+        plan_pptx = client.post(
+            "/api/tools/export-document",
+            json={"kind": "business_plan", "title": "Acme", "content": PLAN, "format": "pptx"},
+        )
+
+    assert first.status_code == 200 and first.headers["content-type"] == "application/pdf"
+    assert first.headers["x-export-cache"] == "miss" and second.headers["x-export-cache"] == "hit"
+    assert first.headers["etag"] == second.headers["etag"] and first.content == second.content
+    assert 'filename="acme-deck-co.pdf"' in first.headers["content-disposition"]
+    assert "Problem & <Opportunity>" in pdf_text(first.content)
+
+    assert pptx.status_code == 200
+    assert "Costs < revenue & growing" in pptx_text(pptx.content)
+    assert plan_pptx.status_code == 400
@@ -0,0 +1,84 @@
+import asyncio
+import socket
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import jobs
+from app.core.identity import sign_user_token
+from app.core.jobs import CallbackURLError, JobQueue, check_callback_url
+from app.main import app
+from tests.helpers import create_user
+
+PUBLIC = "93.184.215.14"
+RESEARCH = {"industry": "coffee", "target_market": "students", "geography": "Pune", "research_focus": "trends"}
+
+
+@pytest.mark.parametrize("url", [
+    "http://hooks.example.com/done",  # not https
+    "https://127.0.0.1/done",
+    "https://10.0.0.5/done",
+    "https://169.254.169.254/latest/meta-data",
+    "https://[::1]/done",
+    "https://localhost/done",
+])
+def test_internal_callback_urls_are_rejected(url):
+    with pytest.raises(CallbackURLError):
+        asyncio.run(check_callback_url(url))
+
+
+def test_delivery_connects_to_the_checked_address(monkeypatch):
+    """A host that rebinds to 127.0.0.1 after the check is never looked up again"""
+    answers = iter([PUBLIC, "127.0.0.1", "127.0.0.1"])
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (next(answers), port))]
+
+    monkeypatch.setattr(socket, "getaddrinfo", getaddrinfo)
+    sent = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(request)
+        return httpx.Response(204)
+
+    async def run():
+        queue = JobQueue(None, None, None)
+        queue._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            await queue._deliver("https://hooks.example.com:8443/done", {"job_id": "j"})
+        finally:
+            await queue._http.aclose()
+
+    asyncio.run(run())
+    assert len(sent) == 1
+    assert sent[0].url.host == PUBLIC
+    assert sent[0].headers["host"] == "hooks.example.com:8443"
+    assert sent[0].extensions["sni_hostname"] == "hooks.example.com"
+
+
+def test_jobs_need_a_verified_user_and_a_safe_callback():
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        job = {"tool": "market_research", "payload": RESEARCH}
+        assert client.post("/api/jobs", json=job).status_code == 401
+        response = client.post("/api/jobs", json={**job, "callback_url": "https://127.0.0.1/x"}, headers=headers)
+        assert response.status_code == 400
+
+
+def test_jobs_are_only_visible_to_their_owner():
+    with TestClient(app) as client:
+        owner = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        other = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        job_id = client.post("/api/jobs", json={"tool": "market_research", "payload": RESEARCH},
+                             headers=owner).json()["job_id"]
+        status = client.get(f"/api/jobs/{job_id}", headers=owner)
+        for _ in range(50):
+            if status.json()["status"] not in jobs.ACTIVE_STATUSES:
+                break
+            time.sleep(0.05)
+            status = client.get(f"/api/jobs/{job_id}", headers=owner)
+        assert status.json()["status"] == "succeeded"
+        assert client.get(f"/api/jobs/{job_id}", headers=other).status_code == 404
+        assert client.get(f"/api/jobs/{job_id}").status_code == 404
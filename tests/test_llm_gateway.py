@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.identity import sign_user_token
+from app.core.llm import LLMGateway
+from app.core.providers import OpenAIProvider
+from app.core.resilience import UpstreamError, UpstreamRejected
+from tests.helpers import report
+from tests.stub_openai import StubOpenAI
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+@pytest.fixture(scope="module")
+def stub():
+    with StubOpenAI(latency=0.02) as server:
+        yield server
+
+
+def gateway(stub: StubOpenAI, max_connections: int = 10, **options) -> LLMGateway:
+    http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=max_connections,
+                                                        max_keepalive_connections=max_connections))
+    return LLMGateway([OpenAIProvider(api_key="test", base_url=stub.base_url, http_client=http_client)], **options)
+
+
+def test_completion_through_stub_server(stub):
+    async def run():
+        llm = gateway(stub)
+        try:
+            return await llm.chat("gpt-3.5-turbo", MESSAGES, tool="test")
+        finally:
+            await llm.aclose()
+
+    response = asyncio.run(run())
+    assert response.choices[0].message.content == "stub reply"
+    assert response.usage.prompt_tokens == 10
+
+
+def test_stream_through_stub_server(stub):
+    finished = []
+
+    async def run():
+        llm = gateway(stub)
+        try:
+            return "".join([delta async for delta in llm.stream_chat("gpt-3.5-turbo", MESSAGES, on_finish=finished.append)])
+        finally:
+            await llm.aclose()
+
+    assert asyncio.run(run()).strip() == "stub reply"
+    assert finished == ["stop"]
+
+
+@pytest.mark.parametrize("status, error", [(401, UpstreamError), (403, UpstreamError), (422, UpstreamRejected)])
+def test_sdk_status_errors_become_upstream_errors(status, error):
+    async def run():
+        llm = gateway(server)
+        try:
+            await llm.chat("gpt-3.5-turbo", MESSAGES)
+        finally:
+            await llm.aclose()
+
+    with StubOpenAI(status=status) as server:
+        with pytest.raises(error):
+            asyncio.run(run())
+
+
+def test_mid_stream_failure_is_mapped_and_counted():
+    async def run():
+        llm = gateway(server)
+        deltas = []
+        try:
+            with pytest.raises(UpstreamError):
+                async for delta in llm.stream_chat("gpt-3.5-turbo", MESSAGES):
+                    deltas.append(delta)
+            return deltas, llm.providers[0].breaker.failures
+        finally:
+            await llm.aclose()
+
+    with StubOpenAI(stream_error=True) as server:
+        deltas, failures = asyncio.run(run())
+    assert deltas == ["stub "]
+    assert failures == 1
+
+
+def test_connections_are_reused_under_load(stub):
+    """200 calls share the pool's keep-alive connections; reports p50/p99 latency"""
+    calls, pool = 200, 10
+    latencies = []
+
+    async def one(llm: LLMGateway):
+        started = time.perf_counter()
+        await llm.chat("gpt-3.5-turbo", MESSAGES)
+        latencies.append(time.perf_counter() - started)
+
+    async def run():
+        llm = gateway(stub, max_connections=pool)
+        try:
+            await asyncio.gather(*(one(llm) for _ in range(calls)))
+        finally:
+            await llm.aclose()
+
+    stub.connections.clear()
+    asyncio.run(run())
+    latencies.sort()
+    report("gateway p50 incl. pool queueing", latencies[len(latencies) // 2])
+    report("gateway p99 incl. pool queueing", latencies[int(len(latencies) * 0.99)])
+    print(f"{calls} calls over {len(stub.connections)} connections")
+    assert len(latencies) == calls
+    assert len(stub.connections) <= pool
+
+
+def test_global_concurrency_limit(stub):
+    async def run():
+        llm = gateway(stub, max_connections=50, global_concurrency=4)
+        try:
+            await asyncio.gather(*(llm.chat("gpt-3.5-turbo", MESSAGES) for _ in range(40)))
+        finally:
+            await llm.aclose()
+
+    stub.max_in_flight = 0
+    asyncio.run(run())
+    assert stub.max_in_flight <= 4
+
+
+def test_tool_routers_share_the_app_gateway():
+    from app.main import app
+
+    events = []
+    with TestClient(app) as client:
+        app.state.llm.add_listener(events.append)
+        response = client.post(
+            "/api/tools/analyze-time-usage",
+            json={"typical_work_hours": "9-5", "main_responsibilities": ["sales"],
+                  "common_distractions": ["email"], "goals": "ship"},
+            headers={"X-User-Token": sign_user_token(1)},
+        )
+    assert response.status_code == 200
+    assert [event.tool for event in events] == ["time_management"]
@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.core.identity import sign_user_token
+from app.main import app
+from tests.helpers import create_user, report
+
+SDK_SECONDS = 0.3  # a slow Razorpay round trip
+TASKS = {"tasks": [{"title": f"task {n}", "deadline": "2030-01-01", "estimated_hours": 2} for n in range(20)]}
+
+
+class SlowOrders:
+    """Stands in for razorpay.Client.order: blocks its thread like the real SDK"""
+
+    def create(self, data: dict) -> dict:
+        time.sleep(SDK_SECONDS)
+        return {"id": "order_test", "amount": data["amount"], "currency": data["currency"]}
+
+
+async def tool_latencies(client: httpx.AsyncClient, headers: dict, count: int) -> list:
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await client.post("/api/tools/prioritize-tasks", json=TASKS, headers=headers)
+        assert response.status_code == 200
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def test_tool_latency_holds_during_checkout_burst():
+    """16 blocking checkouts in flight must not stall tool requests on the same worker"""
+    with TestClient(app) as test_client:
+        headers = {"X-User-Token": sign_user_token(create_user(test_client, "enterprise"))}
+        app.state.payments.razorpay.order = SlowOrders()
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                baseline = await tool_latencies(client, headers, 20)
+                checkouts = [
+                    asyncio.create_task(client.post("/api/payment/create-order-razorpay", json={"amount": 499}))
+                    for _ in range(16)
+                ]
+                await asyncio.sleep(0.05)  # let the burst reach the payment pool
+                during = await tool_latencies(client, headers, 20)
+                responses = await asyncio.gather(*checkouts)
+            return baseline, during, responses
+
+        baseline, during, responses = test_client.portal.call(run)
+
+    assert all(response.status_code == 200 for response in responses)
+    report("tool latency, idle p50", sorted(baseline)[10])
+    report("tool latency, checkout burst p50", sorted(during)[10])
+    report("tool latency, checkout burst max", max(during))
+    # Had the SDK calls run on the event loop, each tool call would wait out several of them
+    assert max(during) < SDK_SECONDS
@@ -0,0 +1,118 @@
+import re
+import zlib
+
+from fastapi.testclient import TestClient
+
+from app.ai_tools.business_plan import PLAN_SECTION_PROMPTS, PLAN_SECTIONS, BusinessPlanRequest, _prompt_fields
+from app.core.identity import sign_user_token
+from app.core.llm import LLMGateway
+from app.core.providers import FakeProvider
+from app.core.resilience import UpstreamError
+from app.main import app
+from tests.helpers import create_user
+
+PLAN = {
+    "business_name": "Acme",
+    "industry": "Fintech",
+    "description": "Automated bookkeeping",
+    "target_market": "SMEs",
+    "revenue_model": "Subscription",
+    "funding_needed": "₹2 crore",
+}
+LATENCY = 0.1
+_SECTION = re.compile(r'Write the "(.+?)" section')
+
+
+class SectionWriter(FakeProvider):
+    """Answers each section prompt with its own heading, recording the prompts; fails the sections in `fail`
+
+    The text depends on the whole prompt, as a model's would, so edits upstream change what dependents see.
+    """
+
+    def __init__(self, fail=(), **options):
+        super().__init__(latency=LATENCY, **options)
+        self.prompts = {}
+        self.fail = set(fail)
+
+    def _content(self, messages: list) -> str:
+        title = _SECTION.search(messages[-1]["content"]).group(1)
+        self.prompts[title] = messages[-1]["content"]
+        if title in self.fail:
+            raise UpstreamError(self.name, "injected failure")
+        return f"## {title}\n\nText for {title} ({zlib.crc32(messages[-1]['content'].encode()):08x})."
+
+
+def test_sections_declare_the_fields_their_prompts_read():
+    base = BusinessPlanRequest(**PLAN)
+    numbers = set()
+    for spec in PLAN_SECTIONS:
+        assert set(spec.depends_on) <= numbers  # dependencies come first
+        numbers.add(spec.number)
+        prompt = PLAN_SECTION_PROMPTS[spec.number]
+        for field in PLAN:
+            edited = base.model_copy(update={field: "edited"})
+            changed = prompt.render(**_prompt_fields(edited), context="").messages != \
+                prompt.render(**_prompt_fields(base), context="").messages
+            assert changed == (field in spec.fields), (spec.number, field)
+
+
+def generate(client, headers, provider, plan=PLAN, **extra_headers):
+    app.state.llm = LLMGateway([provider])
+    return client.post("/api/tools/generate-business-plan-sections", json=plan, headers={**headers, **extra_headers})
+
+
+def test_sections_run_along_their_dependency_graph():
+    writer = SectionWriter()
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        response = generate(client, headers, writer)
+
+    assert response.status_code == 200
+    body = response.json()
+    sections = {s["number"]: s for s in body["sections"]}
+    assert body["regenerated"] == list(range(1, 9))
+    assert body["business_plan"].startswith("## Executive Summary")
+
+    for spec in PLAN_SECTIONS:
+        prompt = writer.prompts[spec.title]
+        for other in PLAN_SECTIONS:
+            assert (f"Text for {other.title} (" in prompt) == (other.number in spec.depends_on)
+        for dependency in spec.depends_on:
+            done = sections[dependency]["started_ms"] + sections[dependency]["latency_ms"]
+            assert sections[spec.number]["started_ms"] >= done - 5
+    # Independent sections overlap: the critical path 3 -> 5 -> 6 -> 7 is four calls, not eight
+    assert body["elapsed_ms"] < 6.5 * LATENCY * 1000
+
+
+def test_editing_a_field_only_regenerates_what_reads_it():
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        first = generate(client, headers, SectionWriter()).json()
+        repeat = generate(client, headers, SectionWriter()).json()
+        funding = generate(client, headers, SectionWriter(), {**PLAN, "funding_needed": "₹5 crore"}).json()
+        market = generate(client, headers, SectionWriter(), {**PLAN, "target_market": "Freelancers"}).json()
+        bypass = generate(client, headers, SectionWriter(), **{"X-Cache-Bypass": "1"}).json()
+
+    assert first["tokens"]["spent"] == first["tokens"]["full_regeneration"] - first["tokens"]["saved"] > 0
+    assert repeat["regenerated"] == [] and repeat["tokens"]["spent"] == 0
+    assert repeat["tokens"]["saved"] == repeat["tokens"]["full_regeneration"]
+    assert funding["regenerated"] == [7]
+    # 1, 3, 5 and 6 read target_market; 7 and 8 depend on 3 or 6
+    assert market["regenerated"] == [1, 3, 5, 6, 7, 8]
+    assert 0 < market["tokens"]["spent"] < first["tokens"]["spent"]
+    assert bypass["regenerated"] == list(range(1, 9))
+    print(f"tokens spent: full {first['tokens']['spent']}, funding edit {funding['tokens']['spent']}, "
+          f"target market edit {market['tokens']['spent']} (single-call plan {first['tokens']['full_regeneration']})")
+
+
+def test_a_failed_section_keeps_the_others_cached():
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        plan = {**PLAN, "business_name": "Retry Co"}
+        # Section 7 ends the critical path, so every other section has finished when it fails
+        failed = generate(client, headers, SectionWriter(fail={"Financial Projections (5 years)"}), plan)
+        retry = generate(client, headers, SectionWriter(), plan)
+
+    assert failed.status_code >= 500
+    assert retry.status_code == 200
+    assert retry.json()["regenerated"] == [7]
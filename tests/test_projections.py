@@ -0,0 +1,124 @@
+import numpy as np
+from fastapi.testclient import TestClient
+
+from app.ai_tools.financial_forecast import MAX_SWEEP_CELLS
+from app.core.identity import sign_user_token
+from app.engines.projections import PERCENTILES, break_even_months, monte_carlo, project
+from app.main import app
+from tests.helpers import bench, create_user, report
+
+BASE = {"initial_investment": 500_000, "monthly_revenue_month1": 20_000, "monthly_costs": 60_000}
+
+
+def loop_forecast(revenue_month1, monthly_costs, growth_rate, months, cost_inflation=2.0, churn_rate=0.0):
+    """The per-month loop the engine replaced, as a reference"""
+    rows, cumulative_revenue, cumulative_profit = [], 0.0, 0.0
+    for month in range(months):
+        revenue = revenue_month1 * ((1 + growth_rate / 100) * (1 - churn_rate / 100)) ** month
+        costs = monthly_costs * (1 + cost_inflation / 100) ** month
+        cumulative_revenue += revenue
+        cumulative_profit += revenue - costs
+        rows.append((revenue, costs, cumulative_revenue, cumulative_profit))
+    return rows
+
+
+def test_projection_matches_the_monthly_loop():
+    series = project(20_000, 60_000, 12.5, 36, cost_inflation=1.5, churn_rate=2.0)
+    expected = np.array(loop_forecast(20_000, 60_000, 12.5, 36, 1.5, 2.0))
+    np.testing.assert_allclose(series["revenue"], expected[:, 0])
+    np.testing.assert_allclose(series["costs"], expected[:, 1])
+    np.testing.assert_allclose(series["cumulative_revenue"], expected[:, 2])
+    np.testing.assert_allclose(series["cumulative_profit"], expected[:, 3])
+
+
+def test_break_even_matches_a_linear_scan():
+    growth = np.linspace(-5, 30, 71)
+    series = project(20_000, 60_000, growth, 60)
+    found = break_even_months(series["cumulative_profit"], 500_000)
+    for rate, month in zip(growth, found):
+        rows = loop_forecast(20_000, 60_000, rate, 60)
+        expected = next((n + 1 for n, row in enumerate(rows) if row[3] > 500_000), 0)
+        assert month == expected
+    assert 0 in found and found.max() > 0
+
+
+def test_monte_carlo_is_seeded_and_ordered():
+    args = (20_000, 60_000, 500_000, 10.0, 4.0, 48, 2000)
+    first, second = monte_carlo(*args, seed=7), monte_carlo(*args, seed=7)
+    assert first == second
+    assert monte_carlo(*args, seed=8) != first
+
+    for bands in (first["revenue_percentiles"], first["cumulative_profit_percentiles"]):
+        assert list(bands) == [f"p{p}" for p in PERCENTILES]
+        columns = np.array(list(bands.values()))
+        assert columns.shape == (len(PERCENTILES), 48)
+        assert (np.diff(columns, axis=0) >= 0).all()
+    assert 0 < first["break_even_probability"] <= 1
+    months = list(first["break_even_month_percentiles"].values())
+    assert months == sorted(months)
+
+
+def test_monte_carlo_without_volatility_is_the_projection():
+    result = monte_carlo(20_000, 60_000, 500_000, 10.0, 0.0, 24, 50, cost_inflation=1.0, churn_rate=1.0, seed=1)
+    series = project(20_000, 60_000, 10.0, 24, cost_inflation=1.0, churn_rate=1.0)
+    for p in PERCENTILES:
+        np.testing.assert_allclose(result["cumulative_profit_percentiles"][f"p{p}"], np.round(series["cumulative_profit"], 2))
+
+
+def test_projection_benchmark():
+    growth, inflation, churn = np.meshgrid(np.linspace(0, 20, 100), np.linspace(0, 5, 20), np.linspace(0, 5, 10), indexing="ij")
+    sweep = bench(lambda: project(20_000, 60_000, growth.ravel(), 120, inflation.ravel(), churn.ravel()), 5)
+    simulate = bench(lambda: monte_carlo(20_000, 60_000, 500_000, 10.0, 4.0, 120, 10_000, seed=1), 5)
+    report("project (20000 scenarios, 120 months)", sweep)
+    report("monte_carlo (10000 paths, 120 months)", simulate)
+    assert sweep < 1.0 and simulate < 1.0
+
+
+def test_forecast_endpoints():
+    sweep = {**BASE, "forecast_months": 60, "growth_rates": [0, 5, 10, 20], "cost_inflations": [1, 2], "churn_rates": [0, 3]}
+    simulation = {**BASE, "forecast_months": 60, "growth_rate": 10, "growth_volatility": 4, "paths": 1000, "seed": 3}
+    forecast = {
+        **BASE,
+        "business_name": "Acme",
+        "industry": "SaaS",
+        "growth_rate": 10,
+        "forecast_months": 60,
+        "include_analysis": False,
+    }
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        swept = client.post("/api/tools/financial-forecast/scenarios", json=sweep, headers=headers)
+        simulated = [client.post("/api/tools/financial-forecast/monte-carlo", json=simulation, headers=headers) for _ in range(2)]
+        single = client.post("/api/tools/financial-forecast", json=forecast, headers=headers)
+
+    assert swept.status_code == 200
+    scenarios = swept.json()["scenarios"]
+    assert len(scenarios) == swept.json()["scenario_count"] == 16
+    match = next(s for s in scenarios if (s["growth_rate"], s["cost_inflation"], s["churn_rate"]) == (10, 2, 0))
+    assert single.status_code == 200
+    assert single.json()["analysis"] is None
+    assert match["break_even_month"] == single.json()["summary"]["break_even_month"]
+    assert match["total_profit_forecast"] == single.json()["summary"]["total_profit_forecast"]
+
+    assert all(response.status_code == 200 for response in simulated)
+    assert simulated[0].json() == simulated[1].json()
+
+
+def test_oversized_sweeps_are_rejected():
+    months = 600
+    rates = list(range(100))
+    assert len(rates) ** 2 * months > MAX_SWEEP_CELLS
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        swept = client.post(
+            "/api/tools/financial-forecast/scenarios",
+            json={**BASE, "forecast_months": months, "growth_rates": rates, "cost_inflations": rates},
+            headers=headers,
+        )
+        simulated = client.post(
+            "/api/tools/financial-forecast/monte-carlo",
+            json={**BASE, "forecast_months": months, "growth_rate": 10, "growth_volatility": 4, "paths": 100_000},
+            headers=headers,
+        )
+    assert swept.status_code == 400 and "too large" in swept.json()["detail"]
+    assert simulated.status_code == 400 and "too large" in simulated.json()["detail"]
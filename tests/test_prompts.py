@@ -0,0 +1,75 @@
+import string
+
+import pytest
+
+import app.main  # noqa: F401  registers every tool's prompt
+from app.core.prompts import PROMPTS, PromptError, PromptTemplate, PromptTooLarge, count_tokens
+from tests.helpers import bench, report
+
+FIELD_TEXT = "A bootstrapped B2B SaaS for independent clinics, selling scheduling and billing. " * 3
+
+
+def sample_values(template: PromptTemplate) -> dict:
+    """A plausible value for every field: numbers where the template formats one, text elsewhere"""
+    values = {}
+    for text in (template.system, template.user):
+        for _, field, spec, _ in string.Formatter().parse(text):
+            if field:
+                values[field] = 12345.5 if spec else FIELD_TEXT
+    return values
+
+
+def test_every_tool_prompt_is_registered():
+    expected = {
+        "business_plan", "market_research", "content_generator", "support_ticket_analysis",
+        "support_response", "support_triage", "financial_forecast", "time_usage",
+        "calendar_commentary", "task_narration", "chatbot_sample_response",
+    }
+    assert expected <= PROMPTS.keys()
+
+
+@pytest.mark.parametrize("name", sorted(PROMPTS))
+def test_prompt_renders_within_budget(name):
+    template = PROMPTS[name]
+    prompt = template.render(**sample_values(template))
+    assert prompt.prompt_tokens > 0
+    assert template.min_completion_tokens <= prompt.max_tokens <= template.max_tokens
+
+
+def test_missing_fields_are_rejected():
+    with pytest.raises(PromptError, match="missing fields"):
+        PROMPTS["support_response"].render()
+
+
+def test_oversized_input_is_rejected_before_any_call():
+    template = PROMPTS["support_response"]
+    with pytest.raises(PromptTooLarge):
+        template.render(message="word " * (template.max_input_tokens * 2))
+
+
+def test_max_tokens_shrinks_to_fit_the_context_window():
+    template = PromptTemplate("t", "gpt-4", "system", "{text}", max_tokens=4000)
+    small = template.render(text="short")
+    large = template.render(text="word " * 6000)
+    assert small.max_tokens == 4000
+    assert large.max_tokens == 8192 - large.prompt_tokens
+
+
+def test_render_and_count_microbenchmark():
+    """Render + token count per request, for every registered prompt"""
+    worst = 0.0
+    for name in sorted(PROMPTS):
+        template = PROMPTS[name]
+        values = sample_values(template)
+        seconds = bench(lambda: template.render(**values), 200)
+        report(f"render+count {name}", seconds)
+        worst = max(worst, seconds)
+    # Far below an LLM round trip; catches an accidental re-parse or tokenizer reload per call
+    assert worst < 0.005
+
+
+def test_count_tokens_microbenchmark():
+    text = FIELD_TEXT * 40
+    seconds = bench(lambda: count_tokens(text), 500)
+    report(f"count_tokens {len(text)} chars", seconds)
+    assert seconds < 0.005
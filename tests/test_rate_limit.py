@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+from fastapi.testclient import TestClient
+
+from app.core.identity import current_client, sign_user_token, verify_user_token
+from app.core.prompts import PROMPTS
+from app.core.rate_limit import (
+    FIXED_COSTS,
+    JOBS_PATH,
+    TIER_BUDGETS,
+    TIER_CREDIT_QUOTAS,
+    TOOL_PROMPTS,
+    MemoryBucketStore,
+    SQLiteBucketStore,
+    tool_cost,
+    tool_route,
+)
+from app.main import app
+from tests.helpers import bench, create_user, report
+
+SECRET = b"k"
+TASKS = {"tasks": [{"title": "a"}]}
+FREE = TIER_BUDGETS["free"]
+
+
+def test_tokens_verify_only_when_signed_and_unexpired():
+    token = sign_user_token(7, secret=SECRET)
+    assert verify_user_token(token, secret=SECRET) == 7
+    assert verify_user_token(token, secret=b"other") is None
+    assert verify_user_token("8" + token[1:], secret=SECRET) is None
+    assert verify_user_token(sign_user_token(7, ttl=-1, secret=SECRET), secret=SECRET) is None
+    assert verify_user_token("7", secret=SECRET) is None
+
+
+def test_every_tool_route_is_costed():
+    routes = {
+        tool_route(path.replace("{config_id}", "1"))
+        for path, methods in app.openapi()["paths"].items()
+        if methods.keys() & {"post", "put"} and tool_route(path)
+    }
+    assert routes == TOOL_PROMPTS.keys() | FIXED_COSTS.keys() | {JOBS_PATH}
+    assert tool_route("/api/tools/chatbot-config/42") == "/api/tools/chatbot-config/{id}"
+    assert tool_route("/api/payment/webhook/stripe") is None
+
+
+def test_costs_follow_the_prompt_registry():
+    for route, names in TOOL_PROMPTS.items():
+        assert all(name.endswith("*") or name in PROMPTS for name in names), route
+    assert tool_cost("/api/tools/market-research") == PROMPTS["market_research"].max_tokens
+    sections = sum(p.max_tokens for name, p in PROMPTS.items() if name.startswith("business_plan_part_"))
+    assert tool_cost("/api/tools/generate-business-plan-sections") == sections
+    assert tool_cost(JOBS_PATH) == max(map(tool_cost, TOOL_PROMPTS))
+    assert all(0 < tool_cost(route) <= FREE[0] for route in TOOL_PROMPTS)
+
+
+def test_cpu_heavy_forecasts_are_throttled():
+    body = {"monthly_revenue_month1": 1000, "monthly_costs": 500, "initial_investment": 10000,
+            "growth_rate": 0.05, "growth_volatility": 0.1, "forecast_months": 12, "paths": 100}
+    allowed = int(FREE[0] // tool_cost("/api/tools/financial-forecast/monte-carlo"))
+    with TestClient(app) as client:
+        codes = [client.post("/api/tools/financial-forecast/monte-carlo", json=body).status_code
+                 for _ in range(allowed + 1)]
+    assert codes[allowed] == 429
+
+
+def test_memory_buckets_stay_bounded():
+    store = MemoryBucketStore(max_keys=1000)
+
+    async def run():
+        for n in range(5000):
+            await store.take(f"ip:{n}", 1, *FREE)
+
+    asyncio.run(run())
+    assert len(store._buckets) <= 1000
+
+
+def test_unverified_callers_share_their_ip_bucket():
+    """A forged X-User-Id or bad token does not buy a fresh bucket"""
+    with TestClient(app) as client:
+        allowed = int(FREE[0] // tool_cost("/api/tools/prioritize-tasks"))
+        codes = [
+            client.post("/api/tools/prioritize-tasks", json=TASKS,
+                        headers={"X-User-Id": str(n), "X-User-Token": f"{n}.9999999999.forged"}).status_code
+            for n in range(allowed + 1)
+        ]
+    assert codes[:allowed] == [200] * allowed
+    assert codes[allowed] == 429
+
+
+def test_credit_quota_applies_to_anonymous_callers():
+    with TestClient(app) as client:
+        token = current_client.set("ip:testclient")  # TestClient's address
+        try:
+            app.state.meter.record(None, "test", credits_used=TIER_CREDIT_QUOTAS["free"])
+        finally:
+            current_client.reset(token)
+        response = client.post("/api/tools/analyze-time-usage", json={})
+    assert response.status_code == 429
+    assert "quota" in response.json()["detail"]
+
+
+def test_signed_in_users_get_their_own_bucket():
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        codes = {client.post("/api/tools/prioritize-tasks", json=TASKS, headers=headers).status_code for _ in range(20)}
+    assert codes == {200}
+
+
+def test_bucket_store_benchmark(tmp_path):
+    memory = MemoryBucketStore()
+    sqlite = SQLiteBucketStore(str(tmp_path / "rate_limit.db"))
+    capacity, refill = TIER_BUDGETS["enterprise"]
+
+    async def takes(store, count: int) -> float:
+        started = time.perf_counter()
+        for n in range(count):
+            await store.take(f"user:{n % 500}:/api/tools/x", 100, capacity, refill)
+        return (time.perf_counter() - started) / count
+
+    memory_seconds = asyncio.run(takes(memory, 20000))
+    sqlite_seconds = asyncio.run(takes(sqlite, 2000))
+    asyncio.run(sqlite.aclose())
+    report("MemoryBucketStore.take", memory_seconds)
+    report("SQLiteBucketStore.take", sqlite_seconds)
+    assert memory_seconds < 1e-4
+    assert sqlite_seconds < 5e-3
+
+
+def test_token_verification_benchmark():
+    token = sign_user_token(7, secret=SECRET)
+    seconds = bench(lambda: verify_user_token(token, secret=SECRET), 20000)
+    report("verify_user_token", seconds)
+    assert seconds < 1e-4
@@ -0,0 +1,214 @@
+import asyncio
+
+import pytest
+import requests
+import stripe
+from fastapi.testclient import TestClient
+
+from app.core.llm import LLMGateway
+from app.core.providers import FakeProvider
+from app.core.resilience import (
+    CircuitBreaker,
+    CircuitOpen,
+    Upstream,
+    UpstreamError,
+    UpstreamRejected,
+    UpstreamTimeout,
+)
+from app.main import app
+from app.payment.service import PaymentService
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class Flaky:
+    """Fails the first `failures` calls with `error`, then returns "ok" """
+
+    def __init__(self, failures: int, error: Exception):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "ok"
+
+
+def upstream(**options) -> Upstream:
+    return Upstream("test", timeout=options.pop("timeout", 1.0), backoff_base=0, **options)
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.opened_at is not None
+    assert breaker.allow()  # cooldown over: the half-open trial
+    assert not breaker.allow()  # only one at a time
+    breaker.record_failure()
+    assert breaker.opened_at is not None
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_idempotent_calls_retry_transient_failures():
+    call = Flaky(2, UpstreamError("test", "injected"))
+    assert asyncio.run(upstream(retries=2).call(call, idempotent=True)) == "ok"
+    assert call.calls == 3
+
+
+def test_non_idempotent_calls_are_not_retried():
+    call = Flaky(1, UpstreamError("test", "injected"))
+    with pytest.raises(UpstreamError):
+        asyncio.run(upstream(retries=2).call(call))
+    assert call.calls == 1
+
+
+def test_rejected_requests_are_not_retried_and_do_not_trip_the_breaker():
+    policy = upstream(retries=2, breaker=CircuitBreaker(failure_threshold=1))
+    call = Flaky(1, UpstreamRejected("test", "bad input"))
+    with pytest.raises(UpstreamRejected):
+        asyncio.run(policy.call(call, idempotent=True))
+    assert call.calls == 1
+    assert policy.breaker.state == "closed"
+
+
+def test_hung_call_times_out():
+    async def hang():
+        await asyncio.sleep(10)
+
+    with pytest.raises(UpstreamTimeout):
+        asyncio.run(upstream(timeout=0.05).call(hang))
+
+
+def test_self_timed_calls_are_not_abandoned():
+    """With abandon_on_timeout=False the call's own timeout applies, so no thread is left running"""
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "done"
+
+    assert asyncio.run(upstream(timeout=0.01, abandon_on_timeout=False).call(slow)) == "done"
+
+
+def test_open_breaker_fails_fast():
+    policy = upstream(breaker=CircuitBreaker(failure_threshold=1, cooldown=60))
+    call = Flaky(10, UpstreamError("test", "down"))
+    with pytest.raises(UpstreamError):
+        asyncio.run(policy.call(call))
+    with pytest.raises(CircuitOpen) as raised:
+        asyncio.run(policy.call(call))
+    assert call.calls == 1
+    assert raised.value.retry_after > 0
+
+
+@pytest.mark.parametrize("fault", [{"error_rate": 1.0}, {"rate_limit_rate": 1.0}, {"latency": 1.0}])
+def test_gateway_fails_over_to_the_next_provider(fault):
+    primary = FakeProvider("primary", **{"latency": 0, **fault})
+    llm = LLMGateway([primary, FakeProvider("secondary", latency=0, reply="from secondary")])
+    response = asyncio.run(llm.chat("gpt-3.5-turbo", MESSAGES, timeout=0.05))
+    assert response.choices[0].message.content == "from secondary"
+    assert llm.failovers == 1
+
+
+def test_gateway_skips_a_provider_whose_breaker_is_open():
+    primary = FakeProvider("primary", latency=0, error_rate=1.0)
+    primary.breaker = CircuitBreaker(failure_threshold=3, cooldown=60)
+    llm = LLMGateway([primary, FakeProvider("secondary", latency=0)])
+
+    async def run():
+        for _ in range(10):
+            await llm.chat("gpt-3.5-turbo", MESSAGES)
+
+    asyncio.run(run())
+    assert primary.breaker.state == "open"
+    assert llm.failovers == 3  # later calls go straight to the secondary
+
+
+def test_gateway_falls_back_to_another_model():
+    primary = FakeProvider("primary", latency=0, error_rate=1.0, models={"gpt-4": "gpt-4"})
+    llm = LLMGateway([primary, FakeProvider("cheap", latency=0, models={"gpt-3.5-turbo": "gpt-3.5-turbo"})])
+    _, model = asyncio.run(llm.chat_with_fallbacks(["gpt-4", "gpt-3.5-turbo"], MESSAGES))
+    assert model == "gpt-3.5-turbo"
+
+
+def test_gateway_reports_circuit_open_when_every_provider_is_down():
+    provider = FakeProvider(latency=0, error_rate=1.0)
+    provider.breaker = CircuitBreaker(failure_threshold=1, cooldown=60)
+    llm = LLMGateway([provider])
+    with pytest.raises(UpstreamError):
+        asyncio.run(llm.chat("gpt-3.5-turbo", MESSAGES))
+    with pytest.raises(CircuitOpen):
+        asyncio.run(llm.chat("gpt-3.5-turbo", MESSAGES))
+
+
+@pytest.mark.parametrize("fault, gateway_options, status, code", [
+    ({"error_rate": 1.0}, {}, 502, "upstream_error"),
+    ({"rate_limit_rate": 1.0}, {}, 503, "upstream_rate_limited"),
+    ({"latency": 5.0}, {"deadline": 0.1}, 504, "upstream_timeout"),
+])
+def test_tool_endpoints_answer_with_distinct_error_codes(fault, gateway_options, status, code):
+    with TestClient(app) as client:
+        app.state.llm = LLMGateway([FakeProvider(**{"latency": 0, **fault})], **gateway_options)
+        response = client.post("/api/tools/analyze-time-usage", json={
+            "typical_work_hours": "9-5", "main_responsibilities": ["sales"],
+            "common_distractions": ["email"], "goals": "ship",
+        })
+    assert response.status_code == status
+    assert response.json()["code"] == code
+
+
+def test_payment_calls_are_classified_and_retried_when_idempotent():
+    payments = PaymentService(retries=2)
+    for policy in payments.upstreams.values():
+        policy.backoff_base = 0
+    calls = []
+
+    def flaky_stripe():
+        calls.append(1)
+        if len(calls) < 3:
+            raise stripe.APIConnectionError("connection reset")
+        return {"id": "pi_test"}
+
+    def slow_razorpay():
+        raise requests.Timeout()
+
+    try:
+        assert asyncio.run(payments.run("stripe", flaky_stripe, idempotent=True)) == {"id": "pi_test"}
+        assert len(calls) == 3
+        with pytest.raises(UpstreamTimeout):
+            asyncio.run(payments.run("razorpay", slow_razorpay))
+    finally:
+        payments.close()
+
+
+class LostResponseOrders:
+    """razorpay.Client.order whose first create lands upstream but times out on the way back"""
+
+    def __init__(self):
+        self.orders = []
+
+    def create(self, data: dict) -> dict:
+        order = {"id": f"order_{len(self.orders)}", "receipt": data["receipt"], "amount": data["amount"]}
+        self.orders.append(order)
+        if len(self.orders) == 1:
+            raise requests.Timeout()
+        return order
+
+    def all(self, params: dict) -> dict:
+        return {"items": [order for order in self.orders if order["receipt"] == params["receipt"]]}
+
+
+def test_timed_out_razorpay_order_is_found_not_created_twice():
+    payments = PaymentService(retries=2)
+    payments.upstreams["razorpay"].backoff_base = 0
+    payments.razorpay.order = LostResponseOrders()
+    try:
+        order = asyncio.run(payments.create_razorpay_order({"amount": 49900, "currency": "INR"}))
+    finally:
+        payments.close()
+    assert order["id"] == "order_0"
+    assert len(payments.razorpay.order.orders) == 1
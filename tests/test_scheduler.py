@@ -0,0 +1,91 @@
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+
+from fastapi.testclient import TestClient
+
+from app.ai_tools.task_manager import Task
+from app.core.identity import sign_user_token
+from app.engines.scheduler import QUADRANTS, WorkWeek, _minutes, rank_tasks, schedule_tasks
+from app.main import app
+from tests.helpers import bench, create_user, report
+
+TODAY = date(2026, 1, 5)  # a Monday
+TASK_COUNT = 10_000
+DAYS = 366
+
+
+def make_tasks(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    priorities = ["low", "medium", "high", "urgent", "critical", None]
+    return [
+        Task(
+            title=f"task {n}",
+            priority=rng.choice(priorities),
+            estimated_hours=rng.choice([None, 0.1, 0.5, 1, 1.5, 2, 3, 6]),
+            deadline=rng.choice([None, (TODAY + timedelta(days=rng.randint(-5, 400))).isoformat()]),
+        )
+        for n in range(count)
+    ]
+
+
+def test_ranking_orders_by_quadrant_then_score():
+    ranked = rank_tasks(make_tasks(TASK_COUNT), today=TODAY)
+    assert [item.rank for item in ranked] == list(range(1, TASK_COUNT + 1))
+    assert sorted(item.index for item in ranked) == list(range(TASK_COUNT))
+    keys = [(QUADRANTS.index(item.quadrant), -item.score) for item in ranked]
+    assert keys == sorted(keys)
+
+
+def test_schedule_is_valid_for_10k_tasks():
+    week = WorkWeek()
+    ranked = rank_tasks(make_tasks(TASK_COUNT), today=TODAY)
+    schedule = schedule_tasks(ranked, TODAY, DAYS, week)
+    windows = week.free_intervals()
+
+    by_day = defaultdict(list)
+    minutes = defaultdict(int)
+    for block in schedule.blocks:
+        start, end = _minutes(block.start), _minutes(block.end)
+        assert 0 < end - start <= week.focus_minutes
+        assert any(begin <= start and end <= finish for begin, finish in windows)
+        assert date.fromisoformat(block.date).weekday() < 5
+        by_day[block.date].append((start, end))
+        minutes[block.task] += end - start
+    for blocks in by_day.values():
+        assert all(a[1] <= b[0] for a, b in zip(blocks, blocks[1:]))  # chronological, no overlap
+
+    # Every task not reported as unscheduled gets its full estimate
+    unscheduled = set(schedule.unscheduled)
+    for item in ranked:
+        if item.index not in unscheduled:
+            assert minutes[item.index] == round(item.hours * 60)
+    assert unscheduled
+    assert schedule.scheduled_hours <= schedule.capacity_hours
+    assert schedule.scheduled_hours == round(sum(minutes.values()) / 60, 2)
+
+
+def test_scheduler_benchmark():
+    tasks = make_tasks(TASK_COUNT)
+    ranked = rank_tasks(tasks, today=TODAY)
+    rank = bench(lambda: rank_tasks(tasks, today=TODAY), 5)
+    pack = bench(lambda: schedule_tasks(ranked, TODAY, DAYS), 5)
+    report(f"rank_tasks ({TASK_COUNT} tasks)", rank)
+    report(f"schedule_tasks ({TASK_COUNT} tasks, {DAYS} days)", pack)
+    # Both are O(n log n) or better; a quadratic regression takes seconds here
+    assert rank < 1.0 and pack < 1.0
+
+
+def test_generate_schedule_endpoint_with_10k_tasks():
+    payload = {
+        "tasks": [task.model_dump(exclude_none=True) for task in make_tasks(TASK_COUNT)],
+        "start_date": TODAY.isoformat(),
+        "days": DAYS,
+    }
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        response = client.post("/api/tools/generate-schedule", json=payload, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["task_count"] == TASK_COUNT
+    assert 0 < body["schedule"]["utilisation"] <= 1
@@ -0,0 +1,74 @@
+from app.core.semantic_cache import Probe, SemanticCache, identifiers
+from tests.helpers import bench, report
+
+ORDER = ("Hi, I placed order #{order} on {day} and it still has not shipped. "
+         "The tracking page shows no updates and I need it for an event next week. "
+         "Can you check what is going on and tell me when it will arrive? Thanks")
+
+
+def test_identifiers_pick_out_orders_emails_and_days():
+    assert identifiers("Order 12345 for jo@example.com, placed Monday") == "12345 jo@example.com monday"
+    assert identifiers("Where is my parcel?") == ""
+
+
+def test_near_duplicates_naming_another_order_miss():
+    cache = SemanticCache()
+    first = ORDER.format(order=12345, day="Monday")
+    similar = cache.embedder.embed(first) @ cache.embedder.embed(ORDER.format(order=98765, day="Monday"))
+    assert similar >= cache.threshold  # the embedding alone cannot tell them apart
+
+    _, probe = cache.lookup("support:1:default", first)
+    cache.store("support:1:default", probe, "Order 12345 ships tomorrow.")
+    assert cache.lookup("support:1:default", ORDER.format(order=98765, day="Monday"))[0] is None
+    assert cache.lookup("support:1:default", ORDER.format(order=12345, day="Sunday"))[0] is None
+    assert cache.lookup("support:1:default", first.replace("Thanks", "Thank you"))[0] == "Order 12345 ships tomorrow."
+
+
+def test_saved_indexes_keep_their_identifiers(tmp_path):
+    cache = SemanticCache(path=str(tmp_path))
+    _, probe = cache.lookup("bot:1", ORDER.format(order=1, day="Monday"))
+    cache.store("bot:1", probe, "reply")
+    cache.save()
+
+    loaded = SemanticCache(path=str(tmp_path))
+    loaded.load()
+    assert loaded.lookup("bot:1", ORDER.format(order=1, day="Monday"))[0] == "reply"
+    assert loaded.lookup("bot:1", ORDER.format(order=2, day="Monday"))[0] is None
+
+
+def test_lookup_benchmark():
+    """Worst case: every stored message clears the threshold and only one has the same order"""
+    cache = SemanticCache()
+    vector = cache.embedder.embed(ORDER.format(order=0, day="Monday"))
+    for n in range(cache.max_entries):
+        cache.store("bot:1", Probe(vector, f"{n} monday"), f"reply {n}")
+    report(f"semantic lookup ({cache.max_entries} entries)", bench(lambda: cache.lookup("bot:1", ORDER.format(order=7, day="Monday")), 200))
+
+
+def test_namespaces_are_capped_least_recently_used_first(tmp_path):
+    cache = SemanticCache(max_namespaces=3, path=str(tmp_path))
+    for n in range(3):
+        _, probe = cache.lookup(f"bot:{n}", "hello")
+        cache.store(f"bot:{n}", probe, f"hi {n}")
+    cache.lookup("bot:0", "hello")  # bot:1 is now the least recently used
+    _, probe = cache.lookup("bot:3", "hello")
+    cache.store("bot:3", probe, "hi 3")
+
+    assert cache.stats()["namespaces"] == 3
+    assert cache.lookup("bot:1", "hello")[0] is None
+    assert cache.lookup("bot:0", "hello")[0] == "hi 0"
+    assert (tmp_path / "bot_1.json").exists()  # evicted entries are saved, not lost
+
+
+def test_workers_sharing_a_directory_keep_each_others_entries(tmp_path):
+    first, second = SemanticCache(path=str(tmp_path)), SemanticCache(path=str(tmp_path))
+    for cache, message in ((first, "where is my parcel"), (second, "how do I reset my password")):
+        _, probe = cache.lookup("bot:1", message)
+        cache.store("bot:1", probe, message.upper())
+    first.save()
+    second.save()
+
+    loaded = SemanticCache(path=str(tmp_path))
+    loaded.load()
+    assert loaded.lookup("bot:1", "where is my parcel")[0] == "WHERE IS MY PARCEL"
+    assert loaded.lookup("bot:1", "how do I reset my password")[0] == "HOW DO I RESET MY PASSWORD"
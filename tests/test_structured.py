@@ -0,0 +1,129 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.ai_tools.business_plan import PlanSection
+from app.ai_tools.pitch_deck import PitchDeckContent, Slide
+from app.core.identity import sign_user_token
+from app.core.llm import LLMGateway
+from app.core.providers import FakeProvider
+from app.core.structured import InvalidOutput, JsonItemStream, StructuredStream, parse_structured
+from app.main import app
+from tests.helpers import create_user
+
+SLIDES = [
+    {"number": 1, "title": "Problem", "headline": "Books {close} \"late\"", "bullets": ["a]b", "c}d"]},
+    {"number": 2, "title": "Solution", "headline": "Automate it", "bullets": ["one", "two"], "data_points": ["40% faster"]},
+    {"number": 3, "title": "Ask", "headline": "₹2 crore seed", "bullets": [], "takeaway": "Join us"},
+]
+DECK = json.dumps({"slides": SLIDES})
+
+PITCH = {
+    "business_name": "Acme",
+    "tagline": "Books that close themselves",
+    "problem": "Month-end close takes weeks",
+    "solution": "Automated reconciliation",
+    "target_market": "SMEs",
+    "business_model": "SaaS",
+    "competition": "Spreadsheets",
+    "traction": "20 pilots",
+    "team": "Two founders",
+    "funding_ask": "₹2 crore",
+}
+PLAN = {
+    "business_name": "Acme",
+    "industry": "Fintech",
+    "description": "Automated bookkeeping",
+    "target_market": "SMEs",
+    "revenue_model": "Subscription",
+}
+
+
+def sse_events(text: str):
+    """(event, data) for each frame of a Server-Sent Events body"""
+    events = []
+    for frame in text.split("\n\n"):
+        lines = frame.split("\n")
+        if lines[0].startswith("event: "):
+            data = "\n".join(line[len("data: "):] for line in lines[1:])
+            events.append((lines[0][len("event: "):], json.loads(data)))
+    return events
+
+
+def test_items_are_emitted_as_soon_as_they_close():
+    parser = JsonItemStream()
+    emitted = []  # (position of the char that completed an item, item)
+    for position, char in enumerate(DECK):
+        emitted.extend((position, item) for item in parser.feed(char))
+    assert [item for _, item in emitted] == SLIDES
+    # Each slide is returned by the delta holding its own closing brace
+    assert all(DECK[:position + 1].endswith(json.dumps(item)) for position, item in emitted)
+    assert parser.done
+
+
+def test_stream_ignores_text_outside_the_array():
+    parser = StructuredStream(Slide)
+    text = 'Here you go:\n```json\n{"deck": "x", "slides": [' + ", ".join(map(json.dumps, SLIDES)) + "], \"extra\": [{\"number\": 9}]}\n```"
+    slides = [slide for start in range(0, len(text), 7) for slide in parser.feed(text[start:start + 7])]
+    assert [slide.number for slide in slides] == [1, 2, 3]
+    assert slides[0].headline == 'Books {close} "late"'
+
+
+def test_invalid_items_raise_invalid_output():
+    with pytest.raises(InvalidOutput):
+        StructuredStream(Slide).feed('{"slides": [{"number": "one"}]}')
+    with pytest.raises(InvalidOutput):
+        parse_structured("I cannot help with that.", PitchDeckContent)
+    with pytest.raises(InvalidOutput):
+        parse_structured('{"slides": [{"title": "no number"}]}', PitchDeckContent)
+    deck = parse_structured(f"```json\n{DECK}\n```", PitchDeckContent)
+    assert deck.slides[2].takeaway == "Join us"  # prose or a code fence around the object is ignored
+
+
+def test_structured_pitch_deck():
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        app.state.llm = LLMGateway([FakeProvider(latency=0, reply=DECK)])
+        whole = client.post("/api/tools/generate-pitch-deck?structured=true", json=PITCH, headers=headers)
+        streamed = client.post("/api/tools/generate-pitch-deck?structured=true&stream=true", json=PITCH, headers=headers)
+        app.state.llm = LLMGateway([FakeProvider(latency=0, reply="Sorry, here is some prose instead.")])
+        invalid = client.post("/api/tools/generate-pitch-deck?structured=true", json=PITCH, headers=headers)
+
+    assert whole.status_code == 200
+    assert whole.json()["slide_count"] == 3
+    assert [slide["title"] for slide in whole.json()["slides"]] == ["Problem", "Solution", "Ask"]
+
+    events = sse_events(streamed.text)
+    assert [event for event, _ in events] == ["slide", "slide", "slide", "done"]
+    assert [data["number"] for _, data in events[:3]] == [1, 2, 3]
+    assert events[-1][1]["slide_count"] == 3
+
+    assert invalid.status_code == 502
+    assert invalid.json()["code"] == "invalid_output"
+
+
+def test_structured_plan_is_only_cached_when_valid():
+    sections = [{"number": n, "title": f"Section {n}", "content": "Text"} for n in range(1, 9)]
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        app.state.llm = LLMGateway([FakeProvider(latency=0, reply='{"sections": [{"number": 1}]}')])
+        invalid = client.post("/api/tools/generate-business-plan?structured=true", json=PLAN, headers=headers)
+        app.state.llm = LLMGateway([FakeProvider(latency=0, reply=json.dumps({"sections": sections}))])
+        first = client.post("/api/tools/generate-business-plan?structured=true", json=PLAN, headers=headers)
+        second = client.post("/api/tools/generate-business-plan?structured=true", json=PLAN, headers=headers)
+        app.state.llm = LLMGateway([FakeProvider(latency=0, reply=json.dumps({**sections[0], "content": "Rewritten"}))])
+        regenerated = client.post(
+            "/api/tools/regenerate-business-plan-section",
+            json={"plan": PLAN, "sections": sections, "number": 7},
+            headers=headers,
+        )
+
+    assert invalid.status_code == 502
+    assert first.status_code == 200 and first.json()["cache"] == "miss"
+    assert second.json()["cache"] == "hit"
+    assert [PlanSection(**section).number for section in second.json()["sections"]] == list(range(1, 9))
+    # The model answered with section 1; the rewrite keeps the slot it was asked for
+    assert regenerated.status_code == 200
+    assert regenerated.json()["section"]["number"] == 7
+    assert regenerated.json()["section"]["content"] == "Rewritten"
@@ -0,0 +1,86 @@
+import json
+import os
+from collections import Counter
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.ai_tools.customer_support import CLASSIFIER_THRESHOLD
+from app.core.identity import sign_user_token
+from app.core.llm import LLMGateway
+from app.core.providers import FakeProvider
+from app.engines.ticket_classifier import classify_ticket
+from app.main import app
+from tests.helpers import bench, create_user, report
+
+LABELS = ("sentiment", "category", "urgency")
+
+with open(os.path.join(os.path.dirname(__file__), "fixtures", "support_tickets.jsonl")) as f:
+    TICKETS = [json.loads(line) for line in f]
+
+
+def classify(ticket: dict):
+    return classify_ticket(ticket["subject"], ticket["message"], ticket["priority"])
+
+
+def accuracy(tickets, label: str) -> float:
+    return sum(getattr(classify(t), label) == t[label] for t in tickets) / len(tickets)
+
+
+def substring_sentiment(ticket: dict) -> str:
+    """The old approach: search the text for the label words themselves"""
+    text = f"{ticket['subject']} {ticket['message']}".lower()
+    for label in ("angry", "negative", "positive"):
+        if label in text:
+            return label
+    return "neutral"
+
+
+@pytest.mark.parametrize("label", LABELS)
+def test_accuracy_on_labelled_fixture(label):
+    majority = Counter(t[label] for t in TICKETS).most_common(1)[0][1] / len(TICKETS)
+    score = accuracy(TICKETS, label)
+    print(f"{label}: {score:.0%} (majority class {majority:.0%})")
+    assert score >= 0.75
+    assert score > majority + 0.3
+
+
+def test_sentiment_beats_substring_search():
+    substring = sum(substring_sentiment(t) == t["sentiment"] for t in TICKETS) / len(TICKETS)
+    lexicon = accuracy(TICKETS, "sentiment")
+    print(f"sentiment: lexicon {lexicon:.0%}, substring search {substring:.0%}")
+    assert lexicon > substring
+
+
+def test_confident_tickets_are_at_least_as_accurate():
+    """Hybrid mode keeps confident labels and sends the rest to the LLM"""
+    confident = [t for t in TICKETS if classify(t).confidence >= CLASSIFIER_THRESHOLD]
+    overall = sum(accuracy(TICKETS, label) for label in LABELS) / len(LABELS)
+    kept = sum(accuracy(confident, label) for label in LABELS) / len(LABELS)
+    print(f"hybrid keeps {len(confident)}/{len(TICKETS)} tickets at {kept:.0%} vs {overall:.0%} overall")
+    assert confident
+    assert kept >= overall
+
+
+def test_classifier_benchmark():
+    ticket = TICKETS[0]
+    seconds = bench(lambda: classify(ticket), 5000)
+    report("classify_ticket", seconds)
+    assert seconds < 5e-4
+
+
+def test_bulk_lines_keep_their_own_index_and_subject():
+    """Model output cannot overwrite the fields that tie a line to its input ticket"""
+    reply = json.dumps({"results": [
+        {"ticket": n, "index": 99, "subject": "spoofed", "category": "billing", "urgency": "low"} for n in (1, 2)
+    ]})
+    tickets = [{"customer_name": "Sam", "customer_email": "sam@example.com", "subject": f"ticket {n}",
+                "message": "Where is my refund?"} for n in range(2)]
+    with TestClient(app) as client:
+        headers = {"X-User-Token": sign_user_token(create_user(client, "enterprise"))}
+        app.state.llm = LLMGateway([FakeProvider(latency=0, reply=reply)])
+        response = client.post("/api/tools/analyze-support-tickets/bulk", json=tickets, headers=headers)
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()][:-1]
+    assert sorted((line["index"], line["subject"]) for line in lines) == [(0, "ticket 0"), (1, "ticket 1")]
+    assert all(line["category"] == "billing" and line["mode_used"] == "llm" for line in lines)